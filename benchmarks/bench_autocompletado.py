@@ -0,0 +1,69 @@
+"""
+Benchmark: índice de autocompletado de libros/autocompletado.py
+(construcción, memoria, búsqueda por prefijo y actualización incremental)
+
+Uso:
+    python -m benchmarks.bench_autocompletado --libros 100000 1000000
+"""
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.comun import (
+    base_de_datos_temporal, crear_libros, cronometrar, preparar_django, titulo_aleatorio,
+)
+
+preparar_django()
+
+from libros import autocompletado  # noqa: E402
+from libros.models import Libro, Autor, Categoria, Editorial  # noqa: E402
+
+PREFIJOS = ('s', 'som', 'sombra ', 'bacadu', 'ángel inv', 'apellido12', 'zzz')
+BUSQUEDAS_POR_PREFIJO = 10000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--libros', type=int, nargs='+', default=[100000, 1000000])
+    args = parser.parse_args()
+
+    with base_de_datos_temporal():
+        for num_libros in args.libros:
+            for modelo in (Libro, Autor, Editorial, Categoria):
+                modelo.objects.all().delete()
+            crear_libros(num_libros, titulo=titulo_aleatorio)
+
+            indice = autocompletado.IndiceAutocompletado()
+            inicio = time.perf_counter()
+            indice.construir()
+            construccion = time.perf_counter() - inicio
+
+            # tracemalloc ralentiza mucho: la memoria se mide en otra construcción
+            tracemalloc.start()
+            medido = autocompletado.IndiceAutocompletado()
+            medido.construir()
+            memoria = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del medido
+
+            print(f"\n{num_libros} libros, {len(indice)} entradas")
+            print(f"  construcción  {construccion:8.2f} s")
+            print(f"  memoria       {memoria / 2**20:8.1f} MiB ({memoria / len(indice):.0f} bytes por entrada)")
+
+            print(f"  {'prefijo':<14} {'µs por búsqueda':>16}")
+            for prefijo in PREFIJOS:
+                segundos = cronometrar(
+                    lambda: [indice.buscar(prefijo) for _ in range(BUSQUEDAS_POR_PREFIJO)]
+                )
+                print(f"  {prefijo!r:<14} {segundos * 1e6 / BUSQUEDAS_POR_PREFIJO:16.2f}")
+
+            segundos = cronometrar(lambda: [
+                (indice.agregar(autocompletado.TIPO_LIBRO, -i, f'Nuevo {i}'),
+                 indice.quitar(autocompletado.TIPO_LIBRO, -i, f'Nuevo {i}'))
+                for i in range(100)
+            ])
+            print(f"  alta + baja   {segundos * 1e6 / 100:8.0f} µs")
+
+
+if __name__ == '__main__':
+    main()
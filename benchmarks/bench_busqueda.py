@@ -0,0 +1,71 @@
+"""
+Benchmark: búsqueda de libros con LIKE '%q%' encadenados (la consulta
+original de la vista busqueda) frente al índice de libros/busqueda.py
+
+Uso:
+    python -m benchmarks.bench_busqueda --libros 100000 1000000
+"""
+import argparse
+
+from benchmarks.comun import (
+    base_de_datos_temporal, crear_libros, cronometrar, preparar_django, titulo_aleatorio,
+)
+
+preparar_django()
+
+from django.db.models import Q  # noqa: E402
+
+from libros import busqueda  # noqa: E402
+from libros.models import Libro, Autor, Categoria, Editorial  # noqa: E402
+
+CONSULTAS = (
+    'sombra',  # palabra muy frecuente (~8 % de los títulos)
+    'laberinto espejo',  # dos frecuentes a la vez
+    'ángel invier',  # con prefijo y acentos
+    'bacadu',  # palabra poco frecuente
+    'sombra bacadu',  # frecuente + poco frecuente
+    'apellido12',  # prefijo de autor
+    'zzz',  # sin resultados: el peor caso de LIKE
+)
+
+
+def busqueda_original(texto):
+    """Copia de la consulta que usaba la vista busqueda"""
+    return list(Libro.objects.filter(
+        Q(titulo__icontains=texto) |
+        Q(isbn__icontains=texto) |
+        Q(autor__nombre__icontains=texto) |
+        Q(autor__apellido__icontains=texto)
+    ).select_related('autor', 'categoria')[:50])
+
+
+def busqueda_indice(texto):
+    return busqueda.buscar_libros(
+        texto, limite=50, queryset=Libro.objects.select_related('autor', 'categoria')
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--libros', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args()
+
+    with base_de_datos_temporal():
+        for num_libros in args.libros:
+            for modelo in (Libro, Autor, Editorial, Categoria):
+                modelo.objects.all().delete()
+            crear_libros(num_libros, titulo=titulo_aleatorio)
+            busqueda.reconstruir_indice()
+
+            print(f"\n{num_libros} libros (ms por búsqueda, mejor de {args.repeticiones})")
+            print(f"  {'consulta':<20} {'LIKE':>10} {'índice':>10} {'resultados':>11}")
+            for texto in CONSULTAS:
+                original = cronometrar(lambda: busqueda_original(texto), args.repeticiones)
+                indice = cronometrar(lambda: busqueda_indice(texto), args.repeticiones)
+                resultados = len(busqueda_indice(texto))
+                print(f"  {texto:<20} {original * 1000:10.2f} {indice * 1000:10.2f} {resultados:11d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark: descargar el catálogo paginando /api/libros/ frente a la
+exportación en streaming (/api/exportar/libros/; libros/exportacion.py)
+
+Cada modo descarga todos los libros a través del cliente de pruebas de
+Django (toda la pila de middleware, sin red) y mide filas por segundo,
+bytes enviados, peticiones y, en la exportación, el pico de memoria de
+Python (tracemalloc) mientras se genera la respuesta. La exportación con
+gzip se mide con el nivel de exportacion.NIVEL_GZIP y con el 6 que usa
+nginx.
+
+Uso:
+    python -m benchmarks.bench_exportacion --libros 10000 100000
+"""
+import argparse
+import time
+import tracemalloc
+from unittest import mock
+
+from benchmarks.comun import base_de_datos_temporal, crear_libros, preparar_django
+
+preparar_django()
+
+from django.test import Client  # noqa: E402
+
+from libros import exportacion  # noqa: E402
+
+
+def paginando(cliente, por_pagina):
+    """Sigue los enlaces `next` de /api/libros/; devuelve (bytes, peticiones)"""
+    url, enviados, peticiones = f'/api/libros/?page_size={por_pagina}', 0, 0
+    while url:
+        respuesta = cliente.get(url)
+        assert respuesta.status_code == 200, respuesta.content[:500]
+        enviados += len(respuesta.content)
+        peticiones += 1
+        url = respuesta.json()['next']
+    return enviados, peticiones
+
+
+def exportando(cliente, formato, gzip=False):
+    """Consume la respuesta parte a parte, como un cliente; devuelve (bytes, peticiones)"""
+    cabeceras = {'HTTP_ACCEPT_ENCODING': 'gzip'} if gzip else {}
+    respuesta = cliente.get(f'/api/exportar/libros/?formato={formato}', **cabeceras)
+    assert respuesta.status_code == 200 and respuesta.streaming
+    enviados = sum(len(parte) for parte in respuesta.streaming_content)
+    respuesta.close()
+    return enviados, 1
+
+
+def medir(funcion, memoria=True):
+    """
+    (segundos, (bytes, peticiones), pico de memoria en bytes o None). El pico
+    se mide en una segunda ejecución: tracemalloc ralentiza mucho la primera.
+    """
+    inicio = time.perf_counter()
+    resultado = funcion()
+    transcurrido = time.perf_counter() - inicio
+    if not memoria:
+        return transcurrido, resultado, None
+    tracemalloc.start()
+    funcion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return transcurrido, resultado, pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--libros', type=int, nargs='+', default=[10_000, 100_000])
+    args = parser.parse_args()
+
+    def con_nivel(nivel, funcion):
+        def medida(cliente):
+            with mock.patch.object(exportacion, 'NIVEL_GZIP', nivel):
+                return funcion(cliente)
+        return medida
+
+    modos = {
+        'paginando (10)': lambda cliente: paginando(cliente, 10),
+        'paginando (100)': lambda cliente: paginando(cliente, 100),
+        'ndjson': lambda cliente: exportando(cliente, 'ndjson'),
+        f'ndjson gzip {exportacion.NIVEL_GZIP}': lambda cliente: exportando(cliente, 'ndjson', gzip=True),
+        'ndjson gzip 6': con_nivel(6, lambda cliente: exportando(cliente, 'ndjson', gzip=True)),
+        'csv': lambda cliente: exportando(cliente, 'csv'),
+        f'csv gzip {exportacion.NIVEL_GZIP}': lambda cliente: exportando(cliente, 'csv', gzip=True),
+    }
+    for libros in args.libros:
+        with base_de_datos_temporal():
+            crear_libros(libros)
+            cliente = Client()
+            print(f'\n{libros} libros', flush=True)
+            print(f"  {'modo':<18} {'segundos':>9} {'filas/s':>9} {'MB':>8} {'peticiones':>11} "
+                  f"{'memoria MB':>11} {'vs paginar':>11}")
+            referencia = None
+            for nombre, funcion in modos.items():
+                # La memoria de paginar no depende del total: solo se mide la exportación
+                segundos, (enviados, peticiones), pico = medir(
+                    lambda: funcion(cliente), memoria=not nombre.startswith('paginando')
+                )
+                referencia = referencia or segundos
+                memoria = '-' if pico is None else f'{pico / 1e6:.1f}'
+                print(f'  {nombre:<18} {segundos:>9.2f} {libros / segundos:>9,.0f} {enviados / 1e6:>8.1f} '
+                      f'{peticiones:>11,} {memoria:>11} {referencia / segundos:>10.1f}x', flush=True)
+
+
+if __name__ == '__main__':
+    main()
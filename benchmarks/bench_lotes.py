@@ -0,0 +1,116 @@
+"""
+Benchmark: altas de libros y préstamos con un POST por fila frente a los
+endpoints en lote (/api/libros/lote/, /api/prestamos/lote/; libros/lotes.py)
+
+Cada modo crea las mismas N filas a través del cliente de pruebas de Django
+(toda la pila de middleware, DRF y serializer, sin red) y mide filas por
+segundo y consultas SQL. Con MySQL cada consulta es además un viaje de ida y
+vuelta al servidor, así que la diferencia real es mayor que con SQLite.
+
+Uso:
+    python -m benchmarks.bench_lotes --filas 100 1000 5000
+"""
+import argparse
+import json
+import time
+from datetime import date, timedelta
+
+from benchmarks.comun import base_de_datos_temporal, crear_libros, preparar_django
+
+preparar_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+
+from libros.models import Autor, Categoria, Editorial, Libro  # noqa: E402
+
+
+def libros_nuevos(prefijo, filas, autores, categoria, editorial):
+    return [{
+        'titulo': f'Adquisición {prefijo} {i}', 'isbn': f'{prefijo}{i:010d}',
+        'autor': autores[i % len(autores)], 'categoria': categoria, 'editorial': editorial,
+        'fecha_publicacion': '2020-01-01', 'numero_paginas': 200, 'stock_total': 3, 'stock_disponible': 3,
+    } for i in range(filas)]
+
+
+def prestamos_nuevos(libros, usuarios):
+    devolucion = (date.today() + timedelta(days=14)).isoformat()
+    return [{'libro': libro, 'usuario': usuarios[i % len(usuarios)], 'fecha_devolucion_esperada': devolucion}
+            for i, libro in enumerate(libros)]
+
+
+def uno_a_uno(cliente, url, elementos):
+    for elemento in elementos:
+        respuesta = cliente.post(url, json.dumps(elemento), content_type='application/json')
+        assert respuesta.status_code == 201, respuesta.content
+
+
+def en_lote(cliente, url, elementos, ndjson=False):
+    if ndjson:
+        cuerpo, tipo = '\n'.join(json.dumps(e) for e in elementos), 'application/x-ndjson'
+    else:
+        cuerpo, tipo = json.dumps(elementos), 'application/json'
+    respuesta = cliente.post(f'{url}lote/', cuerpo, content_type=tipo)
+    assert respuesta.status_code == 201, respuesta.content[:500]
+
+
+def medir(funcion):
+    """(segundos, consultas) de una ejecución de `funcion`"""
+    consultas = 0
+
+    def contar(execute, sql, params, many, context):
+        nonlocal consultas
+        consultas += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(contar):
+        inicio = time.perf_counter()
+        funcion()
+        transcurrido = time.perf_counter() - inicio
+    return transcurrido, consultas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--filas', type=int, nargs='+', default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    modos = {
+        'POST por fila': uno_a_uno,
+        'lote json': en_lote,
+        'lote ndjson': lambda cliente, url, elementos: en_lote(cliente, url, elementos, ndjson=True),
+    }
+    with base_de_datos_temporal():
+        crear_libros(0)
+        autores = list(Autor.objects.values_list('id', flat=True))
+        categoria = Categoria.objects.values_list('id', flat=True).first()
+        editorial = Editorial.objects.values_list('id', flat=True).first()
+        User.objects.bulk_create(User(username=f'lector{i}') for i in range(100))
+        usuarios = list(User.objects.values_list('id', flat=True))
+        cliente = Client()
+
+        ronda = 0
+        for filas in args.filas:
+            print(f'\n{filas} filas')
+            print(f"  {'modo':<22} {'segundos':>9} {'filas/s':>9} {'consultas':>10} {'vs por fila':>12}")
+            prefijos = {}
+            for tipo, url in (('libros', '/api/libros/'), ('prestamos', '/api/prestamos/')):
+                referencia = None
+                for nombre, funcion in modos.items():
+                    if tipo == 'libros':
+                        ronda += 1
+                        prefijos[nombre] = f'{ronda:03d}'
+                        elementos = libros_nuevos(prefijos[nombre], filas, autores, categoria, editorial)
+                    else:
+                        # Un préstamo por cada libro que dio de alta el mismo modo
+                        libros = Libro.objects.filter(isbn__startswith=prefijos[nombre])
+                        elementos = prestamos_nuevos(list(libros.values_list('id', flat=True)), usuarios)
+                    segundos, consultas = medir(lambda: funcion(cliente, url, elementos))
+                    referencia = referencia or segundos
+                    print(f'  {f"{tipo}: {nombre}":<22} {segundos:>9.2f} {filas / segundos:>9,.0f} '
+                          f'{consultas:>10,} {referencia / segundos:>11.1f}x')
+
+
+if __name__ == '__main__':
+    main()
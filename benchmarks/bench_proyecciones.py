@@ -0,0 +1,80 @@
+"""
+Benchmark: construcción de LibroModel con el bucle original frente a la
+proyección compilada de libros/proyecciones.py
+
+Uso:
+    python -m benchmarks.bench_proyecciones --filas 10000 100000
+"""
+import argparse
+
+from benchmarks.comun import base_de_datos_temporal, crear_libros, cronometrar, preparar_django
+
+preparar_django()
+
+from libros.models import Libro, Autor, Categoria, Editorial  # noqa: E402
+from libros.soap_services import LibroModel, PROYECCION_LIBRO  # noqa: E402
+
+
+def bucle_original(libros):
+    """Copia del bucle que se repetía en cada operación de soap_services.py"""
+    resultado = []
+    for libro in libros:
+        resultado.append(LibroModel(
+            id=libro.id,
+            titulo=libro.titulo,
+            isbn=libro.isbn,
+            autor_nombre=f"{libro.autor.nombre} {libro.autor.apellido}",
+            editorial_nombre=libro.editorial.nombre if libro.editorial else 'Sin editorial',
+            categoria_nombre=libro.categoria.nombre if libro.categoria else 'Sin categoría',
+            fecha_publicacion=str(libro.fecha_publicacion),
+            numero_paginas=libro.numero_paginas,
+            idioma=libro.idioma,
+            descripcion=libro.descripcion or '',
+            estado=libro.estado,
+            stock_total=libro.stock_total,
+            stock_disponible=libro.stock_disponible,
+            ubicacion_fisica=libro.ubicacion_fisica or '',
+            fecha_registro=libro.fecha_registro,
+            ultima_actualizacion=libro.ultima_actualizacion
+        ))
+    return resultado
+
+
+def medir(num_filas, repeticiones):
+    """Devuelve los tiempos por fila (µs) de cada variante"""
+    consulta_original = Libro.objects.select_related('autor', 'editorial', 'categoria')
+    instancias = list(consulta_original)
+    filas = list(PROYECCION_LIBRO.filas(Libro.objects.all()))
+
+    tiempos = {
+        'original (consulta + mapeo)': cronometrar(
+            lambda: bucle_original(consulta_original.all()), repeticiones),
+        'proyección (consulta + mapeo)': cronometrar(
+            lambda: list(PROYECCION_LIBRO.modelos(Libro.objects.all())), repeticiones),
+        'original (solo mapeo)': cronometrar(
+            lambda: bucle_original(instancias), repeticiones),
+        'proyección (solo mapeo)': cronometrar(
+            lambda: list(map(PROYECCION_LIBRO.mapear, filas)), repeticiones),
+    }
+    return {nombre: segundos * 1e6 / num_filas for nombre, segundos in tiempos.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--filas', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args()
+
+    with base_de_datos_temporal():
+        for num_filas in args.filas:
+            for modelo in (Libro, Autor, Editorial, Categoria):
+                modelo.objects.all().delete()
+            crear_libros(num_filas)
+
+            print(f"\n{num_filas} filas (µs por fila, mejor de {args.repeticiones})")
+            for nombre, microsegundos in medir(num_filas, args.repeticiones).items():
+                print(f"  {nombre:<32} {microsegundos:8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark: JSON de DRF frente a orjson y MessagePack (libros/renderizadores.py)
+al renderizar y leer listados grandes de LibroSerializer
+
+Por tamaño de listado mide los bytes generados y el tiempo de CPU (el mejor
+de varias repeticiones) de render() y del parser correspondiente. La
+serialización con LibroSerializer se hace una sola vez: solo se compara el
+paso de datos serializados a bytes y de vuelta.
+
+Uso:
+    python -m benchmarks.bench_renderizadores --filas 1000 10000 100000
+"""
+import argparse
+import io
+import time
+
+from benchmarks.comun import base_de_datos_temporal, crear_libros, preparar_django
+
+preparar_django()
+
+from rest_framework.parsers import JSONParser  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from libros import renderizadores  # noqa: E402
+from libros.models import Libro  # noqa: E402
+from libros.serializers import LibroSerializer  # noqa: E402
+
+
+def formatos():
+    """Nombre -> (renderizador, parser) de los formatos disponibles"""
+    disponibles = {'json drf': (JSONRenderer(), JSONParser())}
+    if renderizadores.orjson:
+        disponibles['json orjson'] = (renderizadores.ORJSONRenderer(), renderizadores.ORJSONParser())
+    if renderizadores.msgpack:
+        disponibles['msgpack'] = (renderizadores.MessagePackRenderer(),
+                                  renderizadores.MessagePackParser())
+    return disponibles
+
+
+def cpu(funcion, repeticiones):
+    """Mejor tiempo de CPU (s) de `funcion` y su último resultado"""
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.process_time()
+        resultado = funcion()
+        transcurrido = time.process_time() - inicio
+        mejor = transcurrido if mejor is None else min(mejor, transcurrido)
+    return mejor, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--filas', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    disponibles = formatos()
+    for libreria, formato in (('orjson', 'json orjson'), ('msgpack', 'msgpack')):
+        if formato not in disponibles:
+            print(f'{libreria} no está instalado: se omite {formato}')
+
+    with base_de_datos_temporal():
+        crear_libros(max(args.filas))
+        for filas in args.filas:
+            libros = Libro.objects.select_related('autor', 'categoria', 'editorial').order_by('id')[:filas]
+            datos = LibroSerializer(libros, many=True).data
+
+            print(f'\n{filas} libros')
+            print(f"  {'formato':<12} {'bytes':>12} {'render ms':>10} {'parse ms':>10} {'vs drf':>7}")
+            referencia = None
+            for nombre, (renderizador, lector) in disponibles.items():
+                segundos_render, cuerpo = cpu(lambda: renderizador.render(datos), args.repeticiones)
+                segundos_parse, _ = cpu(lambda: lector.parse(io.BytesIO(cuerpo)), args.repeticiones)
+                total = segundos_render + segundos_parse
+                referencia = referencia or total
+                print(f'  {nombre:<12} {len(cuerpo):>12,} {segundos_render * 1000:>10.1f} '
+                      f'{segundos_parse * 1000:>10.1f} {referencia / total:>6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""
+Benchmark: latencia, consultas y memoria por petición de las rutas más usadas
+de REST, SOAP y HTML
+
+Crea una base de datos de prueba desechable (SQLite o MySQL, según
+DJANGO_SETTINGS_MODULE), la llena con libros/generador.py al tamaño pedido y
+lanza cada petición con el cliente de pruebas de Django, sin red ni
+servidor. Por ruta mide:
+
+- latencia: media y percentiles 50/90/99 en ms,
+- consultas SQL por petición (todas las bases de datos configuradas),
+- memoria: pico de memoria Python asignada durante una petición (tracemalloc,
+  en una pasada aparte para no distorsionar la latencia).
+
+Los resultados se guardan en JSON con el commit, el motor y el tamaño de los
+datos; --comparar muestra la diferencia con una ejecución anterior.
+
+Uso:
+    python -m benchmarks.bench_rutas --tamano mediano --salida resultados.json
+    python -m benchmarks.bench_rutas --comparar anterior.json --salida nuevo.json
+"""
+import argparse
+import json
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import datetime, timezone
+
+from benchmarks.comun import TAMANOS, base_de_datos_temporal, percentil, preparar_django
+
+preparar_django()
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connections  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+
+from libros import generador  # noqa: E402
+from libros.models import Libro  # noqa: E402
+
+CABECERAS_SOAP = {'content_type': 'text/xml; charset=utf-8'}
+
+
+def sobre_soap(operacion, **argumentos):
+    """Petición SOAP 1.1 de `operacion` con sus argumentos"""
+    cuerpo = ''.join(f'<tns:{nombre}>{valor}</tns:{nombre}>' for nombre, valor in argumentos.items())
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" '
+        'xmlns:tns="biblioteca.soap.services">'
+        f'<soapenv:Body><tns:{operacion}>{cuerpo}</tns:{operacion}></soapenv:Body>'
+        '</soapenv:Envelope>'
+    )
+
+
+def definir_rutas(generador_aleatorio):
+    """
+    Rutas medidas: nombre -> función que hace una petición con el cliente y
+    devuelve la respuesta. Los ids se eligen al azar en cada petición. Si la
+    función tiene `preparar`, medir_ruta lo llama antes de cada petición,
+    fuera de la medición.
+    """
+    ids_libros = list(Libro.objects.values_list('id', flat=True))
+    stock_inicial = dict(Libro.objects.filter(estado='disponible', stock_disponible__gt=0)
+                         .values_list('id', 'stock_disponible'))
+    disponibles = []  # un id por ejemplar aún sin prestar
+    ids_usuarios = list(User.objects.values_list('id', flat=True))
+    palabras = generador.PALABRAS_TITULO
+
+    def libro():
+        return generador_aleatorio.choice(ids_libros)
+
+    def soap(cliente, operacion, **argumentos):
+        return cliente.post('/soap/', sobre_soap(operacion, **argumentos), **CABECERAS_SOAP)
+
+    def crear_prestamo(cliente):
+        return soap(cliente, 'crear_prestamo', libro_id=disponibles.pop(),
+                    usuario_id=generador_aleatorio.choice(ids_usuarios), dias_prestamo=14)
+
+    def reponer_stock():
+        # Cada préstamo gasta un ejemplar: agotados todos, se restaura el
+        # stock inicial (un libro sin stock daría un fallo, no un préstamo)
+        if disponibles:
+            return
+        por_stock = {}
+        for libro_id, stock in stock_inicial.items():
+            por_stock.setdefault(stock, []).append(libro_id)
+        for stock, libro_ids in por_stock.items():
+            Libro.objects.filter(id__in=libro_ids).update(stock_disponible=stock, estado='disponible')
+        disponibles.extend(libro_id for libro_id, stock in stock_inicial.items() for _ in range(stock))
+        generador_aleatorio.shuffle(disponibles)
+
+    crear_prestamo.preparar = reponer_stock
+
+    return {
+        'rest /api/libros/': lambda cliente: cliente.get('/api/libros/'),
+        'rest /api/prestamos/': lambda cliente: cliente.get('/api/prestamos/'),
+        'html catalogo': lambda cliente: cliente.get(
+            '/api/catalogo/', {'page': generador_aleatorio.randint(1, 20)}
+        ),
+        'html busqueda': lambda cliente: cliente.get(
+            '/api/busqueda/', {'q': ' '.join(generador_aleatorio.sample(palabras, 2))}
+        ),
+        'html estadisticas': lambda cliente: cliente.get('/api/estadisticas/'),
+        'soap listar_libros_paginado': lambda cliente: soap(cliente, 'listar_libros_paginado',
+                                                            cursor='', limite=50),
+        'soap obtener_libro': lambda cliente: soap(cliente, 'obtener_libro', libro_id=libro()),
+        'soap crear_prestamo': crear_prestamo,
+    }
+
+
+def medir_ruta(cliente, peticion, peticiones, calentamiento, max_segundos):
+    """Latencias, consultas y pico de memoria de una ruta"""
+    preparar = getattr(peticion, 'preparar', lambda: None)
+    for _ in range(calentamiento):
+        preparar()
+        peticion(cliente)
+
+    latencias, consultas = [], []
+    fin = time.monotonic() + max_segundos
+    for _ in range(peticiones):
+        preparar()
+        with ExitStack() as pila:
+            capturas = [pila.enter_context(CaptureQueriesContext(connections[alias]))
+                        for alias in settings.DATABASES]
+            inicio = time.perf_counter()
+            respuesta = peticion(cliente)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        if respuesta.status_code != 200:
+            raise RuntimeError(f'Respuesta {respuesta.status_code}: {respuesta.content[:300]!r}')
+        consultas.append(sum(len(captura) for captura in capturas))
+        if time.monotonic() > fin:
+            break
+
+    preparar()
+    tracemalloc.start()
+    try:
+        peticion(cliente)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    latencias.sort()
+    return {
+        'peticiones': len(latencias),
+        'media_ms': round(statistics.fmean(latencias), 3),
+        'p50_ms': round(percentil(latencias, 50), 3),
+        'p90_ms': round(percentil(latencias, 90), 3),
+        'p99_ms': round(percentil(latencias, 99), 3),
+        'consultas': round(statistics.fmean(consultas), 2),
+        'consultas_max': max(consultas),
+        'memoria_pico_kib': round(pico / 1024, 1),
+    }
+
+
+def commit_actual():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+        cambios = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                 capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f'{commit}-modificado' if cambios else commit
+
+
+def comparar(anterior, actual):
+    print(f"\nFrente a {anterior['commit']} ({anterior['fecha']})")
+    print(f"  {'ruta':<24} {'p50 ms':>17} {'p99 ms':>17} {'consultas':>13}")
+    for nombre, nuevo in actual['rutas'].items():
+        viejo = anterior['rutas'].get(nombre)
+        if viejo is None:
+            continue
+        columnas = []
+        for campo in ('p50_ms', 'p99_ms'):
+            cambio = (nuevo[campo] - viejo[campo]) / viejo[campo] * 100 if viejo[campo] else 0
+            columnas.append(f"{viejo[campo]:7.2f}→{nuevo[campo]:7.2f} {cambio:+5.0f}%")
+        print(f"  {nombre:<24} {columnas[0]:>17} {columnas[1]:>17} "
+              f"{viejo['consultas']:5.1f}→{nuevo['consultas']:5.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tamano', choices=TAMANOS, default='pequeno')
+    parser.add_argument('--libros', type=int, help='sustituye al del tamaño elegido')
+    parser.add_argument('--prestamos', type=int, help='sustituye al del tamaño elegido')
+    parser.add_argument('--peticiones', type=int, default=50, help='peticiones medidas por ruta')
+    parser.add_argument('--calentamiento', type=int, default=3)
+    parser.add_argument('--max-segundos', type=float, default=30,
+                        help='tiempo máximo de medición por ruta')
+    parser.add_argument('--rutas', nargs='+', help='solo las rutas que contengan alguno de estos textos')
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--salida', help='fichero JSON con los resultados')
+    parser.add_argument('--comparar', help='JSON de una ejecución anterior')
+    args = parser.parse_args()
+
+    datos = dict(TAMANOS[args.tamano])
+    for campo in ('libros', 'prestamos'):
+        if getattr(args, campo) is not None:
+            datos[campo] = getattr(args, campo)
+
+    with base_de_datos_temporal():
+        inicio = time.perf_counter()
+        generador.generar(semilla=args.semilla, informar=lambda mensaje: None, **datos)
+        print(f"Datos '{args.tamano}' generados en {time.perf_counter() - inicio:.1f} s: "
+              + ', '.join(f'{total} {nombre}' for nombre, total in datos.items()))
+
+        rutas = definir_rutas(random.Random(args.semilla))
+        if args.rutas:
+            rutas = {nombre: peticion for nombre, peticion in rutas.items()
+                     if any(texto in nombre for texto in args.rutas)}
+        cliente = Client()
+
+        resultados = {}
+        print(f"  {'ruta':<24} {'pet':>5} {'media':>8} {'p50':>8} {'p90':>8} {'p99':>8} "
+              f"{'consultas':>9} {'memoria':>10}")
+        for nombre, peticion in rutas.items():
+            r = medir_ruta(cliente, peticion, args.peticiones, args.calentamiento, args.max_segundos)
+            resultados[nombre] = r
+            print(f"  {nombre:<24} {r['peticiones']:5d} {r['media_ms']:8.2f} {r['p50_ms']:8.2f} "
+                  f"{r['p90_ms']:8.2f} {r['p99_ms']:8.2f} {r['consultas']:9.1f} "
+                  f"{r['memoria_pico_kib']:7.0f} KiB")
+        motor = connections['default'].vendor
+
+    actual = {
+        'commit': commit_actual(),
+        'fecha': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'motor': motor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'tamano': args.tamano,
+        'datos': datos,
+        'peticiones': args.peticiones,
+        # ru_maxrss está en KiB en Linux
+        'memoria_max_proceso_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'rutas': resultados,
+    }
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as fichero:
+            json.dump(actual, fichero, indent=2, ensure_ascii=False)
+        print(f"\nResultados guardados en {args.salida}")
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as fichero:
+            comparar(json.load(fichero), actual)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Benchmark: peticiones por segundo con manage.py runserver frente a Gunicorn
+(gunicorn.conf.py) en /api/libros/ y /soap/
+
+Arranca cada servidor en un puerto local con la configuración de
+DJANGO_SETTINGS_MODULE, lo somete a carga con varios clientes concurrentes
+y lo detiene. Solo hace lecturas, pero usa la base de datos configurada:
+conviene ejecutarlo contra una base de datos de pruebas con datos
+(p. ej. cargada con populate_db.py).
+
+Uso:
+    python -m benchmarks.bench_servidor --concurrencia 16 --duracion 10
+"""
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+SOBRE_SOAP = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    '<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" '
+    'xmlns:tns="biblioteca.soap.services">'
+    '<soapenv:Body><tns:listar_libros_paginado>'
+    '<tns:cursor></tns:cursor><tns:limite>10</tns:limite>'
+    '</tns:listar_libros_paginado></soapenv:Body></soapenv:Envelope>'
+).encode('utf-8')
+
+PETICIONES = {
+    '/api/libros/': ('GET', '/api/libros/', None, {}),
+    '/soap/': ('POST', '/soap/', SOBRE_SOAP, {'Content-Type': 'text/xml; charset=utf-8'}),
+}
+
+
+def comando_servidor(servidor, puerto):
+    if servidor == 'runserver':
+        return [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{puerto}', '--noreload']
+    return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py']
+
+
+def esperar_puerto(puerto, proceso, limite=60):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        if proceso.poll() is not None:
+            raise RuntimeError(f'El servidor terminó con código {proceso.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', puerto), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'El servidor no respondió en el puerto {puerto}')
+
+
+def generar_carga(puerto, peticion, concurrencia, duracion):
+    """Devuelve (peticiones por segundo, latencias ordenadas en ms, errores)"""
+    metodo, ruta, cuerpo, cabeceras = peticion
+    latencias, errores = [], [0]
+    bloqueo = threading.Lock()
+    fin = time.monotonic() + duracion
+
+    def cliente():
+        conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=30)
+        propias, fallidas = [], 0
+        while time.monotonic() < fin:
+            inicio = time.perf_counter()
+            try:
+                conexion.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+                respuesta = conexion.getresponse()
+                respuesta.read()
+                if respuesta.status != 200:
+                    fallidas += 1
+                    continue
+                propias.append((time.perf_counter() - inicio) * 1000)
+            except (OSError, http.client.HTTPException):
+                fallidas += 1
+                conexion.close()
+                conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=30)
+        conexion.close()
+        with bloqueo:
+            latencias.extend(propias)
+            errores[0] += fallidas
+
+    hilos = [threading.Thread(target=cliente) for _ in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    latencias.sort()
+    return len(latencias) / duracion, latencias, errores[0]
+
+
+def percentil(valores, p):
+    if not valores:
+        return float('nan')
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--servidores', nargs='+', default=['runserver', 'gunicorn'],
+                        choices=['runserver', 'gunicorn'])
+    parser.add_argument('--concurrencia', type=int, default=16)
+    parser.add_argument('--duracion', type=float, default=10, help='segundos por endpoint')
+    parser.add_argument('--puerto', type=int, default=8765)
+    args = parser.parse_args()
+
+    entorno = dict(os.environ, SERVIDOR_BIND=f'127.0.0.1:{args.puerto}')
+    entorno.setdefault('DJANGO_SETTINGS_MODULE', 'biblioteca_project.settings')
+    # Sin el registro de cada petición, que mediría la consola y no el servidor
+    entorno.setdefault('SERVIDOR_ACCESSLOG', '')
+
+    print(f"Concurrencia {args.concurrencia}, {args.duracion:g} s por endpoint")
+    print(f"  {'servidor':<10} {'endpoint':<14} {'pet/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errores':>8}")
+    for servidor in args.servidores:
+        proceso = subprocess.Popen(
+            comando_servidor(servidor, args.puerto), cwd=RAIZ, env=entorno,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            esperar_puerto(args.puerto, proceso)
+            for nombre, peticion in PETICIONES.items():
+                # Calentamiento: cachés, conexiones y workers ya creados
+                generar_carga(args.puerto, peticion, args.concurrencia, 1)
+                por_segundo, latencias, errores = generar_carga(
+                    args.puerto, peticion, args.concurrencia, args.duracion
+                )
+                print(f"  {servidor:<10} {nombre:<14} {por_segundo:9.1f} "
+                      f"{percentil(latencias, 50):8.1f} {percentil(latencias, 99):8.1f} {errores:8d}")
+        finally:
+            proceso.terminate()
+            proceso.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark: N llamadas SOAP de un elemento frente a una operación en lote
+(obtener_libro / obtener_libros, crear_prestamo / crear_prestamos_lote,
+devolver_libro / devolver_libros_lote)
+
+Las peticiones pasan por toda la pila (/soap/ con el cliente de pruebas de
+Django: middleware, validación lxml del sobre, spyne y la base de datos),
+sin red. Por cada N mide el tiempo total y las consultas SQL de cada modo.
+
+Uso:
+    python -m benchmarks.bench_soap_lotes --elementos 10 100 500
+"""
+import argparse
+import time
+
+from benchmarks.comun import base_de_datos_temporal, crear_libros, preparar_django
+
+preparar_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+
+from libros.models import Libro, Prestamo  # noqa: E402
+
+CABECERAS_SOAP = {'content_type': 'text/xml; charset=utf-8'}
+
+
+def sobre(operacion, cuerpo):
+    """Petición SOAP 1.1 de `operacion`; `cuerpo` son sus argumentos ya en XML"""
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" '
+        'xmlns:tns="biblioteca.soap.services" xmlns:s0="libros.soap_services">'
+        f'<soapenv:Body><tns:{operacion}>{cuerpo}</tns:{operacion}></soapenv:Body>'
+        '</soapenv:Envelope>'
+    )
+
+
+def enteros(nombre, valores):
+    elementos = ''.join(f'<tns:integer>{valor}</tns:integer>' for valor in valores)
+    return f'<tns:{nombre}>{elementos}</tns:{nombre}>'
+
+
+def solicitudes(pares, dias=14):
+    elementos = ''.join(
+        '<s0:SolicitudPrestamoModel>'
+        f'<s0:libro_id>{libro_id}</s0:libro_id><s0:usuario_id>{usuario_id}</s0:usuario_id>'
+        f'<s0:dias_prestamo>{dias}</s0:dias_prestamo>'
+        '</s0:SolicitudPrestamoModel>'
+        for libro_id, usuario_id in pares
+    )
+    return f'<tns:solicitudes>{elementos}</tns:solicitudes><tns:atomico>false</tns:atomico>'
+
+
+def llamar(cliente, operacion, cuerpo):
+    respuesta = cliente.post('/soap/', sobre(operacion, cuerpo), **CABECERAS_SOAP)
+    contenido = respuesta.content.decode()
+    assert respuesta.status_code == 200 and '<exito>false' not in contenido, contenido[:500]
+    return contenido
+
+
+def medir(funcion):
+    """(segundos, consultas) de una ejecución de `funcion`"""
+    consultas = 0
+
+    def contar(execute, sql, params, many, context):
+        nonlocal consultas
+        consultas += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(contar):
+        inicio = time.perf_counter()
+        funcion()
+        transcurrido = time.perf_counter() - inicio
+    return transcurrido, consultas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--elementos', type=int, nargs='+', default=[10, 100, 500])
+    args = parser.parse_args()
+
+    with base_de_datos_temporal():
+        # Cada préstamo agota el único ejemplar de su libro: libros de sobra
+        crear_libros(2 * sum(args.elementos) + max(args.elementos))
+        User.objects.bulk_create(User(username=f'lector{i}') for i in range(100))
+        usuarios = list(User.objects.values_list('id', flat=True))
+        libros = list(Libro.objects.order_by('id').values_list('id', flat=True))
+        cliente = Client()
+
+        for n in args.elementos:
+            consultados = libros[:n]
+            pares = {
+                modo: [(libros.pop(), usuarios[i % len(usuarios)]) for i in range(n)]
+                for modo in ('uno a uno', 'lote')
+            }
+
+            prestados = {}  # modo -> ids de los préstamos creados, para devolverlos
+
+            operaciones = (
+                ('obtener libros',
+                 lambda: [llamar(cliente, 'obtener_libro', f'<tns:libro_id>{libro_id}</tns:libro_id>')
+                          for libro_id in consultados],
+                 lambda: llamar(cliente, 'obtener_libros', enteros('libro_ids', consultados))),
+                ('crear préstamos',
+                 lambda: [llamar(cliente, 'crear_prestamo',
+                                 f'<tns:libro_id>{libro_id}</tns:libro_id>'
+                                 f'<tns:usuario_id>{usuario_id}</tns:usuario_id>'
+                                 '<tns:dias_prestamo>14</tns:dias_prestamo>')
+                          for libro_id, usuario_id in pares['uno a uno']],
+                 lambda: llamar(cliente, 'crear_prestamos_lote', solicitudes(pares['lote']))),
+                ('devolver préstamos',
+                 lambda: [llamar(cliente, 'devolver_libro', f'<tns:prestamo_id>{prestamo_id}</tns:prestamo_id>')
+                          for prestamo_id in prestados['uno a uno']],
+                 lambda: llamar(cliente, 'devolver_libros_lote', enteros('prestamo_ids', prestados['lote']))),
+            )
+
+            print(f'\n{n} elementos')
+            print(f"  {'operación':<20} {'modo':<10} {'segundos':>9} {'elem/s':>9} {'consultas':>10} {'mejora':>7}")
+            for nombre, uno_a_uno, en_lote in operaciones:
+                segundos_uno, consultas_uno = medir(uno_a_uno)
+                segundos_lote, consultas_lote = medir(en_lote)
+                print(f'  {nombre:<20} {"uno a uno":<10} {segundos_uno:>9.3f} {n / segundos_uno:>9,.0f} '
+                      f'{consultas_uno:>10,}')
+                print(f'  {"":<20} {"lote":<10} {segundos_lote:>9.3f} {n / segundos_lote:>9,.0f} '
+                      f'{consultas_lote:>10,} {segundos_uno / segundos_lote:>6.1f}x')
+                for modo, libros_modo in pares.items():
+                    prestados[modo] = list(Prestamo.objects.filter(
+                        libro_id__in=[libro_id for libro_id, _ in libros_modo]
+                    ).values_list('id', flat=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,401 @@
+"""
+Generador de carga: reproduce una traza JSONL de peticiones contra un
+servidor en marcha o contra el cliente de pruebas de Django
+
+Cada línea de la traza es una petición:
+
+    {"nombre": "GET /api/libros/{id}/", "metodo": "GET", "ruta": "/api/libros/1/",
+     "cabeceras": {"Content-Type": "..."}, "cuerpo": "...", "peso": 3,
+     "pausa": 0.5, "escritura": false}
+
+Solo "ruta" es obligatoria. "nombre" agrupa las peticiones en el informe (por
+defecto se deduce del método y la ruta, o de la operación SOAP), "peso" es la
+frecuencia relativa en el orden aleatorio y "pausa" sustituye al tiempo de
+reflexión global. benchmarks/trazas/postman.jsonl se generó a partir de las
+dos colecciones de Postman del repositorio con el subcomando `convertir`.
+
+Cada hilo (--concurrencia) envía una petición, espera su respuesta y el
+tiempo de reflexión (--pausa) y sigue con la siguiente. --tasa limita las
+peticiones por segundo del conjunto; en ese caso la latencia se mide desde el
+instante en que la petición debía salir, para que un servidor saturado no
+oculte su cola (omisión coordinada).
+
+Con --en-proceso sobre SQLite las escrituras concurrentes chocan con los
+bloqueos de tabla de SQLite; para medir concurrencia real conviene MySQL o
+--concurrencia 1.
+
+El informe muestra, por endpoint, peticiones por segundo, latencias p50, p95
+y p99 y la proporción de errores (excepciones y respuestas 4xx/5xx).
+
+Uso:
+    python -m benchmarks.carga convertir "Biblioteca API - Rest.postman_collection.json" \\
+        "Biblioteca API - SOAP.postman_collection.json" --salida traza.jsonl
+    python -m benchmarks.carga reproducir benchmarks/trazas/postman.jsonl \\
+        --url http://127.0.0.1:8000 --concurrencia 32 --tasa 200 --duracion 60
+    python -m benchmarks.carga reproducir benchmarks/trazas/postman.jsonl \\
+        --en-proceso --tamano pequeno --solo-lectura
+"""
+import argparse
+import http.client
+import itertools
+import json
+import random
+import re
+import statistics
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+from benchmarks.comun import TAMANOS, percentil
+
+_ID_EN_RUTA = re.compile(r'/\d+(?=/|$)')
+_OPERACION_SOAP = re.compile(r'<(?:\w+:)?Body[^>]*>\s*<(?:\w+:)?(\w+)')
+_PREFIJOS_ESCRITURA_SOAP = ('crear_', 'devolver_', 'actualizar_', 'eliminar_', 'renovar_')
+
+
+# ===== TRAZAS =====
+
+def operacion_soap(cuerpo):
+    coincidencia = _OPERACION_SOAP.search(cuerpo or '')
+    return coincidencia.group(1) if coincidencia else None
+
+
+def nombre_peticion(metodo, ruta, cuerpo=None):
+    """Nombre del endpoint: 'SOAP operacion' o 'METODO /ruta/{id}/?parametros'"""
+    operacion = operacion_soap(cuerpo)
+    if operacion:
+        return f'SOAP {operacion}'
+    partes = urlsplit(ruta)
+    nombre = f'{metodo} {_ID_EN_RUTA.sub("/{id}", partes.path)}'
+    parametros = sorted({clave for clave, _ in parse_qsl(partes.query)})
+    return f'{nombre}?{"&".join(parametros)}' if parametros else nombre
+
+
+def es_escritura(metodo, cuerpo=None):
+    operacion = operacion_soap(cuerpo)
+    if operacion:
+        return operacion.startswith(_PREFIJOS_ESCRITURA_SOAP)
+    return metodo not in ('GET', 'HEAD', 'OPTIONS')
+
+
+def cargar_traza(ruta_fichero, solo_lectura=False):
+    """Lee la traza y completa los campos opcionales de cada petición"""
+    peticiones = []
+    with open(ruta_fichero, encoding='utf-8') as fichero:
+        for numero, linea in enumerate(fichero, 1):
+            if not linea.strip():
+                continue
+            try:
+                peticion = json.loads(linea)
+                ruta = peticion['ruta']
+            except (ValueError, KeyError):
+                raise ValueError(f'{ruta_fichero}:{numero}: se esperaba un objeto JSON con "ruta"')
+            metodo = peticion.get('metodo', 'GET').upper()
+            cuerpo = peticion.get('cuerpo')
+            peticion.update(
+                metodo=metodo,
+                ruta=ruta,
+                nombre=peticion.get('nombre') or nombre_peticion(metodo, ruta, cuerpo),
+                cabeceras=peticion.get('cabeceras') or {},
+                peso=peticion.get('peso', 1),
+                escritura=peticion.get('escritura', es_escritura(metodo, cuerpo)),
+            )
+            if not (solo_lectura and peticion['escritura']):
+                peticiones.append(peticion)
+    if not peticiones:
+        raise ValueError(f'{ruta_fichero}: la traza no tiene peticiones que reproducir')
+    return peticiones
+
+
+def desde_postman(ruta_coleccion):
+    """Peticiones de una colección de Postman (v2.1) en el formato de traza"""
+    with open(ruta_coleccion, encoding='utf-8') as fichero:
+        coleccion = json.load(fichero)
+
+    def recorrer(elementos):
+        for elemento in elementos:
+            if 'item' in elemento:
+                yield from recorrer(elemento['item'])
+            else:
+                yield elemento['request']
+
+    for request in recorrer(coleccion['item']):
+        url = request['url']['raw'] if isinstance(request['url'], dict) else request['url']
+        partes = urlsplit(url)
+        ruta = partes.path + (f'?{partes.query}' if partes.query else '')
+        metodo = request['method'].upper()
+        cabeceras = {cabecera['key']: cabecera['value'] for cabecera in request.get('header', [])
+                     if not cabecera.get('disabled')}
+        cuerpo = (request.get('body') or {}).get('raw') or None
+        if cuerpo and metodo in ('GET', 'HEAD', 'DELETE'):
+            cuerpo = None
+        if cuerpo and not any(clave.lower() == 'content-type' for clave in cabeceras):
+            lenguaje = request['body'].get('options', {}).get('raw', {}).get('language')
+            if lenguaje == 'json':
+                cabeceras['Content-Type'] = 'application/json'
+        peticion = {'nombre': nombre_peticion(metodo, ruta, cuerpo), 'metodo': metodo, 'ruta': ruta}
+        if cabeceras:
+            peticion['cabeceras'] = cabeceras
+        if cuerpo:
+            peticion['cuerpo'] = cuerpo
+        peticion['escritura'] = es_escritura(metodo, cuerpo)
+        yield peticion
+
+
+# ===== DESTINOS =====
+
+class DestinoHttp:
+    """Servidor en marcha; una conexión keep-alive por hilo"""
+
+    def __init__(self, url, timeout=30):
+        partes = urlsplit(url)
+        self.clase = http.client.HTTPSConnection if partes.scheme == 'https' else http.client.HTTPConnection
+        self.servidor = partes.netloc
+        self.prefijo = partes.path.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conexion(self):
+        if getattr(self._local, 'conexion', None) is None:
+            self._local.conexion = self.clase(self.servidor, timeout=self.timeout)
+        return self._local.conexion
+
+    def enviar(self, peticion):
+        """Envía la petición y devuelve el código de estado"""
+        conexion = self._conexion()
+        cuerpo = peticion.get('cuerpo')
+        try:
+            conexion.request(peticion['metodo'], self.prefijo + peticion['ruta'],
+                             body=cuerpo.encode('utf-8') if cuerpo else None,
+                             headers=peticion['cabeceras'])
+            respuesta = conexion.getresponse()
+            respuesta.read()
+        except (OSError, http.client.HTTPException):
+            conexion.close()
+            self._local.conexion = None
+            raise
+        return respuesta.status
+
+
+class DestinoEnProceso:
+    """Cliente de pruebas de Django, uno por hilo; no abre sockets"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def enviar(self, peticion):
+        from django.test import Client
+
+        if getattr(self._local, 'cliente', None) is None:
+            self._local.cliente = Client(raise_request_exception=False)
+        cabeceras = dict(peticion['cabeceras'])
+        tipo = next((cabeceras.pop(clave) for clave in list(cabeceras) if clave.lower() == 'content-type'),
+                    'application/octet-stream')
+        respuesta = self._local.cliente.generic(
+            peticion['metodo'], peticion['ruta'], data=peticion.get('cuerpo') or '',
+            content_type=tipo, headers=cabeceras,
+        )
+        return respuesta.status_code
+
+
+# ===== REPRODUCCIÓN =====
+
+class Ritmo:
+    """
+    Reparte los instantes de salida para no superar `tasa` peticiones/s. El
+    calendario es fijo: si todos los hilos están ocupados, las peticiones
+    salen tarde pero conservan su instante previsto, y el retraso cuenta en
+    la latencia (sin omisión coordinada).
+    """
+
+    def __init__(self, tasa):
+        self.intervalo = 1 / tasa
+        self._siguiente = time.perf_counter()
+        self._bloqueo = threading.Lock()
+
+    def turno(self):
+        """Espera al turno de la siguiente petición y devuelve su instante previsto"""
+        with self._bloqueo:
+            previsto = self._siguiente
+            self._siguiente += self.intervalo
+        espera = previsto - time.perf_counter()
+        if espera > 0:
+            time.sleep(espera)
+        return previsto
+
+
+def reproducir(peticiones, destino, concurrencia=8, duracion=30, max_peticiones=None, tasa=None,
+               pausa=0.0, pausa_exponencial=False, aleatorio=False, semilla=1):
+    """
+    Reproduce la traza y devuelve (segundos transcurridos, {nombre: [(latencia_ms, error)]}).
+    En orden secuencial la traza se recorre en bucle, repartida entre los hilos.
+    """
+    generador = random.Random(semilla)
+    if aleatorio:
+        pesos = list(itertools.accumulate(peticion['peso'] for peticion in peticiones))
+        siguiente = lambda: generador.choices(peticiones, cum_weights=pesos)[0]  # noqa: E731
+    else:
+        ciclo = itertools.cycle(peticiones)
+        siguiente = lambda: next(ciclo)  # noqa: E731
+    bloqueo = threading.Lock()
+    ritmo = Ritmo(tasa) if tasa else None
+    restantes = itertools.count() if max_peticiones is None else iter(range(max_peticiones))
+    resultados = {}
+    fin = time.perf_counter() + duracion
+
+    def trabajador():
+        propios = []
+        while time.perf_counter() < fin:
+            with bloqueo:
+                if next(restantes, None) is None:
+                    break
+                peticion = siguiente()
+                espera = peticion.get('pausa', pausa)
+                if pausa_exponencial and espera:
+                    espera = generador.expovariate(1 / espera)
+            inicio = ritmo.turno() if ritmo else time.perf_counter()
+            try:
+                error = destino.enviar(peticion) >= 400
+            except Exception:
+                error = True
+            propios.append((peticion['nombre'], (time.perf_counter() - inicio) * 1000, error))
+            if espera:
+                time.sleep(espera)
+        with bloqueo:
+            for nombre, latencia, error in propios:
+                resultados.setdefault(nombre, []).append((latencia, error))
+
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=trabajador) for _ in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return time.perf_counter() - inicio, resultados
+
+
+# ===== INFORME =====
+
+def resumir(muestras, segundos):
+    latencias = sorted(latencia for latencia, _ in muestras)
+    errores = sum(error for _, error in muestras)
+    return {
+        'peticiones': len(muestras),
+        'por_segundo': round(len(muestras) / segundos, 2),
+        'media_ms': round(statistics.fmean(latencias), 3),
+        'p50_ms': round(percentil(latencias, 50), 3),
+        'p95_ms': round(percentil(latencias, 95), 3),
+        'p99_ms': round(percentil(latencias, 99), 3),
+        'errores': errores,
+        'tasa_errores': round(errores / len(muestras), 4),
+    }
+
+
+def informe(segundos, resultados):
+    """Resumen por endpoint y total ('*')"""
+    resumen = {nombre: resumir(muestras, segundos) for nombre, muestras in sorted(resultados.items())}
+    todas = [muestra for muestras in resultados.values() for muestra in muestras]
+    if todas:
+        resumen['*'] = resumir(todas, segundos)
+    return resumen
+
+
+def imprimir(resumen, segundos):
+    print(f"\n{segundos:.1f} s")
+    print(f"  {'endpoint':<36} {'pet':>7} {'pet/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errores':>8}")
+    for nombre, r in resumen.items():
+        print(f"  {'TOTAL' if nombre == '*' else nombre:<36} {r['peticiones']:7d} {r['por_segundo']:8.1f} "
+              f"{r['p50_ms']:8.1f} {r['p95_ms']:8.1f} {r['p99_ms']:8.1f} {r['tasa_errores']:8.1%}")
+
+
+# ===== LÍNEA DE COMANDOS =====
+
+def convertir(args):
+    with open(args.salida, 'w', encoding='utf-8') as fichero:
+        total = 0
+        for coleccion in args.colecciones:
+            for peticion in desde_postman(coleccion):
+                fichero.write(json.dumps(peticion, ensure_ascii=False) + '\n')
+                total += 1
+    print(f"{total} peticiones escritas en {args.salida}")
+
+
+def ejecutar(args, destino):
+    peticiones = cargar_traza(args.traza, solo_lectura=args.solo_lectura)
+    print(f"{len(peticiones)} peticiones en la traza, {args.concurrencia} hilos, "
+          f"{'sin límite de tasa' if not args.tasa else f'{args.tasa:g} pet/s'}")
+    segundos, resultados = reproducir(
+        peticiones, destino, concurrencia=args.concurrencia, duracion=args.duracion,
+        max_peticiones=args.peticiones, tasa=args.tasa, pausa=args.pausa,
+        pausa_exponencial=args.pausa_exponencial, aleatorio=args.aleatorio, semilla=args.semilla,
+    )
+    resumen = informe(segundos, resultados)
+    imprimir(resumen, segundos)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as fichero:
+            json.dump({
+                'traza': args.traza,
+                'destino': args.url or 'en-proceso',
+                'concurrencia': args.concurrencia,
+                'tasa': args.tasa,
+                'segundos': round(segundos, 3),
+                'endpoints': resumen,
+            }, fichero, indent=2, ensure_ascii=False)
+        print(f"\nResultados guardados en {args.salida}")
+
+
+def reproducir_comando(args):
+    if args.url:
+        ejecutar(args, DestinoHttp(args.url))
+        return
+
+    from benchmarks.comun import base_de_datos_temporal, preparar_django
+
+    preparar_django()
+    from libros import generador
+
+    with base_de_datos_temporal():
+        generador.generar(informar=lambda mensaje: None, **TAMANOS[args.tamano])
+        ejecutar(args, DestinoEnProceso())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subcomandos = parser.add_subparsers(dest='subcomando', required=True)
+
+    conversion = subcomandos.add_parser('convertir', help='traza JSONL a partir de colecciones de Postman')
+    conversion.add_argument('colecciones', nargs='+')
+    conversion.add_argument('--salida', required=True)
+    conversion.set_defaults(funcion=convertir)
+
+    reproduccion = subcomandos.add_parser('reproducir', help='reproduce una traza JSONL')
+    reproduccion.add_argument('traza')
+    destino = reproduccion.add_mutually_exclusive_group(required=True)
+    destino.add_argument('--url', help='servidor en marcha, p. ej. http://127.0.0.1:8000')
+    destino.add_argument('--en-proceso', action='store_true',
+                         help='cliente de pruebas de Django sobre una base de datos temporal generada')
+    reproduccion.add_argument('--tamano', default='pequeno',
+                              choices=TAMANOS,
+                              help='datos generados con --en-proceso')
+    reproduccion.add_argument('--concurrencia', type=int, default=8, help='hilos cliente')
+    reproduccion.add_argument('--duracion', type=float, default=30, help='segundos como máximo')
+    reproduccion.add_argument('--peticiones', type=int, help='peticiones en total como máximo')
+    reproduccion.add_argument('--tasa', type=float, help='peticiones por segundo en total')
+    reproduccion.add_argument('--pausa', type=float, default=0.0,
+                              help='tiempo de reflexión entre peticiones de un hilo (s)')
+    reproduccion.add_argument('--pausa-exponencial', action='store_true',
+                              help='pausas aleatorias con media --pausa')
+    reproduccion.add_argument('--aleatorio', action='store_true',
+                              help='elige las peticiones al azar según su peso')
+    reproduccion.add_argument('--solo-lectura', action='store_true',
+                              help='omite las peticiones que modifican datos')
+    reproduccion.add_argument('--semilla', type=int, default=1)
+    reproduccion.add_argument('--salida', help='fichero JSON con el informe')
+    reproduccion.set_defaults(funcion=reproducir_comando)
+
+    args = parser.parse_args()
+    args.funcion(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Utilidades compartidas por los benchmarks
+
+Los benchmarks crean una base de datos de prueba desechable (igual que
+``manage.py test``) usando la configuración de DJANGO_SETTINGS_MODULE,
+así que nunca tocan los datos reales.
+"""
+import os
+import random
+import time
+from contextlib import contextmanager
+from datetime import date
+
+import django
+
+
+def preparar_django():
+    """Configura Django para ejecutar un benchmark como script"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'biblioteca_project.settings')
+    django.setup()
+
+
+@contextmanager
+def base_de_datos_temporal():
+    """Crea las bases de datos de prueba y las destruye al terminar"""
+    from django.test.utils import (
+        setup_databases, setup_test_environment, teardown_databases,
+        teardown_test_environment,
+    )
+
+    setup_test_environment()
+    configuracion = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(configuracion, verbosity=0)
+        teardown_test_environment()
+
+
+# Tamaños de los datos generados con libros/generador.py
+TAMANOS = {
+    'pequeno': {'usuarios': 200, 'autores': 200, 'libros': 2000, 'prestamos': 10_000},
+    'mediano': {'usuarios': 2000, 'autores': 2000, 'libros': 50_000, 'prestamos': 250_000},
+    'grande': {'usuarios': 20_000, 'autores': 10_000, 'libros': 500_000, 'prestamos': 2_500_000},
+}
+
+
+def percentil(valores, p):
+    """Percentil `p` (0-100) de una lista ya ordenada"""
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+def cronometrar(funcion, repeticiones=3):
+    """Ejecuta `funcion` varias veces y devuelve el mejor tiempo en segundos"""
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        transcurrido = time.perf_counter() - inicio
+        mejor = transcurrido if mejor is None else min(mejor, transcurrido)
+    return mejor
+
+
+PALABRAS = (
+    'sombra viento noche jardín ciudad río montaña memoria silencio tiempo '
+    'guerra amor muerte mar cielo fuego camino casa hombre mujer niño perro '
+    'historia secreto libro sueño laberinto espejo verano invierno isla '
+    'ángel diablo rey reina príncipe ciego loco último primer cien mil'
+).split()
+
+# Vocabulario poco frecuente (~27 000 palabras inventadas) para que cada
+# título tenga también términos que lo distingan, como en un catálogo real
+SILABAS = 'ba be bi bo bu ca ce ci co cu da de di do du la le li lo lu ma me mi mo mu ra re ri ro ru'.split()
+RARAS = [a + b + c for a in SILABAS for b in SILABAS for c in SILABAS]
+
+
+def titulo_aleatorio(i, generador=random.Random(1)):
+    """Título de 2 a 5 palabras, siempre el mismo para la misma secuencia de i"""
+    palabras = [generador.choice(PALABRAS) for _ in range(generador.randint(1, 4))]
+    palabras.insert(generador.randint(0, len(palabras)), generador.choice(RARAS))
+    return ' '.join(palabras).capitalize()
+
+
+def crear_libros(num_libros, num_autores=500, tamano_lote=5000, titulo=None):
+    """
+    Inserta `num_libros` libros repartidos entre `num_autores` autores.
+    `titulo(i)` genera el título del libro i (por defecto 'Libro 0000i').
+    """
+    from libros.models import Autor, Categoria, Editorial, Libro
+
+    Autor.objects.bulk_create(
+        Autor(nombre=f'Nombre{i}', apellido=f'Apellido{i}') for i in range(num_autores)
+    )
+    # MySQL no devuelve las claves de bulk_create, se leen de nuevo
+    autores = list(Autor.objects.values_list('id', flat=True))
+    editorial = Editorial.objects.create(nombre='Editorial Benchmark', pais='México')
+    categoria = Categoria.objects.create(nombre='Benchmark')
+
+    for inicio in range(0, num_libros, tamano_lote):
+        Libro.objects.bulk_create(
+            Libro(
+                titulo=titulo(i) if titulo else f'Libro {i:07d}',
+                isbn=f'{i:013d}',
+                autor_id=autores[i % len(autores)],
+                editorial=editorial if i % 10 else None,
+                categoria=categoria,
+                fecha_publicacion=date(2000, 1, 1),
+                numero_paginas=200,
+                descripcion='Descripción de prueba',
+            )
+            for i in range(inicio, min(inicio + tamano_lote, num_libros))
+        )
@@ -0,0 +1,87 @@
+"""
+Backend MySQL de Django con pool de conexiones por proceso
+
+Se activa con ENGINE = 'biblioteca_project.db.mysql' y se configura con la
+clave POOL de la base de datos en DATABASES (ver settings.py). Django sigue
+abriendo y cerrando "su" conexión en cada petición (CONN_MAX_AGE = 0), pero
+abrir la toma del pool y cerrar la devuelve.
+"""
+import os
+import threading
+
+from django.db.backends.mysql import base as mysql
+
+from ..pool import PoolConexiones
+
+Database = mysql.Database
+
+_pools = {}
+_bloqueo = threading.Lock()
+
+
+def pools():
+    """Pools creados en este proceso, por alias de base de datos"""
+    return {alias: pool for (alias, _), pool in _pools.items()}
+
+
+def _olvidar_pools():
+    # Los sockets heredados del proceso padre son suyos: el hijo empieza
+    # con pools vacíos en lugar de reutilizarlos o cerrarlos
+    _pools.clear()
+
+
+os.register_at_fork(after_in_child=_olvidar_pools)
+
+
+class DatabaseWrapper(mysql.DatabaseWrapper):
+
+    def _pool(self, conn_params):
+        # Un pool por alias y parámetros: las pruebas cambian NAME a la base
+        # de datos de test y no deben recibir conexiones a la real
+        clave = (self.alias, repr(sorted(conn_params.items())))
+        pool = _pools.get(clave)
+        if pool is None:
+            with _bloqueo:
+                pool = _pools.get(clave)
+                if pool is None:
+                    opciones = self.settings_dict.get('POOL', {})
+                    crear = super().get_new_connection
+                    pool = _pools[clave] = PoolConexiones(
+                        crear=lambda: crear(conn_params),
+                        validar=_validar,
+                        cerrar=lambda conexion: conexion.close(),
+                        tamano_maximo=opciones.get('TAMANO_MAXIMO', 10),
+                        vida_maxima=opciones.get('VIDA_MAXIMA', 1800),
+                        espera_maxima=opciones.get('ESPERA_MAXIMA', 10),
+                        validar_tras=opciones.get('VALIDAR_TRAS', 30),
+                    )
+        return pool
+
+    def get_new_connection(self, conn_params):
+        self._pool_actual = self._pool(conn_params)
+        return self._pool_actual.obtener()
+
+    def _close(self):
+        conexion = self.connection
+        if conexion is None:
+            return
+        # Cerrada a mitad de un atomic() el wrapper la sigue referenciando
+        # hasta el rollback: no puede pasar a otro hilo
+        reutilizable = not self.in_atomic_block
+        if reutilizable:
+            try:
+                # Ninguna transacción abierta pasa al siguiente usuario
+                conexion.rollback()
+                if self.errors_occurred:
+                    reutilizable = _validar(conexion)
+            except Database.Error:
+                reutilizable = False
+        self._pool_actual.devolver(conexion, reutilizable)
+
+
+def _validar(conexion):
+    try:
+        conexion.ping()
+    except Database.Error:
+        return False
+    return True
@@ -0,0 +1,177 @@
+"""
+Pool de conexiones a la base de datos compartido por los hilos de un proceso
+
+Django abre una conexión por hilo; con CONN_MAX_AGE=0 la cierra al final de
+cada petición y la siguiente vuelve a pagar el handshake de MySQL y el
+init_command. El backend biblioteca_project.db.mysql devuelve la conexión a
+este pool en lugar de cerrarla, y la siguiente petición (de cualquier hilo)
+la reutiliza.
+
+- El número de conexiones abiertas por proceso está acotado (tamano_maximo);
+  si están todas en uso se espera hasta espera_maxima segundos.
+- Las conexiones se descartan al cumplir vida_maxima segundos, antes de que
+  MySQL las cierre por wait_timeout.
+- Una conexión que lleva más de validar_tras segundos libre se comprueba
+  (ping) antes de entregarla.
+"""
+import threading
+import time
+from collections import deque
+
+
+class PoolAgotado(Exception):
+    """No quedó ninguna conexión libre dentro del tiempo de espera"""
+
+
+class PoolConexiones:
+    """
+    Pool genérico: `crear()` abre una conexión nueva, `validar(conexion)`
+    indica si sigue viva y `cerrar(conexion)` la cierra.
+    """
+
+    def __init__(self, crear, validar, cerrar, tamano_maximo=10, vida_maxima=1800,
+                 espera_maxima=10, validar_tras=30):
+        self.crear = crear
+        self.validar = validar
+        self.cerrar = cerrar
+        self.tamano_maximo = tamano_maximo
+        self.vida_maxima = vida_maxima
+        self.espera_maxima = espera_maxima
+        self.validar_tras = validar_tras
+
+        self._condicion = threading.Condition()
+        self._libres = deque()  # (conexion, devuelta_en); al final la más reciente
+        self._creada_en = {}  # id(conexion) -> instante de creación
+        self._en_uso = 0
+        self._esperando = 0
+        self._contadores = dict.fromkeys(
+            ('creadas', 'reutilizadas', 'descartadas', 'esperas', 'agotado'), 0
+        )
+        self._segundos_esperando = 0.0
+
+    # ===== ENTREGA Y DEVOLUCIÓN =====
+
+    def obtener(self):
+        """Entrega una conexión libre o nueva; lanza PoolAgotado si no hay"""
+        while True:
+            conexion, devuelta_en = self._reservar()
+            if conexion is None:
+                return self._abrir()
+            if time.monotonic() - devuelta_en <= self.validar_tras or self._es_valida(conexion):
+                return conexion
+            # Estaba muerta: se descarta y se vuelve a intentar
+            self._descartar(conexion)
+            with self._condicion:
+                self._en_uso -= 1
+                self._condicion.notify()
+
+    def devolver(self, conexion, reutilizable=True):
+        """Devuelve una conexión entregada por obtener()"""
+        if reutilizable and not self._caducada(conexion):
+            with self._condicion:
+                self._libres.append((conexion, time.monotonic()))
+                self._en_uso -= 1
+                self._condicion.notify()
+            return
+        self._descartar(conexion)
+        with self._condicion:
+            self._en_uso -= 1
+            self._condicion.notify()
+
+    def cerrar_todas(self):
+        """Cierra las conexiones libres (las que están en uso se descartan al devolverlas)"""
+        with self._condicion:
+            libres = [conexion for conexion, _ in self._libres]
+            self._libres.clear()
+        for conexion in libres:
+            self._descartar(conexion)
+
+    def _reservar(self):
+        """
+        Reserva un hueco del pool. Devuelve (conexion, devuelta_en) si hay
+        una libre o (None, None) si hay que abrir una nueva.
+        """
+        caducadas = []
+        try:
+            with self._condicion:
+                fin = None
+                while True:
+                    while self._libres:
+                        # La más reciente: es la que menos probable está muerta
+                        conexion, devuelta_en = self._libres.pop()
+                        if self._caducada(conexion):
+                            caducadas.append(conexion)
+                            continue
+                        self._en_uso += 1
+                        self._contadores['reutilizadas'] += 1
+                        return conexion, devuelta_en
+                    if self._en_uso < self.tamano_maximo:
+                        self._en_uso += 1
+                        return None, None
+
+                    if fin is None:
+                        fin = time.monotonic() + self.espera_maxima
+                        self._contadores['esperas'] += 1
+                    restante = fin - time.monotonic()
+                    if restante <= 0:
+                        self._contadores['agotado'] += 1
+                        raise PoolAgotado(
+                            f'Las {self.tamano_maximo} conexiones del pool siguen en uso '
+                            f'tras {self.espera_maxima} s'
+                        )
+                    inicio = time.monotonic()
+                    self._esperando += 1
+                    try:
+                        self._condicion.wait(restante)
+                    finally:
+                        self._esperando -= 1
+                        self._segundos_esperando += time.monotonic() - inicio
+        finally:
+            for conexion in caducadas:
+                self._descartar(conexion)
+
+    def _abrir(self):
+        try:
+            conexion = self.crear()
+        except BaseException:
+            with self._condicion:
+                self._en_uso -= 1
+                self._condicion.notify()
+            raise
+        with self._condicion:
+            self._creada_en[id(conexion)] = time.monotonic()
+            self._contadores['creadas'] += 1
+        return conexion
+
+    def _es_valida(self, conexion):
+        try:
+            return self.validar(conexion)
+        except Exception:
+            return False
+
+    def _caducada(self, conexion):
+        creada_en = self._creada_en.get(id(conexion))
+        return creada_en is None or time.monotonic() - creada_en > self.vida_maxima
+
+    def _descartar(self, conexion):
+        with self._condicion:
+            self._creada_en.pop(id(conexion), None)
+            self._contadores['descartadas'] += 1
+        try:
+            self.cerrar(conexion)
+        except Exception:
+            pass
+
+    # ===== ESTADÍSTICAS =====
+
+    def estadisticas(self):
+        """Estado actual y contadores acumulados del pool"""
+        with self._condicion:
+            return {
+                'tamano_maximo': self.tamano_maximo,
+                'en_uso': self._en_uso,
+                'libres': len(self._libres),
+                'esperando': self._esperando,
+                **self._contadores,
+                'segundos_esperando': round(self._segundos_esperando, 3),
+            }
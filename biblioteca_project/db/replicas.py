@@ -0,0 +1,115 @@
+"""
+Lecturas en réplicas y escrituras en el primario
+
+RouterReplicas envía las lecturas a una de settings.DATABASE_REPLICAS y las
+escrituras a 'default'. Para que cada usuario lea lo que acaba de escribir,
+las lecturas vuelven al primario cuando:
+
+- hay una transacción abierta en el primario (p. ej. prestar_libro),
+- se está dentro de usar_primario(),
+- la petición HTTP es de escritura (POST, PUT...) salvo en vistas marcadas
+  con lecturas_en_replica (el servicio SOAP, donde todo llega por POST y
+  las escrituras ocurren en transacciones sobre el primario),
+- la petición ya escribió algo, o el mismo cliente escribió hace menos de
+  settings.REPLICA_RETARDO_MAXIMO segundos (cookie puesta por
+  ReplicasMiddleware), para cubrir el retraso de la replicación.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+COOKIE_PRIMARIO = 'leer_primario'
+METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class _Estado:
+    """Estado de la petición en curso"""
+
+    def __init__(self, primario=False):
+        self.primario = primario
+        self.escrito = False
+
+
+_estado = ContextVar('estado_replicas', default=None)
+_forzar_primario = ContextVar('forzar_primario', default=False)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+@contextmanager
+def usar_primario():
+    """Todas las lecturas del bloque van al primario"""
+    token = _forzar_primario.set(True)
+    try:
+        yield
+    finally:
+        _forzar_primario.reset(token)
+
+
+def lecturas_en_replica(vista):
+    """Marca una vista cuyas peticiones POST pueden leer de las réplicas"""
+    vista.lecturas_en_replica = True
+    return vista
+
+
+def leer_del_primario():
+    """Indica si la lectura actual debe ir al primario"""
+    estado = _estado.get()
+    return (
+        _forzar_primario.get()
+        or (estado is not None and (estado.primario or estado.escrito))
+        or connections[DEFAULT_DB_ALIAS].in_atomic_block
+    )
+
+
+class RouterReplicas:
+    """Router de bases de datos: lecturas a réplicas, escrituras al primario"""
+
+    def db_for_read(self, model, **hints):
+        disponibles = replicas()
+        if not disponibles or leer_del_primario():
+            return DEFAULT_DB_ALIAS
+        return random.choice(disponibles)
+
+    def db_for_write(self, model, **hints):
+        estado = _estado.get()
+        if estado is not None:
+            estado.escrito = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primario y réplicas contienen los mismos datos
+        bases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+
+class ReplicasMiddleware:
+    """Decide, por petición, si las lecturas pueden ir a las réplicas"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        estado = _Estado(primario=COOKIE_PRIMARIO in request.COOKIES)
+        token = _estado.set(estado)
+        try:
+            response = self.get_response(request)
+        finally:
+            _estado.reset(token)
+        if estado.escrito and replicas():
+            response.set_cookie(
+                COOKIE_PRIMARIO, '1', max_age=getattr(settings, 'REPLICA_RETARDO_MAXIMO', 5),
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in METODOS_SEGUROS and not getattr(view_func, 'lecturas_en_replica', False):
+            _estado.get().primario = True
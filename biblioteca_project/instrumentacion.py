@@ -0,0 +1,227 @@
+"""
+Medición por petición: tiempo total, tiempo en la base de datos, consultas
+y consultas repetidas de cada vista
+
+InstrumentacionMiddleware envuelve la ejecución de SQL de cada conexión con
+connection.execute_wrapper (no necesita DEBUG ni guarda el SQL de cada
+consulta) y acumula los resultados por vista en histogramas del proceso:
+
+- las vistas se identifican por su nombre de URL ('libro-list',
+  'catalogo'...) y las operaciones SOAP como 'soap:<operación>', nunca por
+  la ruta, para que el número de series no crezca con los ids,
+- una consulta "repetida" es la misma sentencia SQL (con otros parámetros)
+  ejecutada más de una vez en la petición: el síntoma de un N+1. Si pasan de
+  settings.INSTRUMENTACION_UMBRAL_REPETIDAS se registra un aviso. Las
+  consultas dentro de por_bloques() (los bloques de un bulk_create, por
+  ejemplo) se repiten a propósito y no cuentan; ese with debe envolver solo
+  el bucle por bloques.
+
+Con settings.DEBUG las respuestas llevan además la cabecera Server-Timing,
+que las herramientas de desarrollo del navegador muestran por petición.
+
+El coste es un par de llamadas a perf_counter y un diccionario por consulta
+y un bloqueo por petición; settings.INSTRUMENTACION_ACTIVA=False la desactiva.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Límites superiores (ms) de los cubos del histograma de duración
+CUBOS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+SIN_RUTA = '<sin_ruta>'
+
+
+class Medicion:
+    """Lo ocurrido durante una petición"""
+
+    __slots__ = ('vista', 'consultas', 'segundos_bd', 'sentencias', 'por_bloques', 'en_bloques')
+
+    def __init__(self):
+        self.vista = None
+        self.consultas = 0
+        self.segundos_bd = 0.0
+        self.sentencias = {}  # SQL -> veces ejecutada
+        self.por_bloques = False
+        self.en_bloques = 0  # consultas hechas dentro de por_bloques()
+
+    @property
+    def repetidas(self):
+        return self.consultas - self.en_bloques - len(self.sentencias)
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper de Django: se llama en cada consulta de la conexión
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.segundos_bd += time.perf_counter() - inicio
+            self.consultas += 1
+            if self.por_bloques:
+                self.en_bloques += 1
+            else:
+                self.sentencias[sql] = self.sentencias.get(sql, 0) + 1
+
+
+_medicion = ContextVar('medicion', default=None)
+
+
+def nombrar_vista(nombre):
+    """Sustituye el nombre con que se agrega la petición en curso (p. ej. la operación SOAP)"""
+    medicion = _medicion.get()
+    if medicion is not None:
+        medicion.vista = nombre
+
+
+class _PorBloques:
+    # Sin __call__: no sirve como decorador (ver por_bloques)
+
+    def __enter__(self):
+        self._medicion = _medicion.get()
+        if self._medicion is not None:
+            self._anterior, self._medicion.por_bloques = self._medicion.por_bloques, True
+        return self
+
+    def __exit__(self, *excepcion):
+        if self._medicion is not None:
+            self._medicion.por_bloques = self._anterior
+        return False
+
+
+def por_bloques():
+    """
+    `with por_bloques():` alrededor de un bucle que repite la misma sentencia
+    por diseño (un bloque por cada N filas): sus consultas no cuentan como
+    repetidas en la petición en curso.
+
+    Nada comprueba que las consultas de dentro sean de verdad bloques, así
+    que el with debe envolver solo ese bucle (o la llamada a bulk_create y
+    similares), nunca validaciones ni ganchos que puedan consultar por
+    elemento: un N+1 dentro no se detectaría. Por eso no puede usarse como
+    decorador de un método entero.
+    """
+    return _PorBloques()
+
+
+# ===== AGREGADOS DEL PROCESO =====
+
+class _Serie:
+    __slots__ = ('peticiones', 'errores', 'segundos', 'segundos_bd', 'consultas',
+                 'con_repetidas', 'max_consultas', 'cubos')
+
+    def __init__(self):
+        self.peticiones = 0
+        self.errores = 0
+        self.segundos = 0.0
+        self.segundos_bd = 0.0
+        self.consultas = 0
+        self.con_repetidas = 0
+        self.max_consultas = 0
+        self.cubos = [0] * (len(CUBOS_MS) + 1)  # el último es +Inf
+
+
+_series = {}
+_bloqueo = threading.Lock()
+
+
+def registrar(vista, segundos, medicion, error=False):
+    """Acumula una petición en la serie de su vista"""
+    with _bloqueo:
+        serie = _series.get(vista)
+        if serie is None:
+            serie = _series[vista] = _Serie()
+        serie.peticiones += 1
+        serie.errores += error
+        serie.segundos += segundos
+        serie.segundos_bd += medicion.segundos_bd
+        serie.consultas += medicion.consultas
+        serie.con_repetidas += medicion.repetidas > 0
+        serie.max_consultas = max(serie.max_consultas, medicion.consultas)
+        serie.cubos[bisect_left(CUBOS_MS, segundos * 1000)] += 1
+
+
+def estadisticas():
+    """
+    Copia de los agregados por vista: peticiones, errores (5xx), segundos y
+    segundos en BD acumulados, consultas, peticiones con consultas repetidas,
+    máximo de consultas y cubos del histograma de duración (no acumulados,
+    con los límites de CUBOS_MS y un último cubo sin límite).
+    """
+    with _bloqueo:
+        return {
+            vista: {campo: getattr(serie, campo) for campo in _Serie.__slots__ if campo != 'cubos'}
+            | {'cubos': list(serie.cubos)}
+            for vista, serie in _series.items()
+        }
+
+
+def reiniciar():
+    with _bloqueo:
+        _series.clear()
+
+
+# ===== MIDDLEWARE =====
+
+def _nombre_vista(request):
+    coincidencia = getattr(request, 'resolver_match', None)
+    if coincidencia is None:
+        return SIN_RUTA
+    return coincidencia.view_name
+
+
+def _server_timing(segundos, medicion):
+    return (
+        f'total;dur={segundos * 1000:.1f}, '
+        f'db;dur={medicion.segundos_bd * 1000:.1f};desc="{medicion.consultas} consultas", '
+        f'repetidas;desc="{medicion.repetidas}"'
+    )
+
+
+class InstrumentacionMiddleware:
+    """Mide cada petición y la acumula en la serie de su vista"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTACION_ACTIVA', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.umbral_repetidas = getattr(settings, 'INSTRUMENTACION_UMBRAL_REPETIDAS', 10)
+        # Con preload el middleware se crea antes del fork: cada worker
+        # arranca su publicador de métricas con su primera petición
+        from biblioteca_project.metricas import asegurar_publicador
+        self.asegurar_publicador = asegurar_publicador
+
+    def __call__(self, request):
+        self.asegurar_publicador()
+        medicion = Medicion()
+        token = _medicion.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            with ExitStack() as pila:
+                for alias in settings.DATABASES:
+                    pila.enter_context(connections[alias].execute_wrapper(medicion))
+                response = self.get_response(request)
+        except Exception:
+            registrar(medicion.vista or _nombre_vista(request), time.perf_counter() - inicio,
+                      medicion, error=True)
+            raise
+        finally:
+            _medicion.reset(token)
+        segundos = time.perf_counter() - inicio
+
+        vista = medicion.vista or _nombre_vista(request)
+        registrar(vista, segundos, medicion, error=response.status_code >= 500)
+        if medicion.repetidas >= self.umbral_repetidas:
+            sql, veces = max(medicion.sentencias.items(), key=lambda par: par[1])
+            logger.warning('%s: %d consultas, %d repetidas (%d veces: %.200s)',
+                           vista, medicion.consultas, medicion.repetidas, veces, sql)
+        if settings.DEBUG:
+            response['Server-Timing'] = _server_timing(segundos, medicion)
+        return response
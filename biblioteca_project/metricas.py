@@ -0,0 +1,293 @@
+"""
+Endpoint /metrics en formato de texto de Prometheus
+
+Publica lo que ya miden instrumentacion.py (peticiones, errores, duración,
+tiempo en BD y consultas por vista REST/HTML y por operación SOAP), los
+pools de conexiones (db/pool.py) y la caché de libros/cache.py.
+
+Cada worker de gunicorn es un proceso con sus propios contadores. Para que
+Prometheus vea el total, con settings.METRICAS_DIR (gunicorn.conf.py lo fija)
+cada proceso escribe periódicamente una instantánea JSON en ese directorio y
+el proceso que atiende /metrics suma las de todos:
+
+- los contadores (peticiones, cubos del histograma, aciertos...) se suman,
+  también los de procesos ya terminados (reciclados por max_requests): sus
+  ficheros se acumulan en acumulado.json para que los totales no retrocedan,
+- los valores instantáneos (conexiones en uso, libres, esperando) solo se
+  toman de procesos vivos.
+
+Las instantáneas tienen hasta METRICAS_INTERVALO segundos de antigüedad,
+salvo la del proceso que responde. Sin METRICAS_DIR (runserver, tests) solo
+se publica el proceso actual.
+"""
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from biblioteca_project import instrumentacion
+from libros import cache
+
+# Segundos entre dos instantáneas de un proceso
+METRICAS_INTERVALO = 5
+
+ACUMULADO = 'acumulado.json'
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Valores del pool que describen el momento actual y no se acumulan
+ESTADO_POOL = ('tamano_maximo', 'en_uso', 'libres', 'esperando')
+
+
+# ===== INSTANTÁNEAS =====
+
+def instantanea():
+    """Contadores y estado de este proceso"""
+    from biblioteca_project.db.mysql.base import pools
+    return {
+        'pid': os.getpid(),
+        'vistas': instrumentacion.estadisticas(),
+        'cache': cache.estadisticas_uso(),
+        'pools': {alias: pool.estadisticas() for alias, pool in pools().items()},
+    }
+
+
+def _vacia():
+    return {'vistas': {}, 'cache': {}, 'pools': {}, 'procesos': 0}
+
+
+def combinar(total, otra, vivo=True):
+    """Suma la instantánea `otra` a `total`; de procesos muertos solo cuentan los contadores"""
+    for vista, serie in otra['vistas'].items():
+        destino = total['vistas'].get(vista)
+        if destino is None:
+            total['vistas'][vista] = {**serie, 'cubos': list(serie['cubos'])}
+            continue
+        for campo, valor in serie.items():
+            if campo == 'cubos':
+                destino['cubos'] = [a + b for a, b in zip(destino['cubos'], valor)]
+            elif campo == 'max_consultas':
+                destino[campo] = max(destino[campo], valor)
+            else:
+                destino[campo] += valor
+    for grupo, contadores in otra['cache'].items():
+        destino = total['cache'].setdefault(grupo, {'aciertos': 0, 'fallos': 0})
+        for campo, valor in contadores.items():
+            destino[campo] += valor
+    for alias, estado in otra['pools'].items():
+        destino = total['pools'].setdefault(alias, {})
+        for campo, valor in estado.items():
+            if campo in ESTADO_POOL and not vivo:
+                continue
+            destino[campo] = destino.get(campo, 0) + valor
+    total['procesos'] += vivo
+    return total
+
+
+# ===== PUBLICACIÓN ENTRE PROCESOS =====
+
+_fichero_propio = None
+_publicador = None
+_bloqueo_publicador = threading.Lock()
+
+
+def _directorio():
+    directorio = getattr(settings, 'METRICAS_DIR', None)
+    return Path(directorio) if directorio else None
+
+
+def _escribir_json(ruta, datos):
+    # Escritura atómica: quien lea ve el fichero anterior o el nuevo entero
+    temporal = ruta.with_name(f'.{ruta.name}.tmp')
+    temporal.write_text(json.dumps(datos), encoding='utf-8')
+    os.replace(temporal, ruta)
+
+
+def publicar():
+    """Escribe la instantánea de este proceso en METRICAS_DIR"""
+    global _fichero_propio
+    directorio = _directorio()
+    if directorio is None:
+        return
+    if _fichero_propio is None:
+        # El instante de arranque distingue dos procesos que reciban el mismo pid
+        _fichero_propio = f'{os.getpid()}-{time.time_ns()}.json'
+    directorio.mkdir(parents=True, exist_ok=True)
+    _escribir_json(directorio / _fichero_propio, instantanea())
+
+
+def _publicar_periodicamente():
+    while True:
+        time.sleep(METRICAS_INTERVALO)
+        try:
+            publicar()
+        except OSError:
+            pass
+
+
+def asegurar_publicador():
+    """Arranca (una vez por proceso) el hilo que publica las instantáneas"""
+    global _publicador
+    if _publicador is not None or _directorio() is None:
+        return
+    with _bloqueo_publicador:
+        if _publicador is None:
+            _publicador = threading.Thread(target=_publicar_periodicamente,
+                                           name='metricas', daemon=True)
+            _publicador.start()
+            atexit.register(publicar)
+
+
+def _al_bifurcar():
+    # El hilo no sobrevive al fork y el fichero es del proceso padre
+    global _fichero_propio, _publicador
+    _fichero_propio = None
+    _publicador = None
+
+
+os.register_at_fork(after_in_child=_al_bifurcar)
+
+
+def _vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _leer_json(ruta):
+    try:
+        return json.loads(ruta.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+
+def recoger():
+    """Totales de todos los procesos (o solo de este, sin METRICAS_DIR)"""
+    directorio = _directorio()
+    if directorio is None:
+        return combinar(_vacia(), instantanea())
+
+    publicar()
+    total = _vacia()
+    with open(directorio / '.bloqueo', 'w') as bloqueo:
+        fcntl.flock(bloqueo, fcntl.LOCK_EX)
+        ruta_acumulado = directorio / ACUMULADO
+        acumulado = _leer_json(ruta_acumulado) or _vacia()
+        muertos = []
+        for ruta in directorio.glob('*-*.json'):
+            datos = _leer_json(ruta)
+            if datos is None:
+                continue
+            if _vivo(datos['pid']):
+                combinar(total, datos)
+            else:
+                combinar(acumulado, datos, vivo=False)
+                muertos.append(ruta)
+        if muertos:
+            _escribir_json(ruta_acumulado, acumulado)
+            for ruta in muertos:
+                ruta.unlink(missing_ok=True)
+    return combinar(total, acumulado, vivo=False)
+
+
+# ===== FORMATO DE PROMETHEUS =====
+
+def _etiquetas(**etiquetas):
+    def escapar(valor):
+        return str(valor).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return '{' + ','.join(f'{nombre}="{escapar(valor)}"' for nombre, valor in etiquetas.items()) + '}'
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Texto:
+    def __init__(self):
+        self.lineas = []
+
+    def metrica(self, nombre, tipo, ayuda, muestras):
+        """muestras: pares (sufijo + etiquetas, valor)"""
+        self.lineas.append(f'# HELP {nombre} {ayuda}')
+        self.lineas.append(f'# TYPE {nombre} {tipo}')
+        for sufijo, valor in muestras:
+            self.lineas.append(f'{nombre}{sufijo} {_numero(valor)}')
+
+    def __str__(self):
+        return '\n'.join(self.lineas) + '\n'
+
+
+def formatear(total):
+    """Texto de exposición de Prometheus de los totales de recoger()"""
+    texto = _Texto()
+    vistas = sorted(total['vistas'].items())
+
+    def por_vista(campo, sufijo=''):
+        return [(f'{sufijo}{_etiquetas(vista=vista)}', serie[campo]) for vista, serie in vistas]
+
+    texto.metrica('biblioteca_peticiones_total', 'counter',
+                  'Peticiones atendidas por vista REST/HTML u operación SOAP',
+                  por_vista('peticiones'))
+    texto.metrica('biblioteca_peticiones_errores_total', 'counter',
+                  'Peticiones terminadas en error 5xx o excepción',
+                  por_vista('errores'))
+
+    histograma = []
+    limites = [repr(ms / 1000) for ms in instrumentacion.CUBOS_MS] + ['+Inf']
+    for vista, serie in vistas:
+        acumulado = 0
+        for limite, cantidad in zip(limites, serie['cubos']):
+            acumulado += cantidad
+            histograma.append((f'_bucket{_etiquetas(vista=vista, le=limite)}', acumulado))
+        histograma.append((f'_sum{_etiquetas(vista=vista)}', serie['segundos']))
+        histograma.append((f'_count{_etiquetas(vista=vista)}', serie['peticiones']))
+    texto.metrica('biblioteca_peticion_duracion_segundos', 'histogram',
+                  'Duración de las peticiones', histograma)
+
+    texto.metrica('biblioteca_peticion_bd_segundos_total', 'counter',
+                  'Segundos esperando a la base de datos', por_vista('segundos_bd'))
+    texto.metrica('biblioteca_consultas_total', 'counter',
+                  'Consultas SQL ejecutadas', por_vista('consultas'))
+    texto.metrica('biblioteca_peticiones_con_consultas_repetidas_total', 'counter',
+                  'Peticiones que repitieron alguna sentencia SQL (posible N+1)',
+                  por_vista('con_repetidas'))
+
+    grupos = sorted(total['cache'].items())
+    texto.metrica('biblioteca_cache_aciertos_total', 'counter', 'Lecturas de caché encontradas',
+                  [(_etiquetas(grupo=grupo), c['aciertos']) for grupo, c in grupos])
+    texto.metrica('biblioteca_cache_fallos_total', 'counter', 'Lecturas de caché recalculadas',
+                  [(_etiquetas(grupo=grupo), c['fallos']) for grupo, c in grupos])
+    texto.metrica('biblioteca_cache_ratio_aciertos', 'gauge',
+                  'Aciertos entre lecturas de caché desde el arranque',
+                  [(_etiquetas(grupo=grupo), c['aciertos'] / (c['aciertos'] + c['fallos']))
+                   for grupo, c in grupos if c['aciertos'] + c['fallos']])
+
+    pools = sorted(total['pools'].items())
+    texto.metrica('biblioteca_pool_conexiones', 'gauge',
+                  'Conexiones de los pools de los procesos vivos',
+                  [(_etiquetas(alias=alias, estado=estado), datos.get(estado, 0))
+                   for alias, datos in pools for estado in ('en_uso', 'libres', 'esperando')])
+    texto.metrica('biblioteca_pool_tamano_maximo', 'gauge',
+                  'Conexiones máximas sumando los procesos vivos',
+                  [(_etiquetas(alias=alias), datos.get('tamano_maximo', 0)) for alias, datos in pools])
+    for campo, ayuda in (('creadas', 'Conexiones abiertas'),
+                         ('reutilizadas', 'Conexiones entregadas desde el pool'),
+                         ('descartadas', 'Conexiones cerradas por caducadas o rotas'),
+                         ('esperas', 'Veces que se esperó una conexión libre'),
+                         ('agotado', 'Esperas que terminaron sin conexión'),
+                         ('segundos_esperando', 'Segundos esperando una conexión libre')):
+        texto.metrica(f'biblioteca_pool_{campo}_total', 'counter', ayuda,
+                      [(_etiquetas(alias=alias), datos.get(campo, 0)) for alias, datos in pools])
+
+    texto.metrica('biblioteca_procesos', 'gauge', 'Procesos vivos que publican métricas',
+                  [('', total['procesos'])])
+    return str(texto)
+
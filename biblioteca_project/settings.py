@@ -10,6 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import ipaddress
+import os
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,7 +49,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primero, para que el tiempo medido incluya el resto de middleware
+    "biblioteca_project.instrumentacion.InstrumentacionMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "biblioteca_project.db.replicas.ReplicasMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -91,9 +97,16 @@ WSGI_APPLICATION = "biblioteca_project.wsgi.application"
 # }
 
 
+# Conexiones: con DB_POOL=1 (por defecto) cada proceso comparte entre sus
+# hilos un pool de conexiones MySQL (biblioteca_project/db/pool.py) y Django
+# las "cierra" al final de cada petición devolviéndolas al pool. Con
+# DB_POOL=0 cada hilo mantiene su propia conexión persistente durante
+# DB_CONN_MAX_AGE segundos.
+DB_POOL = os.environ.get('DB_POOL', '1') == '1'
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'biblioteca_project.db.mysql' if DB_POOL else 'django.db.backends.mysql',
         'NAME': 'biblioteca_dbutres',
         'USER': 'root',
         'PASSWORD': '',  # ← Cambia esto por tu contraseña
@@ -103,9 +116,113 @@ DATABASES = {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
             'charset': 'utf8mb4',
         },
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        # Comprueba las conexiones persistentes antes de reutilizarlas
+        'CONN_HEALTH_CHECKS': True,
+        'POOL': {
+            'TAMANO_MAXIMO': int(os.environ.get('DB_POOL_TAMANO', 10)),
+            'VIDA_MAXIMA': 1800,  # segundos, por debajo del wait_timeout de MySQL
+            'ESPERA_MAXIMA': 10,  # segundos esperando una conexión libre
+            'VALIDAR_TRAS': 30,  # segundos libre tras los que se hace ping
+        },
     }
 }
 
+# Réplicas de lectura: DB_REPLICAS=host1,host2 añade una base de datos por
+# host con los mismos datos de acceso que el primario. El router manda las
+# lecturas a las réplicas y las escrituras al primario (ver
+# biblioteca_project/db/replicas.py).
+DATABASE_REPLICAS = []
+for numero, host in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    alias = f'replica{numero}'
+    DATABASES[alias] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+
+# Sin MySQL (DB_SQLITE=1): dos archivos SQLite hacen de primario y réplica.
+# No hay replicación: copiar db.sqlite3 sobre db_replica.sqlite3 la simula.
+if os.environ.get('DB_SQLITE') == '1':
+    DATABASES = {
+        'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'db.sqlite3'},
+        'replica1': {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'db_replica.sqlite3',
+            'TEST': {'MIRROR': 'default'},
+        },
+    }
+    DATABASE_REPLICAS = ['replica1']
+
+DATABASE_ROUTERS = ['biblioteca_project.db.replicas.RouterReplicas']
+
+# Segundos que un cliente sigue leyendo del primario después de escribir
+# (deben cubrir el retraso habitual de la replicación)
+REPLICA_RETARDO_MAXIMO = 5
+
+# IPs o redes (CIDR) que pueden consultar los endpoints internos
+# (/interno/..., /metrics) sin ser staff, separadas por comas:
+# INTERNAL_IPS=127.0.0.1,172.28.0.0/16. Con docker-compose Prometheus y los
+# operadores llegan desde otros contenedores, así que se añade la red de
+# biblioteca_network; nginx también está en esa red, pero bloquea esas rutas
+# (ver los deny de nginx.conf), de modo que lo que entra por él no las alcanza.
+INTERNAL_IPS = [ip.strip() for ip in os.environ.get('INTERNAL_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+# Las mismas, ya interpretadas: un valor mal escrito impide arrancar en lugar
+# de dar un 500 en cada petición a los endpoints internos
+REDES_INTERNAS = [ipaddress.ip_network(ip, strict=False) for ip in INTERNAL_IPS]
+
+
+# Caché
+# Con REDIS_URL (p. ej. redis://redis:6379/1) todas las réplicas comparten
+# la caché de Redis; sin ella se usa memoria local del proceso, que no ve
+# las invalidaciones de otros procesos (gunicorn.conf.py arranca entonces un
+# solo worker).
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'biblioteca',
+            'TIMEOUT': 300,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'biblioteca',
+            'TIMEOUT': 300,
+        }
+    }
+
+# Segundos que se guardan los datos de referencia (se invalidan al
+# modificarlos) y los contadores del panel (cambian con cada préstamo). Con
+# la caché en memoria del proceso el catálogo usa los 300 s por defecto,
+# que acotan lo que dura un dato cambiado desde otro proceso.
+CACHE_TIMEOUT_CATALOGO = 3600 if REDIS_URL else 300
+CACHE_TIMEOUT_PANEL = 30
+
+# Segundos tras los que cada proceso reconstruye (en segundo plano) su
+# índice de autocompletado, para recoger los cambios hechos en otras réplicas
+AUTOCOMPLETADO_TTL = 300
+
+# Medición por vista de tiempo, tiempo en BD y consultas (ver
+# biblioteca_project/instrumentacion.py). Con DEBUG las respuestas llevan la
+# cabecera Server-Timing
+INSTRUMENTACION_ACTIVA = os.environ.get('INSTRUMENTACION_ACTIVA', '1') == '1'
+# Consultas repetidas (misma SQL) en una petición a partir de las que se avisa
+INSTRUMENTACION_UMBRAL_REPETIDAS = 10
+
+# Directorio en el que cada proceso deja sus métricas para que /metrics sume
+# las de todos los workers (ver biblioteca_project/metricas.py). Sin él
+# /metrics solo muestra el proceso que responde
+METRICAS_DIR = os.environ.get('METRICAS_DIR') or None
+
+# Máximo de filas de los listados SOAP completos (listar_libros...); con más
+# responden con el Fault Client.DemasiadosResultados. Sin valor (por defecto)
+# devuelven todas las filas, como siempre, construyendo la respuesta entera
+# en memoria. Activarlo cambia el contrato para los clientes existentes.
+SOAP_LIMITE_LISTADO_COMPLETO = int(os.environ.get('SOAP_LIMITE_LISTADO_COMPLETO') or 0) or None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -169,4 +286,19 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    # JSON con orjson y MessagePack (application/msgpack o ?format=msgpack)
+    # si están instalados (ver libros/renderizadores.py); si no, el JSON de DRF
+    'DEFAULT_RENDERER_CLASSES': [
+        'libros.renderizadores.ORJSONRenderer' if find_spec('orjson')
+        else 'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        *(['libros.renderizadores.MessagePackRenderer'] if find_spec('msgpack') else []),
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'libros.renderizadores.ORJSONParser' if find_spec('orjson')
+        else 'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        *(['libros.renderizadores.MessagePackParser'] if find_spec('msgpack') else []),
+    ],
 }
\ No newline at end of file
@@ -22,6 +22,10 @@ urlpatterns = [
     # API REST
     path('api/', include('libros.urls')),
     
+    # Endpoints internos (nginx no los publica)
+    path('interno/pool/', views.estado_pool, name='estado_pool'),
+    path('metrics', views.metricas, name='metricas'),
+    
     # Autenticación
     path('login/', auth_views.LoginView.as_view(template_name='login.html'), name='login'),
     path('logout/', auth_views.LogoutView.as_view(next_page='/'), name='logout'),
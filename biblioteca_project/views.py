@@ -1,13 +1,18 @@
+import ipaddress
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django.shortcuts import render
-from libros.models import Libro, Autor, Categoria, Prestamo
+from libros.cache import totales_panel
 
 def home(request):
     """Vista de la página principal"""
+    totales = totales_panel()
     context = {
-        'total_libros': Libro.objects.count(),
-        'total_autores': Autor.objects.count(),
-        'total_categorias': Categoria.objects.count(),
-        'total_prestamos': Prestamo.objects.filter(estado='activo').count(),
+        'total_libros': totales['total_libros'],
+        'total_autores': totales['total_autores'],
+        'total_categorias': totales['total_categorias'],
+        'total_prestamos': totales['prestamos_activos'],
     }
     return render(request, 'home.html', context)
 
@@ -18,4 +23,38 @@ def ejemplos_soap(request):
     return render(request, 'ejemplos_soap.html')
 
 def ejemplos_admin(request):
-    return render(request, 'ejemplos_admin.html')
\ No newline at end of file
+    return render(request, 'ejemplos_admin.html')
+
+def es_peticion_interna(request):
+    """Staff o petición desde una de las IPs o redes de settings.INTERNAL_IPS (REDES_INTERNAS)"""
+    if request.user.is_staff:
+        return True
+    try:
+        ip = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(ip in red for red in settings.REDES_INTERNAS)
+
+def estado_pool(request):
+    """Estadísticas del pool de conexiones de este proceso (endpoint interno)"""
+    if not es_peticion_interna(request):
+        return HttpResponseForbidden()
+    from biblioteca_project.db.mysql.base import pools
+    activos = pools()
+    bases = {}
+    for alias, configuracion in settings.DATABASES.items():
+        pool = activos.get(alias)
+        bases[alias] = {
+            'engine': configuracion['ENGINE'],
+            'conn_max_age': configuracion.get('CONN_MAX_AGE', 0),
+            # None hasta que el proceso abre la primera conexión
+            'pool': pool.estadisticas() if pool else None,
+        }
+    return JsonResponse({'bases_de_datos': bases})
+
+def metricas(request):
+    """Métricas de todos los workers en formato de Prometheus (endpoint interno)"""
+    if not es_peticion_interna(request):
+        return HttpResponseForbidden()
+    from biblioteca_project import metricas
+    return HttpResponse(metricas.formatear(metricas.recoger()), content_type=metricas.TIPO_CONTENIDO)
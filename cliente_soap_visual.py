@@ -563,6 +563,102 @@ def listar_categorias(client):
     except Exception as e:
         print(f"\n❌ Error: {e}")
 
+def leer_ids(mensaje):
+    """Lee una lista de IDs separados por comas"""
+    return [int(valor) for valor in input(mensaje).split(',') if valor.strip()]
+
+def obtener_varios_libros(client):
+    """Obtiene varios libros por ID en una sola llamada"""
+    print("\n" + "="*80)
+    print("🔍 OBTENER VARIOS LIBROS POR ID")
+    print("="*80)
+    
+    try:
+        libro_ids = leer_ids("\nIDs de los libros (separados por comas): ")
+        result = client.service.obtener_libros({'integer': libro_ids})
+        
+        for resultado in result or []:
+            if resultado.encontrado:
+                libro = resultado.libro
+                print(f"✅ [{libro.id}] {libro.titulo} - {libro.autor.nombre} {libro.autor.apellido} "
+                      f"(Stock: {libro.stock_disponible}/{libro.stock_total})")
+            else:
+                print(f"⚠️  [{resultado.id}] No encontrado")
+        
+        if preguntar_ver_xml():
+            request_xml = etree.tostring(history.last_sent['envelope'], encoding='unicode', pretty_print=True)
+            response_xml = etree.tostring(history.last_received['envelope'], encoding='unicode', pretty_print=True)
+            mostrar_xml_en_navegador(request_xml, response_xml, "obtener_libros")
+            
+    except ValueError:
+        print("\n❌ Error: Debe ingresar números válidos")
+    except Fault as e:
+        print(f"\n❌ Error SOAP: {e}")
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+
+def crear_varios_prestamos(client):
+    """Crea varios préstamos para un usuario en una sola llamada"""
+    print("\n" + "="*80)
+    print("➕ CREAR VARIOS PRÉSTAMOS")
+    print("="*80)
+    
+    try:
+        libro_ids = leer_ids("\nIDs de los libros (separados por comas): ")
+        usuario_id = int(input("ID del usuario: "))
+        dias = int(input("Días de préstamo (ej: 14): "))
+        atomico = input("¿Todos o ninguno? (s/n): ").strip().lower() == 's'
+        
+        solicitudes = [{'libro_id': libro_id, 'usuario_id': usuario_id, 'dias_prestamo': dias}
+                       for libro_id in libro_ids]
+        result = client.service.crear_prestamos_lote({'SolicitudPrestamoModel': solicitudes}, atomico)
+        
+        for libro_id, resultado in zip(libro_ids, result or []):
+            if resultado.exito:
+                print(f"✅ Libro {libro_id}: {resultado.mensaje} (préstamo {resultado.id})")
+            else:
+                print(f"❌ Libro {libro_id}: {resultado.mensaje}")
+        
+        if preguntar_ver_xml():
+            request_xml = etree.tostring(history.last_sent['envelope'], encoding='unicode', pretty_print=True)
+            response_xml = etree.tostring(history.last_received['envelope'], encoding='unicode', pretty_print=True)
+            mostrar_xml_en_navegador(request_xml, response_xml, "crear_prestamos_lote")
+            
+    except ValueError:
+        print("\n❌ Error: Debe ingresar números válidos")
+    except Fault as e:
+        print(f"\n❌ Error SOAP: {e}")
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+
+def devolver_varios_libros(client):
+    """Registra la devolución de varios préstamos en una sola llamada"""
+    print("\n" + "="*80)
+    print("📥 DEVOLVER VARIOS LIBROS")
+    print("="*80)
+    
+    try:
+        prestamo_ids = leer_ids("\nIDs de los préstamos (separados por comas): ")
+        result = client.service.devolver_libros_lote({'integer': prestamo_ids})
+        
+        for prestamo_id, resultado in zip(prestamo_ids, result or []):
+            if resultado.exito:
+                print(f"✅ Préstamo {prestamo_id}: {resultado.mensaje}")
+            else:
+                print(f"❌ Préstamo {prestamo_id}: {resultado.mensaje}")
+        
+        if preguntar_ver_xml():
+            request_xml = etree.tostring(history.last_sent['envelope'], encoding='unicode', pretty_print=True)
+            response_xml = etree.tostring(history.last_received['envelope'], encoding='unicode', pretty_print=True)
+            mostrar_xml_en_navegador(request_xml, response_xml, "devolver_libros_lote")
+            
+    except ValueError:
+        print("\n❌ Error: Debe ingresar números válidos")
+    except Fault as e:
+        print(f"\n❌ Error SOAP: {e}")
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+
 def mostrar_menu():
     """Muestra el menú principal"""
     print("\n" + "="*80)
@@ -583,6 +679,10 @@ def mostrar_menu():
     print("\n👥 OPERACIONES DE CATÁLOGOS:")
     print(" 11. Listar autores")
     print(" 12. Listar categorías")
+    print("\n📦 OPERACIONES EN LOTE:")
+    print(" 13. Obtener varios libros por ID")
+    print(" 14. Crear varios préstamos")
+    print(" 15. Devolver varios libros")
     print("\n  0. Salir")
     print("="*80)
 
@@ -605,6 +705,9 @@ def main():
         '10': listar_prestamos_activos,
         '11': listar_autores,
         '12': listar_categorias,
+        '13': obtener_varios_libros,
+        '14': crear_varios_prestamos,
+        '15': devolver_varios_libros,
     }
     
     while True:
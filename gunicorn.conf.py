@@ -0,0 +1,105 @@
+"""
+Configuración de Gunicorn para producción
+
+Uso:
+    gunicorn -c gunicorn.conf.py
+
+Todo se ajusta con variables de entorno (valores por defecto entre
+paréntesis):
+
+    SERVIDOR_APP           aplicación a servir (biblioteca_project.wsgi:application)
+    SERVIDOR_BIND          dirección de escucha (0.0.0.0:8000)
+    SERVIDOR_WORKERS       procesos (2 × CPUs + 1 con REDIS_URL, si no 1)
+    SERVIDOR_THREADS       hilos por proceso (4)
+    SERVIDOR_WORKER_CLASS  tipo de worker (gthread)
+    SERVIDOR_TIMEOUT       segundos antes de reiniciar un worker bloqueado (30)
+    SERVIDOR_MAX_REQUESTS  peticiones antes de reciclar un worker, 0 = nunca (2000)
+    SERVIDOR_PRELOAD       cargar Django antes de crear los workers (0)
+    SERVIDOR_ACCESSLOG     destino del registro de peticiones, vacío = ninguno (-)
+    METRICAS_DIR           instantáneas de métricas de los workers (/tmp/biblioteca-metricas)
+
+Para servir por ASGI (asgi.py) con uvicorn instalado:
+    SERVIDOR_APP=biblioteca_project.asgi:application
+    SERVIDOR_WORKER_CLASS=uvicorn.workers.UvicornWorker
+
+Recarga sin cortar peticiones: `kill -HUP <pid del maestro>` arranca
+workers nuevos con el código actual y deja terminar a los anteriores
+(hasta graceful_timeout). Con SERVIDOR_PRELOAD=1 el código se carga en el
+maestro y HUP no lo relee: para desplegar código nuevo hay que reiniciar
+el proceso, por eso viene desactivado.
+"""
+import multiprocessing
+import os
+import shutil
+
+
+def _entero(nombre, por_defecto):
+    return int(os.environ.get(nombre, por_defecto))
+
+
+wsgi_app = os.environ.get('SERVIDOR_APP', 'biblioteca_project.wsgi:application')
+bind = os.environ.get('SERVIDOR_BIND', '0.0.0.0:8000')
+
+# Las vistas pasan casi todo el tiempo esperando a MySQL: varios hilos por
+# proceso aprovechan esa espera sin multiplicar la memoria
+#
+# Sin REDIS_URL la caché es la memoria de cada proceso (settings.CACHES):
+# una invalidación del catálogo solo llegaría al worker que atendió la
+# escritura, y los demás servirían listados y ETag antiguos. Por eso sin
+# Redis se arranca un solo worker y no se admite pedir más.
+_cache_compartida = bool(os.environ.get('REDIS_URL'))
+workers = _entero('SERVIDOR_WORKERS', multiprocessing.cpu_count() * 2 + 1 if _cache_compartida else 1)
+if workers > 1 and not _cache_compartida:
+    raise RuntimeError(
+        f'SERVIDOR_WORKERS={workers} necesita una caché compartida: defina REDIS_URL '
+        '(la caché en memoria de cada worker no recibe las invalidaciones de los demás)'
+    )
+threads = _entero('SERVIDOR_THREADS', 4)
+worker_class = os.environ.get('SERVIDOR_WORKER_CLASS', 'gthread')
+
+timeout = _entero('SERVIDOR_TIMEOUT', 30)
+graceful_timeout = 30
+keepalive = 5
+
+# Reciclar workers de vez en cuando acota el crecimiento de memoria; el
+# jitter evita que todos se reinicien a la vez
+max_requests = _entero('SERVIDOR_MAX_REQUESTS', 2000)
+max_requests_jitter = max_requests // 10
+
+# Con preload los workers comparten (copy-on-write) el código ya importado,
+# a cambio de que HUP no cargue el código nuevo (ver arriba)
+preload_app = os.environ.get('SERVIDOR_PRELOAD', '0') == '1'
+
+# Registro de peticiones en la salida estándar (vacío para desactivarlo)
+accesslog = os.environ.get('SERVIDOR_ACCESSLOG', '-') or None
+errorlog = '-'
+# Detrás de nginx (ver nginx.conf)
+forwarded_allow_ips = '*'
+
+# Cada worker publica aquí sus métricas y /metrics las suma (ver
+# biblioteca_project/metricas.py). Se fija antes de cargar Django
+os.environ.setdefault('METRICAS_DIR', '/tmp/biblioteca-metricas')
+
+
+def on_starting(server):
+    # Los contadores empiezan de cero con cada arranque del maestro
+    shutil.rmtree(os.environ['METRICAS_DIR'], ignore_errors=True)
+
+
+def pre_fork(server, worker):
+    # Ninguna conexión abierta en el maestro debe heredarse en los workers
+    if server.cfg.preload_app:
+        from django.db import connections
+        from biblioteca_project.db.mysql.base import pools
+        connections.close_all()
+        for pool in pools().values():
+            pool.cerrar_todas()
+
+
+def post_worker_init(worker):
+    # El índice de autocompletado se construye antes de atender peticiones, no
+    # en la primera consulta (ver libros/autocompletado.py)
+    from django.apps import apps
+    if apps.ready:
+        from libros import autocompletado
+        autocompletado.precargar()
@@ -0,0 +1,298 @@
+"""
+Autocompletado por prefijo de títulos, autores y categorías
+
+Cada proceso mantiene en memoria, por tipo, un arreglo ordenado de
+registros "clave\\0texto\\0referencia", donde la clave es el texto
+normalizado (sin acentos, en minúsculas). Un prefijo se resuelve con una
+búsqueda binaria en el arreglo de cada tipo pedido y un recorrido de como
+mucho `limite` referencias en cada uno, sin consultar la base de datos; el
+filtro por tipo no tiene que saltarse los registros de los demás. Un solo
+str por entrada mantiene la memoria acotada (~120 bytes por título), frente
+a un trie de nodos Python que ocuparía varias veces más.
+
+Cada worker de gunicorn construye el índice al arrancar (post_worker_init en
+gunicorn.conf.py), antes de atender peticiones; fuera de gunicorn, o si la
+base de datos no estaba lista, se construye en la primera consulta. Las
+señales lo actualizan al confirmar cada cambio. Los cambios hechos en
+otras réplicas llegan con la reconstrucción periódica
+(settings.AUTOCOMPLETADO_TTL), que se hace en segundo plano mientras se
+sigue respondiendo con el índice anterior.
+"""
+import heapq
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+
+from .busqueda import normalizar
+from .models import Autor, Categoria, Libro
+
+TIPO_LIBRO = 'libro'
+TIPO_AUTOR = 'autor'
+TIPO_CATEGORIA = 'categoria'
+_CODIGOS = {TIPO_LIBRO: 'l', TIPO_AUTOR: 'a', TIPO_CATEGORIA: 'c'}
+_TIPOS = {codigo: tipo for tipo, codigo in _CODIGOS.items()}
+
+LONGITUD_CLAVE = 60
+LIMITE_POR_DEFECTO = 10
+LIMITE_MAXIMO = 50
+TTL = getattr(settings, 'AUTOCOMPLETADO_TTL', 300)
+
+_SEPARADOR = '\0'
+_PATRON_PALABRA = re.compile(r'[a-z0-9]+')
+
+logger = logging.getLogger(__name__)
+
+
+def clave(texto):
+    """Texto normalizado por el que se busca: sin acentos ni signos"""
+    return ' '.join(_PATRON_PALABRA.findall(normalizar(texto)))[:LONGITUD_CLAVE]
+
+
+def _textos_autor(nombre, apellido):
+    # Se indexa por nombre y por apellido para completar cualquiera de los dos
+    return (f'{nombre} {apellido}', f'{apellido} {nombre}')
+
+
+def _registros_de(tipo, objeto_id, textos):
+    referencia = f'{_CODIGOS[tipo]}{objeto_id}'
+    for texto in textos:
+        clave_texto = clave(texto)
+        if clave_texto:
+            yield f'{clave_texto}{_SEPARADOR}{texto}{_SEPARADOR}{referencia}'
+
+
+def _codigo(registro):
+    # Código del tipo: primer carácter de la referencia, tras el último separador
+    return registro[registro.rindex(_SEPARADOR) + 1]
+
+
+def _leer_catalogo(tamano_lote=5000):
+    """Registros de todos los libros, autores y categorías"""
+    libros = Libro.objects.order_by().values_list('id', 'titulo')
+    for libro_id, titulo in libros.iterator(chunk_size=tamano_lote):
+        yield from _registros_de(TIPO_LIBRO, libro_id, (titulo,))
+    for autor_id, nombre, apellido in Autor.objects.order_by().values_list('id', 'nombre', 'apellido'):
+        yield from _registros_de(TIPO_AUTOR, autor_id, _textos_autor(nombre, apellido))
+    for categoria_id, nombre in Categoria.objects.order_by().values_list('id', 'nombre'):
+        yield from _registros_de(TIPO_CATEGORIA, categoria_id, (nombre,))
+
+
+class IndiceAutocompletado:
+    """Arreglos ordenados de registros, uno por tipo, con búsqueda por prefijo"""
+
+    def __init__(self):
+        self._registros = {codigo: [] for codigo in _TIPOS}
+        self._bloqueo = threading.Lock()
+        self._pendientes = None  # cambios recibidos durante una reconstrucción
+        self.construido_en = None
+
+    def __len__(self):
+        return sum(len(registros) for registros in self._registros.values())
+
+    @property
+    def construido(self):
+        return self.construido_en is not None
+
+    def construir(self, registros=None):
+        """Reconstruye el índice (por defecto, desde la base de datos)"""
+        with self._bloqueo:
+            self._pendientes = []
+        try:
+            nuevos = {codigo: [] for codigo in _TIPOS}
+            for registro in sorted(set(_leer_catalogo() if registros is None else registros)):
+                nuevos[_codigo(registro)].append(registro)
+        except Exception:
+            with self._bloqueo:
+                self._pendientes = None
+            raise
+        with self._bloqueo:
+            for quitar, registros_cambio in self._pendientes:
+                for registro in registros_cambio:
+                    self._aplicar(nuevos, registro, quitar)
+            self._pendientes = None
+            self._registros = nuevos
+            self.construido_en = time.monotonic()
+
+    def _aplicar(self, registros, registro, quitar):
+        registros = registros[_codigo(registro)]
+        i = bisect_left(registros, registro)
+        existe = i < len(registros) and registros[i] == registro
+        if quitar and existe:
+            del registros[i]
+        elif not quitar and not existe:
+            registros.insert(i, registro)
+
+    def _cambiar(self, registros, quitar):
+        registros = list(registros)
+        with self._bloqueo:
+            for registro in registros:
+                self._aplicar(self._registros, registro, quitar)
+            if self._pendientes is not None:
+                self._pendientes.append((quitar, registros))
+
+    def agregar(self, tipo, objeto_id, *textos):
+        self._cambiar(_registros_de(tipo, objeto_id, textos), quitar=False)
+
+    def quitar(self, tipo, objeto_id, *textos):
+        self._cambiar(_registros_de(tipo, objeto_id, textos), quitar=True)
+
+    def buscar(self, prefijo, limite=LIMITE_POR_DEFECTO, tipos=None):
+        """
+        Hasta `limite` coincidencias del prefijo, en orden alfabético, como
+        diccionarios {tipo, id, texto}. `tipos` restringe los tipos devueltos.
+        """
+        prefijo = clave(prefijo)
+        if not prefijo:
+            return []
+        codigos = _TIPOS if not tipos else [_CODIGOS[tipo] for tipo in _CODIGOS if tipo in tipos]
+        coincidencias = heapq.merge(*(
+            self._coincidencias(self._registros[codigo], prefijo, limite) for codigo in codigos
+        ))
+        resultados = []
+        for registro in coincidencias:
+            _, texto, referencia = registro.split(_SEPARADOR)
+            resultados.append({'tipo': _TIPOS[referencia[0]], 'id': int(referencia[1:]), 'texto': texto})
+            if len(resultados) == limite:
+                break
+        return resultados
+
+    @staticmethod
+    def _coincidencias(registros, prefijo, limite):
+        """
+        Registros de un tipo que empiezan por el prefijo, uno por referencia y
+        como mucho `limite`. Cada referencia tiene pocos registros (dos los
+        autores), así que se examinan del orden de `limite` registros.
+        """
+        vistos = set()
+        i = bisect_left(registros, prefijo)
+        while i < len(registros) and len(vistos) < limite:
+            registro = registros[i]
+            if not registro.startswith(prefijo):
+                return
+            i += 1
+            referencia = registro[registro.rindex(_SEPARADOR) + 1:]
+            if referencia not in vistos:
+                vistos.add(referencia)
+                yield registro
+
+indice = IndiceAutocompletado()
+_reconstruyendo = threading.Lock()
+
+
+def _reconstruir_en_segundo_plano():
+    try:
+        indice.construir()
+    finally:
+        connections.close_all()
+        _reconstruyendo.release()
+
+
+def obtener_indice():
+    """El índice del proceso, construido o refrescado si hace falta"""
+    if not indice.construido:
+        with _reconstruyendo:
+            if not indice.construido:
+                indice.construir()
+    elif time.monotonic() - indice.construido_en > TTL and _reconstruyendo.acquire(blocking=False):
+        threading.Thread(target=_reconstruir_en_segundo_plano, daemon=True).start()
+    return indice
+
+
+def precargar():
+    """
+    Construye el índice del proceso antes de la primera consulta. Si la base
+    de datos aún no está disponible (o sin migrar) se deja para entonces.
+    """
+    try:
+        with _reconstruyendo:
+            if not indice.construido:
+                indice.construir()
+    except DatabaseError as e:
+        logger.warning('No se pudo construir el índice de autocompletado al arrancar: %s', e)
+    finally:
+        connections.close_all()
+
+
+def autocompletar(prefijo, limite=LIMITE_POR_DEFECTO, tipos=None):
+    """Sugerencias para `prefijo` (ver IndiceAutocompletado.buscar)"""
+    return obtener_indice().buscar(prefijo, min(limite, LIMITE_MAXIMO), tipos)
+
+
+# ===== ACTUALIZACIÓN DESDE SEÑALES =====
+
+def _al_confirmar(funcion):
+    # Si el índice aún no existe se construirá con los datos ya confirmados
+    if indice.construido:
+        transaction.on_commit(funcion)
+
+
+def libro_guardado(libro):
+    libro_id, anterior, actual = libro.id, getattr(libro, '_titulo_original', None), libro.titulo
+    if anterior != actual:
+        def actualizar():
+            if anterior is not None:
+                indice.quitar(TIPO_LIBRO, libro_id, anterior)
+            indice.agregar(TIPO_LIBRO, libro_id, actual)
+        _al_confirmar(actualizar)
+    libro._titulo_original = actual
+
+
+def libros_guardados(libros):
+    """libro_guardado para muchos libros, con un solo callback al confirmar"""
+    cambios = [(libro.id, getattr(libro, '_titulo_original', None), libro.titulo)
+               for libro in libros if getattr(libro, '_titulo_original', None) != libro.titulo]
+    if cambios:
+        def actualizar():
+            for libro_id, anterior, actual in cambios:
+                if anterior is not None:
+                    indice.quitar(TIPO_LIBRO, libro_id, anterior)
+                indice.agregar(TIPO_LIBRO, libro_id, actual)
+        _al_confirmar(actualizar)
+    for libro in libros:
+        libro._titulo_original = libro.titulo
+
+
+def libro_eliminado(libro):
+    # El id se copia ya: Django lo pone a None al terminar el borrado
+    libro_id, titulo = libro.id, getattr(libro, '_titulo_original', libro.titulo)
+    _al_confirmar(lambda: indice.quitar(TIPO_LIBRO, libro_id, titulo))
+
+
+def autor_guardado(autor):
+    autor_id, anterior = autor.id, getattr(autor, '_nombre_original', None)
+    actual = (autor.nombre, autor.apellido)
+    if anterior != actual:
+        def actualizar():
+            if anterior is not None:
+                indice.quitar(TIPO_AUTOR, autor_id, *_textos_autor(*anterior))
+            indice.agregar(TIPO_AUTOR, autor_id, *_textos_autor(*actual))
+        _al_confirmar(actualizar)
+    autor._nombre_original = actual
+
+
+def autor_eliminado(autor):
+    autor_id = autor.id
+    nombre = getattr(autor, '_nombre_original', (autor.nombre, autor.apellido))
+    _al_confirmar(lambda: indice.quitar(TIPO_AUTOR, autor_id, *_textos_autor(*nombre)))
+
+
+def categoria_guardada(categoria):
+    categoria_id, anterior = categoria.id, getattr(categoria, '_nombre_original', None)
+    actual = categoria.nombre
+    if anterior != actual:
+        def actualizar():
+            if anterior is not None:
+                indice.quitar(TIPO_CATEGORIA, categoria_id, anterior)
+            indice.agregar(TIPO_CATEGORIA, categoria_id, actual)
+        _al_confirmar(actualizar)
+    categoria._nombre_original = actual
+
+
+def categoria_eliminada(categoria):
+    categoria_id, nombre = categoria.id, getattr(categoria, '_nombre_original', categoria.nombre)
+    _al_confirmar(lambda: indice.quitar(TIPO_CATEGORIA, categoria_id, nombre))
@@ -0,0 +1,276 @@
+"""
+Búsqueda de libros por texto compartida por las vistas HTML, la API REST y
+el servicio SOAP
+
+Los títulos, ISBN y nombres de autor se parten en términos normalizados (en
+minúsculas y sin acentos) que se guardan en la tabla TerminoBusqueda, un
+índice invertido con índice B-tree sobre (termino, campo, libro). Cada
+término de la consulta se resuelve como un rango sobre ese índice en lugar
+de un LIKE '%q%' que recorre toda la tabla de libros. Funciona igual en
+MySQL y en SQLite, y las señales mantienen el índice al día.
+
+Dos casos no pasan por los términos: un ISBN escrito por partes
+("978-84-206") se busca como un solo término, el ISBN completo, y una
+consulta cuyos términos tienen todos menos de 3 caracteres ("qu", "84") se
+resuelve sobre la tabla de libros (icontains en título y autor,
+isbn__startswith en el ISBN).
+"""
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Max, Q, Sum, Value, When
+from rest_framework.filters import SearchFilter
+
+from .models import Libro, TerminoBusqueda
+
+CAMPO_TITULO = TerminoBusqueda.CAMPO_TITULO
+CAMPO_AUTOR = TerminoBusqueda.CAMPO_AUTOR
+CAMPO_ISBN = TerminoBusqueda.CAMPO_ISBN
+CAMPOS_LIBRO = (CAMPO_TITULO, CAMPO_AUTOR, CAMPO_ISBN)
+
+# Peso de cada campo en la relevancia; una coincidencia exacta cuenta doble
+PESOS = {CAMPO_TITULO: 3, CAMPO_AUTOR: 2, CAMPO_ISBN: 3}
+
+LONGITUD_TERMINO = TerminoBusqueda._meta.get_field('termino').max_length
+# Los términos más cortos solo coinciden completos: un prefijo de una o dos
+# letras abarcaría buena parte del índice
+LONGITUD_MINIMA_PREFIJO = 3
+
+# Palabras tan frecuentes que no ayudan a distinguir libros; no se indexan
+PALABRAS_VACIAS = frozenset((
+    'a', 'al', 'con', 'de', 'del', 'el', 'en', 'la', 'las', 'lo', 'los',
+    'para', 'por', 'un', 'una', 'y', 'the', 'of', 'and',
+))
+
+_PATRON_TERMINO = re.compile(r'[a-z0-9]+')
+# Grupos de dígitos separados por guiones o espacios, como se escribe un ISBN
+_PATRON_ISBN = re.compile(r'\s*\d+(?:[\s-]+\d+)*(?:[\s-]*[xX])?\s*')
+
+
+# ===== NORMALIZACIÓN =====
+
+def normalizar(texto):
+    """Pasa el texto a minúsculas y le quita acentos y diacríticos"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def terminos(texto):
+    """Términos de búsqueda del texto, sin repetidos ni palabras vacías"""
+    vistos = []
+    for termino in _PATRON_TERMINO.findall(normalizar(texto)):
+        termino = termino[:LONGITUD_TERMINO]
+        if termino not in PALABRAS_VACIAS and termino not in vistos:
+            vistos.append(termino)
+    return vistos
+
+
+def termino_isbn(texto):
+    """El ISBN, sin separadores, si `texto` es un ISBN escrito por partes; si no, None"""
+    if not _PATRON_ISBN.fullmatch(texto or '') or not re.search(r'[\s-]', texto.strip()):
+        return None
+    return ''.join(_PATRON_TERMINO.findall(normalizar(texto)))[:LONGITUD_TERMINO]
+
+
+def terminos_de_libro(titulo, isbn, autor_nombre, autor_apellido):
+    """Pares (campo, termino) que indexan un libro"""
+    pares = [(CAMPO_TITULO, termino) for termino in terminos(titulo)]
+    pares += [(CAMPO_AUTOR, termino) for termino in terminos(f'{autor_nombre} {autor_apellido}')]
+    isbn = ''.join(_PATRON_TERMINO.findall(normalizar(isbn)))
+    if isbn:
+        pares.append((CAMPO_ISBN, isbn[:LONGITUD_TERMINO]))
+    return pares
+
+
+# ===== MANTENIMIENTO DEL ÍNDICE =====
+
+def _entradas(libro_id, pares):
+    return [TerminoBusqueda(libro_id=libro_id, campo=campo, termino=termino) for campo, termino in pares]
+
+
+@transaction.atomic
+def indexar_libro(libro):
+    """Vuelve a indexar un libro tras crearlo o modificarlo"""
+    TerminoBusqueda.objects.filter(libro_id=libro.id).delete()
+    autor = libro.autor
+    TerminoBusqueda.objects.bulk_create(_entradas(
+        libro.id, terminos_de_libro(libro.titulo, libro.isbn, autor.nombre, autor.apellido)
+    ))
+
+
+@transaction.atomic
+def indexar_libros(libros, nuevos=False, tamano_lote=1000):
+    """
+    indexar_libro para muchos libros (con el autor ya cargado): un DELETE y
+    los INSERT por bloques. Con `nuevos` no hay términos anteriores que borrar.
+    """
+    ids = [libro.id for libro in libros]
+    if not nuevos:
+        for inicio in range(0, len(ids), tamano_lote):
+            TerminoBusqueda.objects.filter(libro_id__in=ids[inicio:inicio + tamano_lote]).delete()
+    entradas = []
+    for libro in libros:
+        autor = libro.autor
+        entradas.extend(_entradas(
+            libro.id, terminos_de_libro(libro.titulo, libro.isbn, autor.nombre, autor.apellido)
+        ))
+    TerminoBusqueda.objects.bulk_create(entradas, batch_size=tamano_lote)
+
+
+@transaction.atomic
+def indexar_autor(autor, tamano_lote=1000):
+    """Actualiza los términos de autor de todos sus libros"""
+    TerminoBusqueda.objects.filter(campo=CAMPO_AUTOR, libro__autor_id=autor.id).delete()
+    pares = [(CAMPO_AUTOR, termino) for termino in terminos(f'{autor.nombre} {autor.apellido}')]
+    entradas = []
+    for libro_id in autor.libros.values_list('id', flat=True).iterator():
+        entradas.extend(_entradas(libro_id, pares))
+        if len(entradas) >= tamano_lote:
+            TerminoBusqueda.objects.bulk_create(entradas)
+            entradas = []
+    TerminoBusqueda.objects.bulk_create(entradas)
+
+
+@transaction.atomic
+def reconstruir_indice(tamano_lote=2000):
+    """Recalcula el índice completo; devuelve el número de libros indexados"""
+    TerminoBusqueda.objects.all().delete()
+    libros = Libro.objects.order_by().values_list(
+        'id', 'titulo', 'isbn', 'autor__nombre', 'autor__apellido'
+    )
+    total = 0
+    entradas = []
+    for libro_id, *campos in libros.iterator(chunk_size=tamano_lote):
+        entradas.extend(_entradas(libro_id, terminos_de_libro(*campos)))
+        total += 1
+        if len(entradas) >= tamano_lote:
+            TerminoBusqueda.objects.bulk_create(entradas)
+            entradas = []
+    TerminoBusqueda.objects.bulk_create(entradas)
+    return total
+
+
+# ===== CONSULTAS =====
+
+def _condicion(termino):
+    """Rango del índice que cubre el término (o su prefijo)"""
+    if len(termino) < LONGITUD_MINIMA_PREFIJO:
+        return Q(termino=termino)
+    # Los términos solo tienen [a-z0-9] y como mucho LONGITUD_TERMINO
+    # caracteres: completar con 'z' da el mayor término con ese prefijo. Se
+    # evita chr(+1) porque en las collations de MySQL los signos ordenan
+    # antes que letras y dígitos.
+    return Q(termino__gte=termino, termino__lte=termino.ljust(LONGITUD_TERMINO, 'z'))
+
+
+def _coincidencias_cortas(consulta, campos):
+    """
+    coincidencias() para términos de menos de LONGITUD_MINIMA_PREFIJO
+    caracteres: un rango de uno o dos caracteres abarcaría buena parte del
+    índice, así que se filtra la tabla de libros con icontains (el ISBN por
+    su comienzo, que usa su índice único). Todas las filas tienen la misma
+    relevancia y salen en orden de id.
+    """
+    condiciones = Q()
+    for termino in consulta:
+        condicion = Q()
+        if CAMPO_TITULO in campos:
+            condicion |= Q(titulo__icontains=termino)
+        if CAMPO_AUTOR in campos:
+            condicion |= Q(autor__nombre__icontains=termino) | Q(autor__apellido__icontains=termino)
+        if CAMPO_ISBN in campos:
+            condicion |= Q(isbn__startswith=termino)
+        condiciones &= condicion
+    return (
+        Libro.objects.filter(condiciones)
+        .annotate(libro_id=F('id'), relevancia=Value(1, output_field=IntegerField()))
+        .values('libro_id', 'relevancia')
+        .order_by('libro_id')
+    )
+
+
+def coincidencias(texto, campos=CAMPOS_LIBRO):
+    """
+    Consulta (libro_id, relevancia) de los libros que contienen todos los
+    términos de `texto` en alguno de los `campos`, de mayor a menor
+    relevancia. Los términos de 3 o más caracteres coinciden también como
+    prefijo ("cerv" encuentra "Cervantes"); un ISBN escrito por partes es un
+    solo término, y si todos los términos son más cortos se buscan en la
+    tabla de libros (ver _coincidencias_cortas).
+
+    Devuelve None si `texto` no tiene términos buscables.
+    """
+    isbn = termino_isbn(texto)
+    consulta = [isbn] if isbn else terminos(texto)
+    if not consulta:
+        return None
+    if all(len(termino) < LONGITUD_MINIMA_PREFIJO for termino in consulta):
+        return _coincidencias_cortas(consulta, campos)
+
+    condiciones = [_condicion(termino) for termino in consulta]
+    cualquiera = Q()
+    for condicion in condiciones:
+        cualquiera |= condicion
+
+    peso_campo = Case(
+        *[When(campo=campo, then=Value(PESOS[campo])) for campo in campos],
+        default=Value(0), output_field=IntegerField(),
+    )
+    exacto = Case(
+        When(termino__in=consulta, then=Value(2)),
+        default=Value(1), output_field=IntegerField(),
+    )
+    # Cada término de la consulta debe coincidir con algún término del libro
+    todos = {
+        f'coincide_{i}': Max(Case(When(condicion, then=Value(1)), default=Value(0),
+                                  output_field=IntegerField()))
+        for i, condicion in enumerate(condiciones)
+    }
+
+    return (
+        TerminoBusqueda.objects.filter(cualquiera, campo__in=campos)
+        .values('libro_id')
+        .annotate(relevancia=Sum(peso_campo * exacto), **todos)
+        .filter(**{nombre: 1 for nombre in todos})
+        .order_by('-relevancia', 'libro_id')
+    )
+
+
+def filtrar_libros(queryset, texto, campos=CAMPOS_LIBRO):
+    """
+    Restringe `queryset` a los libros que coinciden con `texto`, sin cambiar
+    su orden. Un texto vacío no filtra nada; uno sin términos buscables
+    (solo palabras vacías o signos) no devuelve ningún libro.
+    """
+    if not (texto or '').strip():
+        return queryset
+    ids = coincidencias(texto, campos)
+    if ids is None:
+        return queryset.none()
+    return queryset.filter(id__in=ids.order_by().values('libro_id'))
+
+
+def buscar_libros(texto, campos=CAMPOS_LIBRO, limite=50, queryset=None):
+    """Los `limite` libros más relevantes para `texto`, ordenados por relevancia"""
+    ids = coincidencias(texto, campos)
+    if ids is None:
+        return []
+    ids = [fila['libro_id'] for fila in ids[:limite]]
+    if queryset is None:
+        queryset = Libro.objects.all()
+    libros = queryset.in_bulk(ids)
+    return [libros[libro_id] for libro_id in ids if libro_id in libros]
+
+
+# ===== FILTRO REST =====
+
+class BusquedaLibrosFilter(SearchFilter):
+    """SearchFilter de DRF que resuelve ?search= con el índice de búsqueda"""
+
+    def get_search_fields(self, view, request):
+        return ('titulo', 'isbn', 'autor')
+
+    def filter_queryset(self, request, queryset, view):
+        texto = request.query_params.get(self.search_param, '')
+        return filtrar_libros(queryset, texto)
@@ -0,0 +1,118 @@
+"""
+Caché compartida de datos de referencia y contadores del panel
+
+Usa el backend `default` de CACHES (Redis con REDIS_URL, memoria local del
+proceso sin ella). Las invalidaciones solo llegan a todos los procesos con
+Redis: sin él gunicorn.conf.py no arranca más de un worker. Las claves se
+agrupan y cada grupo tiene un número de versión: invalidar un grupo solo
+incrementa su versión, de modo que las claves anteriores quedan huérfanas y
+expiran solas.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import estadisticas
+from .models import Autor, Categoria, Libro, Prestamo
+
+GRUPO_CATALOGO = 'catalogo'  # autores, categorías y editoriales
+GRUPO_PANEL = 'panel'  # contadores de las páginas de inicio y estadísticas
+
+TIMEOUT_CATALOGO = getattr(settings, 'CACHE_TIMEOUT_CATALOGO', 3600)
+# Los contadores también cambian con cada préstamo, que no invalida la caché
+TIMEOUT_PANEL = getattr(settings, 'CACHE_TIMEOUT_PANEL', 30)
+
+_FALTA = object()
+
+# Aciertos y fallos por grupo en este proceso (ver biblioteca_project/metricas.py)
+_aciertos = Counter()
+_fallos = Counter()
+_bloqueo_contadores = threading.Lock()
+
+
+def _clave_version(grupo):
+    return f'version:{grupo}'
+
+
+def _version_inicial():
+    # Si la versión se pierde (expulsión, reinicio) no se reutiliza un
+    # número anterior cuyas claves podrían seguir en la caché
+    return int(time.time() * 1000)
+
+
+def version(grupo):
+    """Versión actual del grupo: cambia con cada invalidación"""
+    numero = cache.get(_clave_version(grupo))
+    if numero is None:
+        # add() no pisa la versión si otro proceso la creó a la vez
+        cache.add(_clave_version(grupo), _version_inicial(), None)
+        numero = cache.get(_clave_version(grupo))
+    return numero
+
+
+def obtener(grupo, clave, calcular, timeout=None):
+    """Devuelve el valor cacheado de `clave` o lo calcula y lo guarda"""
+    clave_completa = f'{grupo}:{version(grupo)}:{clave}'
+    valor = cache.get(clave_completa, _FALTA)
+    with _bloqueo_contadores:
+        (_fallos if valor is _FALTA else _aciertos)[grupo] += 1
+    if valor is _FALTA:
+        valor = calcular()
+        cache.set(clave_completa, valor, timeout)
+    return valor
+
+
+def estadisticas_uso():
+    """Aciertos y fallos de obtener() por grupo desde que arrancó el proceso"""
+    with _bloqueo_contadores:
+        return {
+            grupo: {'aciertos': _aciertos[grupo], 'fallos': _fallos[grupo]}
+            for grupo in _aciertos.keys() | _fallos.keys()
+        }
+
+
+def invalidar(*grupos):
+    """Invalida los grupos cuando la transacción en curso se confirma"""
+    def incrementar():
+        for grupo in grupos:
+            try:
+                cache.incr(_clave_version(grupo))
+            except ValueError:
+                cache.set(_clave_version(grupo), _version_inicial(), None)
+
+    transaction.on_commit(incrementar)
+
+
+# ===== DATOS CACHEADOS =====
+
+def lista_categorias():
+    """Todas las categorías (para filtros y listados)"""
+    return obtener(GRUPO_CATALOGO, 'categorias', lambda: list(Categoria.objects.all()), TIMEOUT_CATALOGO)
+
+
+def lista_autores():
+    """Todos los autores (para filtros y listados)"""
+    return obtener(GRUPO_CATALOGO, 'autores', lambda: list(Autor.objects.all()), TIMEOUT_CATALOGO)
+
+
+def totales_panel():
+    """Contadores de las páginas de inicio y estadísticas"""
+    return obtener(GRUPO_PANEL, 'totales', _calcular_totales_panel, TIMEOUT_PANEL)
+
+
+def _calcular_totales_panel():
+    contadores = estadisticas.contadores(
+        estadisticas.CONTADOR_LIBROS, estadisticas.CONTADOR_AUTORES, estadisticas.CONTADOR_USUARIOS
+    )
+    return {
+        'total_libros': contadores[estadisticas.CONTADOR_LIBROS],
+        'total_autores': contadores[estadisticas.CONTADOR_AUTORES],
+        'total_usuarios': contadores[estadisticas.CONTADOR_USUARIOS],
+        'total_categorias': Categoria.objects.count(),
+        'prestamos_activos': Prestamo.objects.filter(estado='activo').count(),
+        'libros_disponibles': Libro.objects.filter(stock_disponible__gt=0).count(),
+    }
@@ -0,0 +1,70 @@
+"""
+GET condicional (ETag / Last-Modified) para el detalle y los listados de libros
+
+Antes de construir la respuesta se calculan sus validadores: en el detalle
+con una consulta mínima (solo ultima_actualizacion), en los listados con las
+filas de la página, que se leen una vez y se reutilizan al serializar. Si el
+cliente (o nginx) ya tiene esa versión, responde 304 sin serializar ni
+renderizar nada.
+
+La representación de un libro depende también de su autor, categoría y
+editorial, que no tocan Libro.ultima_actualizacion: su cambio se detecta con
+la versión del grupo de caché del catálogo (libros/cache.py), que se
+incrementa al modificarlos. Esa versión se lee de la caché en cada petición,
+así que todos los procesos deben compartirla (Redis, REDIS_URL): con la
+memoria local de cada proceso, los demás workers seguirían respondiendo 304
+con los nombres anteriores. gunicorn.conf.py no arranca varios workers sin
+REDIS_URL.
+
+Los ETag son débiles (W/): dos respuestas con el mismo ETag son
+equivalentes, no idénticas byte a byte (el HTML lleva un token CSRF
+distinto en cada renderizado, y gzip en nginx debilita los ETag fuertes).
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .cache import GRUPO_CATALOGO, version
+
+
+def etag(*partes):
+    """ETag débil a partir de los valores de los que depende la respuesta"""
+    resumen = hashlib.md5(repr(partes).encode(), usedforsecurity=False).hexdigest()
+    return f'W/"{resumen}"'
+
+
+def etag_libro(ultima_actualizacion, *partes):
+    return etag(ultima_actualizacion.isoformat(), version(GRUPO_CATALOGO), *partes)
+
+
+def etag_filas(filas, *partes):
+    """ETag de una página a partir de pares (id, ultima_actualizacion) de sus filas"""
+    return etag([(fila_id, fecha.isoformat()) for fila_id, fecha in filas],
+                version(GRUPO_CATALOGO), *partes)
+
+
+def responder(request, generar, etag, ultima_modificacion=None, privada=False):
+    """
+    304 si el cliente ya tiene la versión indicada por los validadores; si
+    no, la respuesta de generar() con ETag, Last-Modified y Cache-Control.
+
+    max-age=0 obliga a revalidar siempre: sin él los navegadores darían por
+    buena una página con Last-Modified durante un tiempo estimado. `privada`
+    es para respuestas que dependen del usuario y no deben guardarse en
+    cachés compartidas.
+    """
+    marca = int(ultima_modificacion.timestamp()) if ultima_modificacion else None
+    respuesta = get_conditional_response(request, etag=etag, last_modified=marca)
+    if respuesta is None:
+        respuesta = generar()
+        if respuesta.status_code != 200:
+            return respuesta
+    respuesta.headers['ETag'] = etag
+    if marca is not None:
+        respuesta.headers['Last-Modified'] = http_date(marca)
+    if privada:
+        patch_cache_control(respuesta, max_age=0, private=True)
+    else:
+        patch_cache_control(respuesta, max_age=0)
+    return respuesta
@@ -0,0 +1,221 @@
+"""
+Estadísticas precalculadas del sistema
+
+Los contadores se actualizan de forma incremental al crear, devolver o
+eliminar préstamos y libros (ver libros/signals.py y libros/prestamos.py),
+así el panel de estadísticas lee filas ya agregadas en lugar de recorrer
+todo el historial de préstamos. `reconstruir()` recalcula todo desde cero.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import (
+    Autor, Categoria, Contador, EstadisticaAutor, EstadisticaCategoria,
+    EstadisticaDiaria, EstadisticaLibro, Libro, Prestamo,
+)
+
+CONTADOR_LIBROS = 'libros'
+CONTADOR_AUTORES = 'autores'
+CONTADOR_USUARIOS = 'usuarios'
+
+
+# ===== ACTUALIZACIÓN INCREMENTAL =====
+
+def _incrementar(modelo, campo, cantidad, **clave):
+    """Suma `cantidad` a `campo` en la fila `clave`, creándola si no existe"""
+    if modelo.objects.filter(**clave).update(**{campo: F(campo) + cantidad}):
+        return
+    if cantidad < 0:
+        # Sin fila que descontar: las estadísticas aún no se han construido
+        return
+    try:
+        with transaction.atomic():
+            modelo.objects.create(**clave, **{campo: cantidad})
+    except IntegrityError:
+        # Otro proceso creó la fila a la vez
+        modelo.objects.filter(**clave).update(**{campo: F(campo) + cantidad})
+
+
+def _incrementar_varios(modelo, campo, clave, cantidades, tamano_lote=500):
+    """
+    _incrementar para muchas filas: suma cantidades[valor] a `campo` en la
+    fila con clave=valor. Un UPDATE con CASE y un INSERT de las filas que
+    faltan por cada bloque, en lugar de una consulta por fila.
+    """
+    cantidades = {valor: cantidad for valor, cantidad in cantidades.items()
+                  if valor is not None and cantidad}
+    valores = list(cantidades)
+    for inicio in range(0, len(valores), tamano_lote):
+        bloque = valores[inicio:inicio + tamano_lote]
+        existentes = set(modelo.objects.filter(**{f'{clave}__in': bloque}).values_list(clave, flat=True))
+        if existentes:
+            modelo.objects.filter(**{f'{clave}__in': existentes}).update(**{campo: F(campo) + Case(
+                *(When(**{clave: valor}, then=Value(cantidades[valor])) for valor in existentes),
+                default=Value(0),
+            )})
+        nuevos = [valor for valor in bloque if valor not in existentes and cantidades[valor] > 0]
+        try:
+            with transaction.atomic():
+                modelo.objects.bulk_create(
+                    modelo(**{clave: valor, campo: cantidades[valor]}) for valor in nuevos
+                )
+        except IntegrityError:
+            # Otro proceso creó alguna de las filas a la vez
+            for valor in nuevos:
+                _incrementar(modelo, campo, cantidades[valor], **{clave: valor})
+
+
+def _autor_de_libro(prestamo):
+    if Prestamo.libro.is_cached(prestamo):
+        return prestamo.libro.autor_id
+    autores = Libro.objects.filter(id=prestamo.libro_id).order_by().values_list('autor_id', flat=True)[:1]
+    return autores[0] if autores else None
+
+
+def registrar_prestamo(prestamo, cantidad=1):
+    """Cuenta un préstamo nuevo (o lo descuenta con cantidad=-1)"""
+    _incrementar(EstadisticaDiaria, 'prestamos', cantidad, fecha=prestamo.fecha_prestamo)
+    _incrementar(EstadisticaLibro, 'total_prestamos', cantidad, libro_id=prestamo.libro_id)
+    autor_id = _autor_de_libro(prestamo)
+    if autor_id is not None:
+        _incrementar(EstadisticaAutor, 'total_prestamos', cantidad, autor_id=autor_id)
+
+
+def registrar_prestamos(prestamos):
+    """registrar_prestamo para muchos préstamos nuevos, con consultas por bloque"""
+    sin_libro = [p.libro_id for p in prestamos if not Prestamo.libro.is_cached(p)]
+    autores = dict(Libro.objects.filter(id__in=sin_libro).values_list('id', 'autor_id')) if sin_libro else {}
+    autores.update((p.libro_id, p.libro.autor_id) for p in prestamos if Prestamo.libro.is_cached(p))
+    _incrementar_varios(EstadisticaDiaria, 'prestamos', 'fecha', Counter(p.fecha_prestamo for p in prestamos))
+    _incrementar_varios(EstadisticaLibro, 'total_prestamos', 'libro_id', Counter(p.libro_id for p in prestamos))
+    _incrementar_varios(EstadisticaAutor, 'total_prestamos', 'autor_id',
+                        Counter(autores.get(p.libro_id) for p in prestamos))
+
+
+def registrar_devolucion(fecha, cantidad=1):
+    """Cuenta `cantidad` devoluciones en el día `fecha`"""
+    _incrementar(EstadisticaDiaria, 'devoluciones', cantidad, fecha=fecha)
+
+
+def ajustar_categoria(categoria_id, cantidad):
+    """Suma `cantidad` libros a la categoría"""
+    if categoria_id is not None:
+        _incrementar(EstadisticaCategoria, 'total_libros', cantidad, categoria_id=categoria_id)
+
+
+def ajustar_categorias(cantidades):
+    """ajustar_categoria para varias categorías: categoria_id -> cantidad"""
+    _incrementar_varios(EstadisticaCategoria, 'total_libros', 'categoria_id', cantidades)
+
+
+def ajustar_contador(nombre, cantidad):
+    """Suma `cantidad` al contador global `nombre`"""
+    _incrementar(Contador, 'valor', cantidad, nombre=nombre)
+
+
+# ===== CONSULTAS DEL PANEL =====
+
+def contadores(*nombres):
+    """Valores de los contadores globales pedidos (0 si no existen)"""
+    valores = dict(Contador.objects.filter(nombre__in=nombres).values_list('nombre', 'valor'))
+    return {nombre: valores.get(nombre, 0) for nombre in nombres}
+
+
+def prestamos_por_dia(dias, hoy):
+    """
+    Préstamos por día de los últimos `dias` días (incluido hoy); los días
+    sin préstamos se rellenan con 0. Devuelve (labels, data).
+    """
+    inicio = hoy - timedelta(days=dias - 1)
+    totales = dict(
+        EstadisticaDiaria.objects.filter(fecha__gte=inicio, fecha__lte=hoy)
+        .values_list('fecha', 'prestamos')
+    )
+
+    labels, data = [], []
+    for i in range(dias):
+        dia = inicio + timedelta(days=i)
+        labels.append(dia.strftime('%d/%m'))
+        data.append(totales.get(dia, 0))
+    return labels, data
+
+
+def libros_por_categoria():
+    """Categorías con su total de libros, de mayor a menor"""
+    return Categoria.objects.annotate(
+        total=Coalesce(F('estadistica__total_libros'), Value(0))
+    ).order_by('-total')
+
+
+def top_autores(limite=10):
+    """Autores más prestados (recorre solo el índice de total_prestamos)"""
+    return EstadisticaAutor.objects.select_related('autor').filter(
+        total_prestamos__gt=0
+    ).order_by('-total_prestamos')[:limite]
+
+
+def top_libros(limite=10):
+    """Libros más prestados (recorre solo el índice de total_prestamos)"""
+    return EstadisticaLibro.objects.select_related('libro').filter(
+        total_prestamos__gt=0
+    ).order_by('-total_prestamos')[:limite]
+
+
+# ===== RECONSTRUCCIÓN =====
+
+@transaction.atomic
+def reconstruir(tamano_lote=1000):
+    """Recalcula todas las estadísticas a partir de los datos actuales"""
+    for modelo in (EstadisticaDiaria, EstadisticaLibro, EstadisticaAutor,
+                   EstadisticaCategoria, Contador):
+        modelo.objects.all().delete()
+
+    dias = {}
+    for fecha, total in (Prestamo.objects.values('fecha_prestamo')
+                         .annotate(total=Count('id')).order_by()
+                         .values_list('fecha_prestamo', 'total')):
+        dias[fecha] = EstadisticaDiaria(fecha=fecha, prestamos=total)
+    for fecha, total in (Prestamo.objects.filter(fecha_devolucion_real__isnull=False)
+                         .values('fecha_devolucion_real')
+                         .annotate(total=Count('id')).order_by()
+                         .values_list('fecha_devolucion_real', 'total')):
+        dias.setdefault(fecha, EstadisticaDiaria(fecha=fecha)).devoluciones = total
+    EstadisticaDiaria.objects.bulk_create(dias.values(), batch_size=tamano_lote)
+
+    EstadisticaLibro.objects.bulk_create(
+        (EstadisticaLibro(libro_id=libro_id, total_prestamos=total)
+         for libro_id, total in (Prestamo.objects.values('libro_id')
+                                 .annotate(total=Count('id')).order_by()
+                                 .values_list('libro_id', 'total'))),
+        batch_size=tamano_lote,
+    )
+    EstadisticaAutor.objects.bulk_create(
+        (EstadisticaAutor(autor_id=autor_id, total_prestamos=total)
+         for autor_id, total in (Prestamo.objects.values('libro__autor_id')
+                                 .annotate(total=Count('id')).order_by()
+                                 .values_list('libro__autor_id', 'total'))),
+        batch_size=tamano_lote,
+    )
+    EstadisticaCategoria.objects.bulk_create(
+        (EstadisticaCategoria(categoria_id=categoria_id, total_libros=total)
+         for categoria_id, total in (Categoria.objects.annotate(total=Count('libros'))
+                                     .order_by().values_list('id', 'total'))),
+        batch_size=tamano_lote,
+    )
+    Contador.objects.bulk_create([
+        Contador(nombre=CONTADOR_LIBROS, valor=Libro.objects.count()),
+        Contador(nombre=CONTADOR_AUTORES, valor=Autor.objects.count()),
+        Contador(nombre=CONTADOR_USUARIOS, valor=User.objects.count()),
+    ])
+
+    return {
+        'dias': len(dias),
+        'libros': EstadisticaLibro.objects.count(),
+        'autores': EstadisticaAutor.objects.count(),
+        'categorias': EstadisticaCategoria.objects.count(),
+    }
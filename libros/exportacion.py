@@ -0,0 +1,252 @@
+"""
+Exportación completa del catálogo en NDJSON o CSV (/api/exportar/<recurso>/)
+
+Los socios que descargan todo el catálogo cada noche lo hacían paginando la
+API REST de 10 en 10 filas: decenas de miles de peticiones. La exportación
+lo entrega en una sola respuesta StreamingHttpResponse que se genera según
+se envía, así que la memoria no depende del número de filas:
+
+- Las filas se leen por bloques de TAMANO_BLOQUE en orden de id (keyset:
+  id > último id del bloque anterior). Con pymysql, iterator(chunk_size=...)
+  no usa un cursor del servidor y el driver cargaría el resultado entero en
+  memoria; los bloques por id tampoco dejan abierta una consulta larga en
+  MySQL mientras el cliente descarga. Cada bloque es una consulta aparte,
+  así que una fila modificada durante la exportación puede salir con sus
+  valores nuevos.
+- Solo se leen las columnas exportadas (values_list con sus JOIN), sin
+  instanciar modelos ni serializers.
+- Si el cliente acepta gzip, cada bloque se comprime al vuelo (zlib) y nginx
+  lo deja pasar sin volver a comprimir.
+
+Los campos son los del serializer REST de cada recurso, con los mismos
+nombres y formato de fechas, para que los socios no tengan que adaptar nada.
+"""
+import csv
+import io
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models, router
+from django.db.models import Value
+from django.db.models.functions import Concat
+from rest_framework import serializers
+
+from .models import Autor, Libro, Prestamo
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+TAMANO_BLOQUE = 2000
+# Nivel 1: zlib comprime varias veces más rápido que con el 6 de nginx y
+# el resultado solo ocupa un 20-25 % más (ver bench_exportacion), así que
+# la compresión no limita la descarga
+NIVEL_GZIP = 1
+
+FORMATOS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+}
+
+
+class Exportacion:
+    """
+    Volcado de un modelo. `columnas` son pares (nombre, ruta): el nombre del
+    campo exportado y la ruta de values_list (campo, relación con __ o
+    anotación). La primera columna debe ser el id.
+    """
+
+    def __init__(self, modelo, columnas, anotaciones=None):
+        if columnas[0][1] != 'id':
+            raise ValueError(f'La exportación de {modelo.__name__} debe empezar por el id')
+        self.modelo = modelo
+        self.nombres = [nombre for nombre, _ in columnas]
+        self.rutas = [ruta for _, ruta in columnas]
+        self.anotaciones = anotaciones or {}
+        self._conversiones = [
+            (i, conversion) for i, ruta in enumerate(self.rutas)
+            if (conversion := _conversion(modelo, ruta)) is not None
+        ]
+
+    def bloques(self, tamano=None, using=None):
+        """Listas de filas (listas de valores) en orden de id, una consulta por bloque"""
+        tamano = tamano or TAMANO_BLOQUE
+        # Todos los bloques de la misma base de datos (réplica o primario)
+        queryset = self.modelo._default_manager.using(using or router.db_for_read(self.modelo))
+        if self.anotaciones:
+            queryset = queryset.annotate(**self.anotaciones)
+        queryset = queryset.order_by('id').values_list(*self.rutas)
+        ultimo = None
+        while True:
+            consulta = queryset if ultimo is None else queryset.filter(id__gt=ultimo)
+            filas = list(consulta[:tamano])
+            if not filas:
+                return
+            ultimo = filas[-1][0]
+            yield [self._convertir(fila) for fila in filas]
+            if len(filas) < tamano:
+                return
+
+    def _convertir(self, fila):
+        fila = list(fila)
+        for i, conversion in self._conversiones:
+            fila[i] = conversion(fila[i])
+        return fila
+
+
+def _conversion(modelo, ruta):
+    """Conversión de las fechas al formato del serializer REST (None si no hace falta)"""
+    campo = None
+    for atributo in ruta.split('__'):
+        try:
+            campo = modelo._meta.get_field(atributo)
+        except FieldDoesNotExist:
+            return None  # anotación
+        modelo = campo.related_model
+    if isinstance(campo, models.DateTimeField):
+        return serializers.DateTimeField().to_representation
+    if isinstance(campo, models.DateField):
+        return serializers.DateField().to_representation
+    return None
+
+
+# ===== RECURSOS =====
+
+EXPORTACIONES = {
+    'libros': Exportacion(
+        Libro,
+        [
+            ('id', 'id'), ('titulo', 'titulo'), ('isbn', 'isbn'), ('descripcion', 'descripcion'),
+            ('fecha_publicacion', 'fecha_publicacion'), ('numero_paginas', 'numero_paginas'),
+            ('idioma', 'idioma'), ('stock_total', 'stock_total'), ('stock_disponible', 'stock_disponible'),
+            ('estado', 'estado'), ('autor', 'autor_id'), ('autor_nombre', 'exportar_autor_nombre'),
+            ('categoria', 'categoria_id'), ('categoria_nombre', 'categoria__nombre'),
+            ('editorial', 'editorial_id'), ('editorial_nombre', 'editorial__nombre'),
+            ('fecha_registro', 'fecha_registro'),
+        ],
+        anotaciones={
+            'exportar_autor_nombre': Concat('autor__nombre', Value(' '), 'autor__apellido'),
+        },
+    ),
+    'autores': Exportacion(
+        Autor,
+        [
+            ('id', 'id'), ('nombre', 'nombre'), ('apellido', 'apellido'),
+            ('nombre_completo', 'exportar_nombre_completo'), ('nacionalidad', 'nacionalidad'),
+            ('biografia', 'biografia'), ('fecha_nacimiento', 'fecha_nacimiento'),
+        ],
+        anotaciones={
+            'exportar_nombre_completo': Concat('nombre', Value(' '), 'apellido'),
+        },
+    ),
+    'prestamos': Exportacion(
+        Prestamo,
+        [
+            ('id', 'id'), ('libro', 'libro_id'), ('libro_titulo', 'libro__titulo'),
+            ('usuario', 'usuario_id'), ('usuario_nombre', 'usuario__username'),
+            ('fecha_prestamo', 'fecha_prestamo'), ('fecha_devolucion_esperada', 'fecha_devolucion_esperada'),
+            ('fecha_devolucion_real', 'fecha_devolucion_real'), ('estado', 'estado'), ('notas', 'notas'),
+        ],
+    ),
+}
+
+
+# ===== FORMATOS =====
+
+def generar_ndjson(exportacion, bloques):
+    """Un objeto JSON por línea"""
+    nombres = exportacion.nombres
+    for filas in bloques:
+        if orjson is not None:
+            yield b''.join(
+                orjson.dumps(dict(zip(nombres, fila)), option=orjson.OPT_APPEND_NEWLINE) for fila in filas
+            )
+        else:
+            yield ''.join(
+                json.dumps(dict(zip(nombres, fila)), ensure_ascii=False) + '\n' for fila in filas
+            ).encode()
+
+
+def generar_csv(exportacion, bloques):
+    """Cabecera con los nombres de los campos y una línea por fila (None queda vacío)"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(exportacion.nombres)
+    for filas in bloques:
+        escritor.writerows(filas)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()  # solo la cabecera: no había filas
+
+
+GENERADORES = {'ndjson': generar_ndjson, 'csv': generar_csv}
+
+
+def comprimir(partes, nivel=None):
+    """Comprime con gzip las partes según se generan"""
+    compresor = zlib.compressobj(NIVEL_GZIP if nivel is None else nivel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for parte in partes:
+        comprimido = compresor.compress(parte)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+
+def calidades(accept_encoding):
+    """Codificación -> q de una cabecera Accept-Encoding (q=1 si no se indica)"""
+    resultado = {}
+    for parte in accept_encoding.split(','):
+        codificacion, _, parametros = parte.partition(';')
+        codificacion = codificacion.strip().lower()
+        if not codificacion:
+            continue
+        calidad = 1.0
+        for parametro in parametros.split(';'):
+            nombre, _, valor = parametro.partition('=')
+            if nombre.strip().lower() == 'q':
+                try:
+                    calidad = float(valor)
+                except ValueError:
+                    calidad = 0.0
+        resultado[codificacion] = calidad
+    return resultado
+
+
+def acepta_gzip(request):
+    """
+    Si el cliente admite gzip: lo nombra con q > 0 o, si no lo nombra, lo
+    cubre '*' con q > 0 (RFC 9110, 12.5.3). "gzip;q=0" lo rechaza y la
+    respuesta sale sin comprimir.
+    """
+    aceptadas = calidades(request.headers.get('Accept-Encoding', ''))
+    for codificacion in ('gzip', 'x-gzip'):
+        if codificacion in aceptadas:
+            return aceptadas[codificacion] > 0
+    return aceptadas.get('*', 0) > 0
+
+
+def contenido(recurso, formato, gzip=False, using=None):
+    """
+    Partes (bytes) de la exportación de `recurso` en `formato`. Las consultas
+    se hacen al consumir las partes, cuando la vista ya ha terminado: quien
+    llama resuelve `using` mientras la petición sigue activa
+    """
+    exportacion = EXPORTACIONES[recurso]
+    partes = GENERADORES[formato](exportacion, exportacion.bloques(using=using))
+    return comprimir(partes) if gzip else partes
+
+
+async def asincrono(partes):
+    """
+    Con ASGI, Django cargaría entera en memoria una respuesta con un
+    iterador síncrono: se consume parte a parte en el hilo de la base de datos
+    """
+    iterador = iter(partes)
+    siguiente = sync_to_async(next, thread_sensitive=True)
+    while (parte := await siguiente(iterador, None)) is not None:
+        yield parte
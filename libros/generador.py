@@ -0,0 +1,275 @@
+"""
+Generador de datos sintéticos para pruebas de carga
+
+Inserta usuarios, autores, editoriales, categorías, libros y préstamos con
+bulk_create por lotes, sin señales ni consultas fila a fila, de modo que
+millones de filas tardan minutos. Con la misma semilla se generan los mismos
+datos.
+
+Las distribuciones imitan las de un catálogo real:
+
+- La popularidad sigue una ley de Zipf: pocos libros acumulan la mayoría de
+  los préstamos, pocos usuarios hacen la mayoría y pocos autores, editoriales
+  y categorías concentran la mayoría de los libros.
+- Una parte de los préstamos sigue activa (proporcion_activos) y, de ellos,
+  una parte está vencida (proporcion_vencidos). Los devueltos tarde quedan
+  como 'vencido' con su multa.
+- El stock de cada libro cuadra con sus préstamos activos.
+
+Como bulk_create no dispara señales, al terminar se reconstruyen las
+estadísticas y el índice de búsqueda y se invalida la caché.
+"""
+import itertools
+import random
+import time
+from bisect import bisect
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+
+from . import busqueda, cache, estadisticas
+from .models import Autor, Categoria, Editorial, Libro, Prestamo
+from .prestamos import MULTA_POR_DIA
+
+CONTRASENA = 'user123'
+DIAS_PRESTAMO = 14
+PREFIJO_ISBN = '990'
+
+NOMBRES = (
+    'Ana Carlos María José Lucía Miguel Sofía Javier Elena David Carmen Pablo '
+    'Laura Jorge Isabel Diego Marta Andrés Paula Luis Valeria Fernando Rosa '
+    'Tomás Julia Ricardo Clara Manuel Teresa Gabriel'
+).split()
+APELLIDOS = (
+    'García Rodríguez López Martínez Sánchez Pérez Gómez Martín Jiménez Ruiz '
+    'Hernández Díaz Moreno Álvarez Muñoz Romero Alonso Gutiérrez Navarro '
+    'Torres Domínguez Vázquez Ramos Gil Ramírez Serrano Blanco Molina Castro '
+    'Ortega Rubio Marín Sanz Iglesias Núñez Medina Garrido Cortés Castillo'
+).split()
+NACIONALIDADES = (
+    'Mexicana', 'Española', 'Argentina', 'Colombiana', 'Chilena', 'Peruana',
+    'Uruguaya', 'Cubana', 'Británica', 'Francesa', 'Estadounidense', 'Rusa',
+)
+TEMAS = (
+    'Ficción', 'Novela', 'Poesía', 'Ensayo', 'Historia', 'Ciencia', 'Filosofía',
+    'Biografía', 'Infantil', 'Juvenil', 'Fantasía', 'Ciencia Ficción', 'Misterio',
+    'Terror', 'Romance', 'Viajes', 'Arte', 'Música', 'Cocina', 'Economía',
+    'Política', 'Psicología', 'Tecnología', 'Derecho', 'Medicina', 'Deportes',
+)
+PALABRAS_TITULO = (
+    'sombra viento noche jardín ciudad río montaña memoria silencio tiempo '
+    'guerra amor muerte mar cielo fuego camino casa hombre mujer niño perro '
+    'historia secreto libro sueño laberinto espejo verano invierno isla '
+    'ángel diablo rey reina príncipe ciego loco último primer cien mil'
+).split()
+IDIOMAS = ('Español',) * 8 + ('Inglés', 'Francés')
+
+
+class Zipf:
+    """
+    Elige índices 0..n-1 con probabilidad proporcional a 1/rango^s. El
+    rango de cada índice es aleatorio, para que los más populares no sean
+    siempre los primeros ids.
+    """
+
+    def __init__(self, n, s, generador):
+        self._acumulados = list(itertools.accumulate(1 / rango ** s for rango in range(1, n + 1)))
+        self._indices = list(range(n))
+        generador.shuffle(self._indices)
+        self._generador = generador
+
+    def elegir(self):
+        valor = self._generador.random() * self._acumulados[-1]
+        return self._indices[min(bisect(self._acumulados, valor), len(self._indices) - 1)]
+
+
+def _ultimo_id(modelo):
+    return modelo.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def _insertar(modelo, objetos, tamano_lote, devolver_ids=True):
+    """
+    Inserta `objetos` (un iterable perezoso) en lotes de `tamano_lote`.
+    Devuelve los ids de las filas nuevas en orden de inserción; MySQL no los
+    devuelve en bulk_create, así que se leen después.
+    """
+    ultimo = _ultimo_id(modelo)
+    objetos = iter(objetos)
+    while lote := list(itertools.islice(objetos, tamano_lote)):
+        modelo.objects.bulk_create(lote)
+    if devolver_ids:
+        return list(modelo.objects.filter(id__gt=ultimo).order_by('id').values_list('id', flat=True))
+
+
+@contextmanager
+def _fechas_explicitas(modelo, campo):
+    """Desactiva auto_now_add de `campo` para poder fijar fechas pasadas"""
+    field = modelo._meta.get_field(campo)
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def _nombres_categoria(cantidad):
+    existentes = set(Categoria.objects.values_list('nombre', flat=True))
+    nombres = (f'{tema} {n}' if n else tema for n in itertools.count() for tema in TEMAS)
+    return list(itertools.islice((nombre for nombre in nombres if nombre not in existentes), cantidad))
+
+
+def _titulo(generador):
+    palabras = generador.sample(PALABRAS_TITULO, generador.randint(2, 5))
+    return ' '.join(palabras).capitalize()
+
+
+# ===== GENERACIÓN =====
+
+def generar(usuarios=1000, autores=2000, editoriales=200, categorias=30, libros=100_000,
+            prestamos=500_000, semilla=1, proporcion_activos=0.1, proporcion_vencidos=0.2,
+            exponente_zipf=1.0, dias_historia=730, tamano_lote=5000, reconstruir=True,
+            informar=print):
+    """
+    Genera los datos y devuelve cuántas filas se insertaron de cada modelo.
+    `informar(mensaje)` recibe el progreso de cada etapa.
+    """
+    if libros and not (autores and editoriales and categorias):
+        raise ValueError('Los libros necesitan al menos un autor, una editorial y una categoría')
+    if prestamos and not (usuarios and libros):
+        raise ValueError('Los préstamos necesitan al menos un usuario y un libro')
+
+    generador = random.Random(semilla)
+    hoy = date.today()
+    inicio = time.perf_counter()
+
+    def etapa(mensaje):
+        informar(f'[{time.perf_counter() - inicio:7.1f} s] {mensaje}')
+
+    # Un solo hash para todos: calcularlo por usuario tardaría horas
+    contrasena = make_password(CONTRASENA)
+    primer_usuario = _ultimo_id(User) + 1
+    ids_usuarios = _insertar(User, (
+        User(
+            username=f'lector{primer_usuario + i}',
+            email=f'lector{primer_usuario + i}@ejemplo.com',
+            first_name=generador.choice(NOMBRES),
+            last_name=generador.choice(APELLIDOS),
+            password=contrasena,
+        )
+        for i in range(usuarios)
+    ), tamano_lote)
+    etapa(f'{len(ids_usuarios)} usuarios')
+
+    ids_autores = _insertar(Autor, (
+        Autor(
+            nombre=generador.choice(NOMBRES),
+            apellido=f'{generador.choice(APELLIDOS)} {generador.choice(APELLIDOS)}',
+            fecha_nacimiento=date(generador.randint(1850, 1995), generador.randint(1, 12), generador.randint(1, 28)),
+            nacionalidad=generador.choice(NACIONALIDADES),
+        )
+        for _ in range(autores)
+    ), tamano_lote)
+    ids_editoriales = _insertar(Editorial, (
+        Editorial(nombre=f'Editorial {generador.choice(APELLIDOS)} {i + 1}', pais=generador.choice(NACIONALIDADES))
+        for i in range(editoriales)
+    ), tamano_lote)
+    ids_categorias = _insertar(Categoria, (
+        Categoria(nombre=nombre) for nombre in _nombres_categoria(categorias)
+    ), tamano_lote)
+    etapa(f'{len(ids_autores)} autores, {len(ids_editoriales)} editoriales, {len(ids_categorias)} categorías')
+
+    # Los préstamos activos se eligen antes de crear los libros para que el
+    # stock disponible de cada uno ya descuente los suyos
+    popularidad = Zipf(libros, exponente_zipf, generador)
+    num_activos = int(prestamos * proporcion_activos)
+    libros_activos = [popularidad.elegir() for _ in range(num_activos)]
+    activos_por_libro = Counter(libros_activos)
+
+    autor_de = Zipf(len(ids_autores), exponente_zipf, generador)
+    editorial_de = Zipf(len(ids_editoriales), exponente_zipf, generador)
+    categoria_de = Zipf(len(ids_categorias), exponente_zipf, generador)
+    primer_libro = _ultimo_id(Libro) + 1
+
+    def crear_libro(i):
+        prestados = activos_por_libro[i]
+        stock_total = max(generador.choice((1, 1, 1, 2, 2, 3, 5)), prestados)
+        stock_disponible = stock_total - prestados
+        if stock_disponible == 0:
+            estado = 'prestado'
+        elif not prestados and generador.random() < 0.01:
+            estado = 'mantenimiento'
+        else:
+            estado = 'disponible'
+        return Libro(
+            titulo=_titulo(generador),
+            isbn=f'{PREFIJO_ISBN}{primer_libro + i:010d}',
+            autor_id=ids_autores[autor_de.elegir()],
+            editorial_id=ids_editoriales[editorial_de.elegir()] if generador.random() < 0.9 else None,
+            categoria_id=ids_categorias[categoria_de.elegir()],
+            fecha_publicacion=date(generador.randint(1900, hoy.year - 1), generador.randint(1, 12), generador.randint(1, 28)),
+            numero_paginas=generador.randint(60, 900),
+            idioma=generador.choice(IDIOMAS),
+            estado=estado,
+            stock_total=stock_total,
+            stock_disponible=stock_disponible,
+            ubicacion_fisica=f'Estante {generador.choice("ABCDEFGH")}-{generador.randint(1, 40)}',
+        )
+
+    ids_libros = _insertar(Libro, (crear_libro(i) for i in range(libros)), tamano_lote)
+    etapa(f'{len(ids_libros)} libros')
+
+    lector = Zipf(len(ids_usuarios), exponente_zipf, generador)
+
+    def prestamo_activo(libro):
+        if generador.random() < proporcion_vencidos:
+            fecha = hoy - timedelta(days=generador.randint(DIAS_PRESTAMO + 1, DIAS_PRESTAMO + 60))
+        else:
+            fecha = hoy - timedelta(days=generador.randint(0, DIAS_PRESTAMO - 1))
+        return Prestamo(
+            libro_id=ids_libros[libro],
+            usuario_id=ids_usuarios[lector.elegir()],
+            fecha_prestamo=fecha,
+            fecha_devolucion_esperada=fecha + timedelta(days=DIAS_PRESTAMO),
+            estado='activo',
+        )
+
+    def prestamo_devuelto():
+        fecha = hoy - timedelta(days=generador.randint(1, dias_historia))
+        esperada = fecha + timedelta(days=DIAS_PRESTAMO)
+        devuelto = min(fecha + timedelta(days=generador.randint(1, DIAS_PRESTAMO + 10)), hoy)
+        retraso = (devuelto - esperada).days
+        return Prestamo(
+            libro_id=ids_libros[popularidad.elegir()],
+            usuario_id=ids_usuarios[lector.elegir()],
+            fecha_prestamo=fecha,
+            fecha_devolucion_esperada=esperada,
+            fecha_devolucion_real=devuelto,
+            estado='vencido' if retraso > 0 else 'devuelto',
+            multa=retraso * MULTA_POR_DIA if retraso > 0 else 0,
+        )
+
+    with _fechas_explicitas(Prestamo, 'fecha_prestamo'):
+        _insertar(Prestamo, itertools.chain(
+            (prestamo_activo(libro) for libro in libros_activos),
+            (prestamo_devuelto() for _ in range(prestamos - num_activos)),
+        ), tamano_lote, devolver_ids=False)
+    etapa(f'{prestamos} préstamos ({num_activos} activos)')
+
+    if reconstruir:
+        estadisticas.reconstruir()
+        etapa('estadísticas reconstruidas')
+        busqueda.reconstruir_indice()
+        etapa('índice de búsqueda reconstruido')
+    cache.invalidar(cache.GRUPO_CATALOGO, cache.GRUPO_PANEL)
+
+    return {
+        'usuarios': len(ids_usuarios),
+        'autores': len(ids_autores),
+        'editoriales': len(ids_editoriales),
+        'categorias': len(ids_categorias),
+        'libros': len(ids_libros),
+        'prestamos': prestamos,
+    }
@@ -0,0 +1,458 @@
+"""
+Altas, modificaciones y bajas en lote de libros y préstamos para la API REST
+
+POST, PATCH y DELETE sobre /api/libros/lote/ y /api/prestamos/lote/ reciben
+una lista JSON (o NDJSON, un objeto por línea) y la procesan con un número
+de consultas que no crece con cada elemento:
+
+- las claves ajenas se resuelven con una consulta in_bulk por modelo
+  relacionado, y los campos únicos (el ISBN) con una consulta por bloque;
+- cada elemento se valida con el serializer de la API; los que fallan se
+  informan con su índice y sus errores y el resto se guarda (con
+  atomico=True no se guarda nada si alguno falla, y los elementos correctos
+  se informan como omitidos);
+- las modificaciones leen las filas con SELECT ... FOR UPDATE en la misma
+  transacción que las escribe, así que no pisan un cambio hecho a la vez;
+- las filas se escriben con bulk_create / bulk_update en bloques de
+  TAMANO_BLOQUE. Solo esos bucles por bloques van dentro de por_bloques()
+  (la instrumentación no los toma por un N+1); una consulta por elemento en
+  la validación o en los ganchos sí se detecta.
+
+bulk_create y bulk_update no envían post_save, así que cada Lote hace en
+bloque lo que harían las señales (signals.py): estadísticas, índice de
+búsqueda, autocompletado y caché del panel. Las bajas usan
+QuerySet.delete(), que sí las envía.
+
+MySQL no devuelve los id de un INSERT de varias filas (SQLite, PostgreSQL y
+MariaDB sí): los libros se vuelven a leer por ISBN y los préstamos por
+libro y usuario entre los id posteriores al último que había.
+"""
+from collections import Counter
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connections, router, transaction
+from django.db.models import Case, F, Max, Value, When
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.validators import UniqueValidator
+
+from biblioteca_project.instrumentacion import por_bloques
+
+from . import autocompletado, busqueda, estadisticas
+from .cache import GRUPO_PANEL, invalidar
+from .models import Libro, Prestamo
+from .serializers import LibroSerializer, PrestamoSerializer
+
+TAMANO_BLOQUE = 500
+MAXIMO_ELEMENTOS = 10_000
+
+
+def bloques(elementos, tamano=TAMANO_BLOQUE):
+    elementos = list(elementos)
+    for inicio in range(0, len(elementos), tamano):
+        yield elementos[inicio:inicio + tamano]
+
+
+class ClaveEnLote(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField que busca en `objetos` (clave -> objeto, leídos
+    de una vez para todo el lote) en lugar de consultar por elemento
+    """
+
+    def __init__(self, objetos, **kwargs):
+        self.objetos = objetos
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            clave = self.get_queryset().model._meta.pk.to_python(data)
+        except (DjangoValidationError, TypeError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if clave not in self.objetos:
+            self.fail('does_not_exist', pk_value=data)
+        return self.objetos[clave]
+
+
+class Resultado:
+    """
+    Resultado por elemento de una operación en lote. Los elementos que no
+    están en `ids` ni en `errores` no se guardaron porque otro falló (con
+    atomico=True): son los omitidos.
+    """
+    CORRECTO = 'correcto'
+    ERROR = 'error'
+    OMITIDO = 'omitido'
+
+    def __init__(self, total):
+        self.total = total
+        self.ids = {}
+        self.errores = {}
+
+    @property
+    def omitidos(self):
+        return [indice for indice in range(self.total) if indice not in self.ids and indice not in self.errores]
+
+    def datos(self):
+        """Una entrada por elemento, en el orden del lote, con su estado"""
+        resultados = [{'indice': indice, 'estado': self.CORRECTO, 'id': objeto_id}
+                      for indice, objeto_id in self.ids.items()]
+        resultados += [{'indice': indice, 'estado': self.ERROR, 'errores': errores}
+                       for indice, errores in self.errores.items()]
+        omitidos = self.omitidos
+        resultados += [{'indice': indice, 'estado': self.OMITIDO} for indice in omitidos]
+        return {
+            'total': self.total,
+            'correctos': len(self.ids),
+            'errores': len(self.errores),
+            'omitidos': len(omitidos),
+            'resultados': sorted(resultados, key=lambda resultado: resultado['indice']),
+        }
+
+    def codigo(self, creacion=False):
+        """201/200 si todo fue bien, 207 si solo algunos elementos y 400 si ninguno"""
+        if not self.errores:
+            return status.HTTP_201_CREATED if creacion else status.HTTP_200_OK
+        return status.HTTP_207_MULTI_STATUS if self.ids else status.HTTP_400_BAD_REQUEST
+
+
+class Lote:
+    """
+    Operaciones en lote sobre el modelo de `serializer_class`. Las subclases
+    replican en los ganchos creados() y modificados() el efecto de las señales.
+    """
+    serializer_class = None
+
+    def __init__(self, contexto=None, atomico=False):
+        self.contexto = contexto or {}
+        self.atomico = atomico
+        self.modelo = self.serializer_class.Meta.model
+
+    # ===== VALIDACIÓN =====
+
+    def _serializer(self, elementos, parcial):
+        """
+        Serializer que se reutiliza para todos los elementos (como hace
+        ListSerializer), con las relaciones ya leídas y sin UniqueValidator:
+        los campos únicos se comprueban después para todo el lote.
+        Devuelve el serializer y [(nombre, source, mensaje)] de esos campos.
+        """
+        serializer = self.serializer_class(context=self.contexto, partial=parcial)
+        unicos = []
+        for nombre, campo in list(serializer.fields.items()):
+            if campo.read_only:
+                continue
+            if isinstance(campo, serializers.PrimaryKeyRelatedField):
+                claves = set()
+                for elemento in elementos:
+                    if isinstance(elemento, dict) and elemento.get(nombre) is not None:
+                        try:
+                            claves.add(campo.get_queryset().model._meta.pk.to_python(elemento[nombre]))
+                        except (DjangoValidationError, TypeError):
+                            pass  # lo informa la validación del elemento
+                objetos = {}
+                with por_bloques():
+                    for bloque in bloques(claves):
+                        objetos.update(campo.get_queryset().in_bulk(bloque))
+                serializer.fields[nombre] = ClaveEnLote(objetos, **campo._kwargs)
+            validadores = [v for v in campo.validators if isinstance(v, UniqueValidator)]
+            if validadores:
+                campo.validators = [v for v in campo.validators if not isinstance(v, UniqueValidator)]
+                unicos.append((nombre, campo.source, validadores[0].message))
+        return serializer, unicos
+
+    def _validar(self, elementos, resultado, instancias=None):
+        """
+        Valida los elementos y devuelve [(indice, datos, instancia)] de los
+        válidos; los errores quedan en `resultado`. Con `instancias`
+        (indice -> objeto) la validación es parcial, como en un PATCH.
+        """
+        serializer, unicos = self._serializer(elementos, parcial=instancias is not None)
+        validos = []
+        for indice, elemento in enumerate(elementos):
+            if indice in resultado.errores:
+                continue
+            instancia = instancias[indice] if instancias is not None else None
+            serializer.instance = instancia
+            try:
+                validos.append((indice, serializer.run_validation(elemento), instancia))
+            except serializers.ValidationError as e:
+                resultado.errores[indice] = e.detail
+        for nombre, source, mensaje in unicos:
+            validos = self._comprobar_unico(validos, nombre, source, mensaje, resultado)
+        return validos
+
+    def _comprobar_unico(self, validos, nombre, source, mensaje, resultado):
+        """Descarta los elementos cuyo valor ya existe en la tabla o se repite en el lote"""
+        valores = {datos[source] for _, datos, _ in validos if source in datos}
+        existentes = {}
+        with por_bloques():
+            for bloque in bloques(valores):
+                existentes.update(
+                    self.modelo.objects.filter(**{f'{source}__in': bloque}).values_list(source, 'pk')
+                )
+        vistos = set()
+        correctos = []
+        for indice, datos, instancia in validos:
+            valor = datos.get(source)
+            propio = instancia.pk if instancia is not None else None
+            if valor is not None and (existentes.get(valor, propio) != propio or valor in vistos):
+                resultado.errores[indice] = {nombre: [mensaje]}
+                continue
+            vistos.add(valor)
+            correctos.append((indice, datos, instancia))
+        return correctos
+
+    def _descartar_con_errores(self, validos, resultado):
+        return [valido for valido in validos if valido[0] not in resultado.errores]
+
+    def _ids(self, elementos, resultado):
+        """
+        Clave de cada elemento (un id o un objeto con 'id'): indice -> id.
+        Los elementos sin clave válida, repetidos o que no existen quedan como errores.
+        """
+        campo_pk = self.modelo._meta.pk
+        ids = {}
+        for indice, elemento in enumerate(elementos):
+            valor = elemento.get('id') if isinstance(elemento, dict) else elemento
+            try:
+                ids[indice] = campo_pk.to_python(valor) if not isinstance(valor, bool) else None
+            except (DjangoValidationError, TypeError):
+                ids[indice] = None
+            if ids[indice] is None:
+                resultado.errores[indice] = {'id': ['Se necesita el id del elemento']}
+                del ids[indice]
+        vistos = set()
+        for indice, objeto_id in list(ids.items()):
+            if objeto_id in vistos:
+                resultado.errores[indice] = {'id': ['Elemento repetido en el lote']}
+                del ids[indice]
+            vistos.add(objeto_id)
+        return ids
+
+    def _no_encontrados(self, ids, encontrados, resultado):
+        for indice, objeto_id in list(ids.items()):
+            if objeto_id not in encontrados:
+                resultado.errores[indice] = {'id': [f'No existe ningún elemento con id {objeto_id}']}
+                del ids[indice]
+
+    # ===== OPERACIONES =====
+
+    def crear(self, elementos):
+        resultado = Resultado(len(elementos))
+        validos = self._validar(elementos, resultado)
+        if not validos or (self.atomico and resultado.errores):
+            return resultado
+        with transaction.atomic():
+            creados = self.guardar_nuevos(validos, resultado)
+            if not creados:
+                return resultado
+            self.creados([objeto for _, objeto in creados])
+        for indice, objeto in creados:
+            resultado.ids[indice] = objeto.pk
+        return resultado
+
+    @transaction.atomic
+    def actualizar(self, elementos):
+        # Las filas quedan bloqueadas desde que se leen hasta que se escriben
+        resultado = Resultado(len(elementos))
+        ids = self._ids(elementos, resultado)
+        objetos = {}
+        with por_bloques():
+            for bloque in bloques(set(ids.values())):
+                objetos.update(self.consulta_actualizacion().select_for_update().in_bulk(bloque))
+        self._no_encontrados(ids, objetos, resultado)
+        instancias = {indice: objetos.get(objeto_id) for indice, objeto_id in ids.items()}
+        validos = self._validar(elementos, resultado, instancias)
+        if not validos or (self.atomico and resultado.errores):
+            return resultado
+
+        enviados = {instancia.pk: set(datos) for _, datos, instancia in validos}
+        campos = set()
+        for _, datos, instancia in validos:
+            for campo, valor in datos.items():
+                setattr(instancia, campo, valor)
+            campos.update(datos)
+        modificados = [instancia for _, _, instancia in validos]
+        campos = self.campos_actualizados(modificados, campos)
+        with por_bloques():
+            self.modelo.objects.bulk_update(modificados, sorted(campos), batch_size=TAMANO_BLOQUE)
+        self.modificados(modificados, enviados)
+        for indice, _, instancia in validos:
+            resultado.ids[indice] = instancia.pk
+        return resultado
+
+    def eliminar(self, elementos):
+        resultado = Resultado(len(elementos))
+        ids = self._ids(elementos, resultado)
+        existentes = set()
+        with por_bloques():
+            for bloque in bloques(set(ids.values())):
+                existentes.update(self.modelo.objects.filter(pk__in=bloque).values_list('pk', flat=True))
+        self._no_encontrados(ids, existentes, resultado)
+        if not ids or (self.atomico and resultado.errores):
+            return resultado
+        with transaction.atomic():
+            for bloque in bloques(ids.values()):
+                self.modelo.objects.filter(pk__in=bloque).delete()
+        resultado.ids.update(ids)
+        return resultado
+
+    # ===== GANCHOS =====
+
+    def consulta_actualizacion(self):
+        """Queryset del que se leen los objetos a modificar"""
+        return self.modelo.objects.all()
+
+    def guardar_nuevos(self, validos, resultado):
+        """Inserta los elementos válidos; devuelve [(indice, objeto)] de los creados"""
+        creados = [(indice, self.modelo(**datos)) for indice, datos, _ in validos]
+        with por_bloques():
+            self.modelo.objects.bulk_create([objeto for _, objeto in creados], batch_size=TAMANO_BLOQUE)
+        return creados
+
+    def campos_actualizados(self, objetos, campos):
+        """Columnas que escribe bulk_update (los auto_now no se rellenan solos)"""
+        return campos
+
+    def creados(self, objetos):
+        """Lo que haría post_save(created=True) con cada objeto"""
+
+    def modificados(self, objetos, enviados):
+        """Lo que haría post_save con cada objeto; `enviados` es id -> campos modificados"""
+
+
+class LoteLibros(Lote):
+    serializer_class = LibroSerializer
+
+    def consulta_actualizacion(self):
+        # El autor hace falta para reindexar los libros modificados
+        return Libro.objects.select_related('autor')
+
+    def guardar_nuevos(self, validos, resultado):
+        creados = super().guardar_nuevos(validos, resultado)
+        libros = [libro for _, libro in creados]
+        if libros and libros[0].pk is None:
+            # MySQL no devuelve las claves de bulk_create, se leen por ISBN
+            ids = {}
+            with por_bloques():
+                for bloque in bloques(libro.isbn for libro in libros):
+                    ids.update(Libro.objects.filter(isbn__in=bloque).values_list('isbn', 'id'))
+            for libro in libros:
+                libro.pk = ids[libro.isbn]
+        return creados
+
+    def campos_actualizados(self, objetos, campos):
+        ahora = timezone.now()
+        for libro in objetos:
+            libro.ultima_actualizacion = ahora
+        return campos | {'ultima_actualizacion'}
+
+    def creados(self, libros):
+        estadisticas.ajustar_contador(estadisticas.CONTADOR_LIBROS, len(libros))
+        estadisticas.ajustar_categorias(Counter(libro.categoria_id for libro in libros))
+        for libro in libros:
+            libro._categoria_id_original = libro.categoria_id
+        with por_bloques():
+            busqueda.indexar_libros(libros, nuevos=True)
+        autocompletado.libros_guardados(libros)
+        invalidar(GRUPO_PANEL)
+
+    def modificados(self, libros, enviados):
+        categorias = Counter()
+        for libro in libros:
+            if libro._categoria_id_original != libro.categoria_id:
+                categorias[libro._categoria_id_original] -= 1
+                categorias[libro.categoria_id] += 1
+            libro._categoria_id_original = libro.categoria_id
+        estadisticas.ajustar_categorias(categorias)
+        # Solo se reindexan los libros con cambios en los campos indexados
+        with por_bloques():
+            busqueda.indexar_libros([
+                libro for libro in libros
+                if enviados[libro.pk] & {'titulo', 'isbn', 'autor'}
+            ])
+        autocompletado.libros_guardados(libros)
+        invalidar(GRUPO_PANEL)
+
+
+class LotePrestamos(Lote):
+    serializer_class = PrestamoSerializer
+
+    def guardar_nuevos(self, validos, resultado):
+        """
+        Los préstamos activos descuentan un ejemplar de su libro, como
+        prestar_libro(). Las filas de los libros de todo el lote se bloquean
+        (también las de los préstamos no activos, ver _leer_ids) y los
+        ejemplares se reparten en el orden del lote; los préstamos que se
+        quedan sin ejemplar son errores. El stock se descuenta con un UPDATE
+        por cada número de ejemplares prestados de un mismo libro (casi
+        siempre uno solo); bulk_update escribiría un CASE por fila y columna.
+        """
+        activos = [(indice, datos) for indice, datos, _ in validos if datos.get('estado', 'activo') == 'activo']
+        libros = {}
+        with por_bloques():
+            for bloque in bloques({datos['libro'].pk for _, datos, _ in validos}):
+                libros.update(Libro.objects.select_for_update().only(
+                    'id', 'titulo', 'estado', 'stock_disponible'
+                ).in_bulk(bloque))
+
+        prestados = Counter()
+        for indice, datos in activos:
+            libro = libros[datos['libro'].pk]
+            if libro.estado != 'disponible' or libro.stock_disponible <= prestados[libro.pk]:
+                resultado.errores[indice] = {'libro': [f"El libro '{libro.titulo}' no está disponible"]}
+                continue
+            prestados[libro.pk] += 1
+        if self.atomico and resultado.errores:
+            return []
+
+        por_cantidad = {}
+        for libro_id, cantidad in prestados.items():
+            por_cantidad.setdefault(cantidad, []).append(libro_id)
+        ahora = timezone.now()
+        with por_bloques():
+            for cantidad, libro_ids in por_cantidad.items():
+                for bloque in bloques(libro_ids):
+                    # `estado` va antes que `stock_disponible` (ver prestar_libro)
+                    Libro.objects.filter(id__in=bloque).update(
+                        estado=Case(
+                            When(stock_disponible__lte=cantidad, then=Value('prestado')),
+                            default=F('estado'),
+                        ),
+                        stock_disponible=F('stock_disponible') - cantidad,
+                        ultima_actualizacion=ahora,
+                    )
+        validos = self._descartar_con_errores(validos, resultado)
+        if connections[router.db_for_write(Prestamo)].features.can_return_rows_from_bulk_insert:
+            return super().guardar_nuevos(validos, resultado)
+        ultimo = Prestamo.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+        creados = super().guardar_nuevos(validos, resultado)
+        self._leer_ids([prestamo for _, prestamo in creados], ultimo)
+        return creados
+
+    def _leer_ids(self, prestamos, ultimo):
+        """
+        Asigna a los préstamos recién insertados sus id, que son mayores que
+        `ultimo` y siguen el orden del INSERT. Los libros del lote siguen
+        bloqueados, así que prestar_libro() y otros lotes no pueden insertar
+        a la vez préstamos de esos libros; la lectura también bloquea (FOR
+        UPDATE lee la última versión confirmada y, en InnoDB, cierra el rango
+        de id a nuevas filas) hasta el final de la transacción.
+        """
+        pendientes = {}
+        for prestamo in prestamos:
+            pendientes.setdefault((prestamo.libro_id, prestamo.usuario_id), []).append(prestamo)
+        with por_bloques():
+            for bloque in bloques({prestamo.libro_id for prestamo in prestamos}):
+                filas = Prestamo.objects.select_for_update().filter(
+                    id__gt=ultimo, libro_id__in=bloque
+                ).order_by('id')
+                for prestamo_id, libro_id, usuario_id in filas.values_list('id', 'libro_id', 'usuario_id'):
+                    cola = pendientes.get((libro_id, usuario_id))
+                    if cola:
+                        cola.pop(0).pk = prestamo_id
+
+    def creados(self, prestamos):
+        estadisticas.registrar_prestamos(prestamos)
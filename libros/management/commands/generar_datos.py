@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from libros import generador
+
+
+class Command(BaseCommand):
+    help = "Genera datos sintéticos masivos (bulk_create por lotes) para pruebas de carga"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=1000)
+        parser.add_argument('--autores', type=int, default=2000)
+        parser.add_argument('--editoriales', type=int, default=200)
+        parser.add_argument('--categorias', type=int, default=30)
+        parser.add_argument('--libros', type=int, default=100_000)
+        parser.add_argument('--prestamos', type=int, default=500_000)
+        parser.add_argument('--semilla', type=int, default=1,
+                            help="Misma semilla, mismos datos (por defecto 1)")
+        parser.add_argument('--activos', type=float, default=0.1,
+                            help="Proporción de préstamos sin devolver (por defecto 0.1)")
+        parser.add_argument('--vencidos', type=float, default=0.2,
+                            help="Proporción de préstamos activos ya vencidos (por defecto 0.2)")
+        parser.add_argument('--zipf', type=float, default=1.0,
+                            help="Exponente de la distribución de popularidad (por defecto 1.0)")
+        parser.add_argument('--dias', type=int, default=730,
+                            help="Días de historial de préstamos (por defecto 730)")
+        parser.add_argument('--lote', type=int, default=5000,
+                            help="Filas por INSERT (por defecto 5000)")
+        parser.add_argument('--sin-reconstruir', action='store_true',
+                            help="No reconstruir estadísticas ni índice de búsqueda al terminar")
+
+    def handle(self, *args, **options):
+        try:
+            totales = generador.generar(
+                usuarios=options['usuarios'],
+                autores=options['autores'],
+                editoriales=options['editoriales'],
+                categorias=options['categorias'],
+                libros=options['libros'],
+                prestamos=options['prestamos'],
+                semilla=options['semilla'],
+                proporcion_activos=options['activos'],
+                proporcion_vencidos=options['vencidos'],
+                exponente_zipf=options['zipf'],
+                dias_historia=options['dias'],
+                tamano_lote=options['lote'],
+                reconstruir=not options['sin_reconstruir'],
+                informar=self.stdout.write,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            "Datos generados: " + ", ".join(f"{total} {nombre}" for nombre, total in totales.items())
+        ))
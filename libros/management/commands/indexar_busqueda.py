@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from libros import busqueda
+
+
+class Command(BaseCommand):
+    help = "Reconstruye desde cero el índice de búsqueda de libros"
+
+    def handle(self, *args, **options):
+        total = busqueda.reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS(f"Índice de búsqueda reconstruido: {total} libros"))
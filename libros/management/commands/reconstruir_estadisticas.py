@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from libros import estadisticas
+
+
+class Command(BaseCommand):
+    help = "Recalcula desde cero las estadísticas precalculadas del panel"
+
+    def handle(self, *args, **options):
+        resumen = estadisticas.reconstruir()
+        self.stdout.write(self.style.SUCCESS(
+            f"Estadísticas reconstruidas: {resumen['dias']} días, "
+            f"{resumen['libros']} libros, {resumen['autores']} autores, "
+            f"{resumen['categorias']} categorías"
+        ))
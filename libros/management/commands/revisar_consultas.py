@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from libros import planes
+
+
+class Command(BaseCommand):
+    help = "Muestra qué consultas frecuentes recorren tablas completas (EXPLAIN)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help="Base de datos a revisar (por defecto 'default')")
+        parser.add_argument('--plan', action='store_true',
+                            help="Imprime el plan completo de cada consulta")
+
+    def handle(self, *args, **options):
+        try:
+            resultados = planes.revisar_consultas(options['database'])
+        except NotImplementedError as e:
+            raise CommandError(str(e))
+
+        con_escaneo = 0
+        for nombre, lineas, tablas in resultados:
+            if tablas:
+                con_escaneo += 1
+                self.stdout.write(self.style.WARNING(f"{nombre}: recorre {', '.join(tablas)} completa"))
+            else:
+                self.stdout.write(f"{nombre}: ok")
+            if options['plan']:
+                for linea in lineas:
+                    self.stdout.write(f"    {linea}")
+
+        if con_escaneo:
+            raise CommandError(f"{con_escaneo} de {len(resultados)} consultas recorren tablas completas")
+        self.stdout.write(self.style.SUCCESS(f"Las {len(resultados)} consultas usan índices"))
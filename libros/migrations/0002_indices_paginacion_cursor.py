@@ -0,0 +1,52 @@
+# Generated by Django 5.2.10 on 2026-10-17 13:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("libros", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="autor",
+            index=models.Index(fields=["apellido", "id"], name="autor_apellido_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="autor",
+            index=models.Index(fields=["nombre", "id"], name="autor_nombre_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="libro",
+            index=models.Index(fields=["titulo", "id"], name="libro_titulo_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="libro",
+            index=models.Index(
+                fields=["fecha_publicacion", "id"], name="libro_fecha_pub_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="libro",
+            index=models.Index(
+                fields=["stock_disponible", "id"], name="libro_stock_disp_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prestamo",
+            index=models.Index(
+                fields=["fecha_prestamo", "id"], name="prestamo_fecha_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prestamo",
+            index=models.Index(
+                fields=["fecha_devolucion_esperada", "id"],
+                name="prestamo_fecha_dev_id_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,177 @@
+# Generated by Django 5.2.10 on 2026-10-17 13:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def calcular_estadisticas(apps, schema_editor):
+    """
+    Rellena las estadísticas con los datos que ya existían antes de crear
+    las tablas: sin esto los contadores empezarían en cero y las señales
+    solo sumarían lo nuevo. Copia de estadisticas.reconstruir() con los
+    modelos históricos.
+    """
+    Libro = apps.get_model("libros", "Libro")
+    Autor = apps.get_model("libros", "Autor")
+    Categoria = apps.get_model("libros", "Categoria")
+    Prestamo = apps.get_model("libros", "Prestamo")
+    Contador = apps.get_model("libros", "Contador")
+    EstadisticaDiaria = apps.get_model("libros", "EstadisticaDiaria")
+    EstadisticaLibro = apps.get_model("libros", "EstadisticaLibro")
+    EstadisticaAutor = apps.get_model("libros", "EstadisticaAutor")
+    EstadisticaCategoria = apps.get_model("libros", "EstadisticaCategoria")
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+
+    dias = {}
+    for fecha, total in (Prestamo.objects.values("fecha_prestamo")
+                         .annotate(total=Count("id")).order_by()
+                         .values_list("fecha_prestamo", "total")):
+        dias[fecha] = EstadisticaDiaria(fecha=fecha, prestamos=total)
+    for fecha, total in (Prestamo.objects.filter(fecha_devolucion_real__isnull=False)
+                         .values("fecha_devolucion_real")
+                         .annotate(total=Count("id")).order_by()
+                         .values_list("fecha_devolucion_real", "total")):
+        dias.setdefault(fecha, EstadisticaDiaria(fecha=fecha)).devoluciones = total
+    EstadisticaDiaria.objects.bulk_create(dias.values(), batch_size=1000)
+
+    EstadisticaLibro.objects.bulk_create(
+        (EstadisticaLibro(libro_id=libro_id, total_prestamos=total)
+         for libro_id, total in (Prestamo.objects.values("libro_id")
+                                 .annotate(total=Count("id")).order_by()
+                                 .values_list("libro_id", "total"))),
+        batch_size=1000,
+    )
+    EstadisticaAutor.objects.bulk_create(
+        (EstadisticaAutor(autor_id=autor_id, total_prestamos=total)
+         for autor_id, total in (Prestamo.objects.values("libro__autor_id")
+                                 .annotate(total=Count("id")).order_by()
+                                 .values_list("libro__autor_id", "total"))),
+        batch_size=1000,
+    )
+    EstadisticaCategoria.objects.bulk_create(
+        (EstadisticaCategoria(categoria_id=categoria_id, total_libros=total)
+         for categoria_id, total in (Categoria.objects.annotate(total=Count("libros"))
+                                     .order_by().values_list("id", "total"))),
+        batch_size=1000,
+    )
+    Contador.objects.bulk_create([
+        Contador(nombre="libros", valor=Libro.objects.count()),
+        Contador(nombre="autores", valor=Autor.objects.count()),
+        Contador(nombre="usuarios", valor=User.objects.count()),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("libros", "0002_indices_paginacion_cursor"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Contador",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("nombre", models.CharField(max_length=50, unique=True)),
+                ("valor", models.BigIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Contador",
+                "verbose_name_plural": "Contadores",
+            },
+        ),
+        migrations.CreateModel(
+            name="EstadisticaAutor",
+            fields=[
+                (
+                    "autor",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="estadistica",
+                        serialize=False,
+                        to="libros.autor",
+                    ),
+                ),
+                ("total_prestamos", models.IntegerField(db_index=True, default=0)),
+            ],
+            options={
+                "verbose_name": "Estadística de autor",
+                "verbose_name_plural": "Estadísticas de autores",
+            },
+        ),
+        migrations.CreateModel(
+            name="EstadisticaCategoria",
+            fields=[
+                (
+                    "categoria",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="estadistica",
+                        serialize=False,
+                        to="libros.categoria",
+                    ),
+                ),
+                ("total_libros", models.IntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Estadística de categoría",
+                "verbose_name_plural": "Estadísticas de categorías",
+            },
+        ),
+        migrations.CreateModel(
+            name="EstadisticaDiaria",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("fecha", models.DateField(unique=True)),
+                ("prestamos", models.IntegerField(default=0)),
+                ("devoluciones", models.IntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Estadística diaria",
+                "verbose_name_plural": "Estadísticas diarias",
+                "ordering": ["fecha"],
+            },
+        ),
+        migrations.CreateModel(
+            name="EstadisticaLibro",
+            fields=[
+                (
+                    "libro",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="estadistica",
+                        serialize=False,
+                        to="libros.libro",
+                    ),
+                ),
+                ("total_prestamos", models.IntegerField(db_index=True, default=0)),
+            ],
+            options={
+                "verbose_name": "Estadística de libro",
+                "verbose_name_plural": "Estadísticas de libros",
+            },
+        ),
+        migrations.RunPython(calcular_estadisticas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 5.2.10 on 2026-10-17 13:34
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Copia de la normalización de libros/busqueda.py tal como estaba al crear la
+# tabla: la migración no debe cambiar si más adelante cambia esa función
+LONGITUD_TERMINO = 40
+PALABRAS_VACIAS = frozenset((
+    "a", "al", "con", "de", "del", "el", "en", "la", "las", "lo", "los",
+    "para", "por", "un", "una", "y", "the", "of", "and",
+))
+_PATRON_TERMINO = re.compile(r"[a-z0-9]+")
+
+
+def normalizar(texto):
+    descompuesto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def terminos(texto):
+    vistos = []
+    for termino in _PATRON_TERMINO.findall(normalizar(texto)):
+        termino = termino[:LONGITUD_TERMINO]
+        if termino not in PALABRAS_VACIAS and termino not in vistos:
+            vistos.append(termino)
+    return vistos
+
+
+def terminos_de_libro(titulo, isbn, autor_nombre, autor_apellido):
+    pares = [("t", termino) for termino in terminos(titulo)]
+    pares += [("a", termino) for termino in terminos(f"{autor_nombre} {autor_apellido}")]
+    isbn = "".join(_PATRON_TERMINO.findall(normalizar(isbn)))
+    if isbn:
+        pares.append(("i", isbn[:LONGITUD_TERMINO]))
+    return pares
+
+
+def indexar_libros(apps, schema_editor):
+    """Indexa los libros que ya existían antes de crear la tabla"""
+    Libro = apps.get_model("libros", "Libro")
+    TerminoBusqueda = apps.get_model("libros", "TerminoBusqueda")
+    entradas = []
+    libros = Libro.objects.order_by().values_list(
+        "id", "titulo", "isbn", "autor__nombre", "autor__apellido"
+    )
+    for libro_id, *campos in libros.iterator(chunk_size=2000):
+        entradas.extend(
+            TerminoBusqueda(libro_id=libro_id, campo=campo, termino=termino)
+            for campo, termino in terminos_de_libro(*campos)
+        )
+        if len(entradas) >= 2000:
+            TerminoBusqueda.objects.bulk_create(entradas)
+            entradas = []
+    TerminoBusqueda.objects.bulk_create(entradas)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("libros", "0003_estadisticas_precalculadas"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TerminoBusqueda",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("termino", models.CharField(max_length=40)),
+                (
+                    "campo",
+                    models.CharField(
+                        choices=[("t", "Título"), ("a", "Autor"), ("i", "ISBN")],
+                        max_length=1,
+                    ),
+                ),
+                (
+                    "libro",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="terminos_busqueda",
+                        to="libros.libro",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Término de búsqueda",
+                "verbose_name_plural": "Términos de búsqueda",
+                "indexes": [
+                    models.Index(
+                        fields=["termino", "campo", "libro"],
+                        name="termino_busqueda_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(indexar_libros, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.10 on 2026-10-17 14:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("libros", "0004_indice_busqueda"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="libro",
+            index=models.Index(
+                fields=["estado", "titulo", "id"], name="libro_estado_titulo_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="libro",
+            index=models.Index(
+                fields=["categoria", "titulo", "id"], name="libro_categoria_titulo_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="libro",
+            index=models.Index(
+                fields=["autor", "titulo", "id"], name="libro_autor_titulo_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prestamo",
+            index=models.Index(
+                fields=["usuario", "estado", "fecha_prestamo", "id"],
+                name="prestamo_usuario_estado_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prestamo",
+            index=models.Index(
+                fields=["estado", "fecha_prestamo", "id"],
+                name="prestamo_estado_fecha_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prestamo",
+            index=models.Index(
+                fields=["estado", "fecha_devolucion_esperada", "id"],
+                name="prestamo_estado_fecha_dev_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prestamo",
+            index=models.Index(
+                fields=["libro", "fecha_prestamo", "id"],
+                name="prestamo_libro_fecha_idx",
+            ),
+        ),
+    ]
@@ -15,9 +15,26 @@ class Autor(models.Model):
         verbose_name = "Autor"
         verbose_name_plural = "Autores"
         ordering = ['apellido', 'nombre']
+        # Índices para la paginación por cursor (campo de orden + id)
+        indexes = [
+            models.Index(fields=['apellido', 'id'], name='autor_apellido_id_idx'),
+            models.Index(fields=['nombre', 'id'], name='autor_nombre_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.nombre} {self.apellido}"
+    
+    @property
+    def nombre_completo(self):
+        return f"{self.nombre} {self.apellido}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Nombre leído de la BD, para actualizar el autocompletado
+        if 'nombre' in instancia.__dict__ and 'apellido' in instancia.__dict__:
+            instancia._nombre_original = (instancia.nombre, instancia.apellido)
+        return instancia
 
 
 class Editorial(models.Model):
@@ -48,6 +65,13 @@ class Categoria(models.Model):
     
     def __str__(self):
         return self.nombre
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Nombre leído de la BD, para actualizar el autocompletado
+        instancia._nombre_original = instancia.__dict__.get('nombre')
+        return instancia
 
 
 class Libro(models.Model):
@@ -79,10 +103,29 @@ class Libro(models.Model):
         verbose_name = "Libro"
         verbose_name_plural = "Libros"
         ordering = ['titulo']
+        # Índices para la paginación por cursor (campo de orden + id)
+        indexes = [
+            models.Index(fields=['titulo', 'id'], name='libro_titulo_id_idx'),
+            models.Index(fields=['fecha_publicacion', 'id'], name='libro_fecha_pub_id_idx'),
+            models.Index(fields=['stock_disponible', 'id'], name='libro_stock_disp_id_idx'),
+            # Filtros frecuentes seguidos del orden por título (ver libros/planes.py)
+            models.Index(fields=['estado', 'titulo', 'id'], name='libro_estado_titulo_idx'),
+            models.Index(fields=['categoria', 'titulo', 'id'], name='libro_categoria_titulo_idx'),
+            models.Index(fields=['autor', 'titulo', 'id'], name='libro_autor_titulo_idx'),
+        ]
     
     def __str__(self):
         return f"{self.titulo} - {self.autor}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Categoría leída de la BD, para detectar cambios en las estadísticas
+        instancia._categoria_id_original = instancia.__dict__.get('categoria_id')
+        # Título leído de la BD, para actualizar el autocompletado
+        instancia._titulo_original = instancia.__dict__.get('titulo')
+        return instancia
+    
     def esta_disponible(self):
         """Verifica si el libro está disponible para préstamo"""
         return self.estado == 'disponible' and self.stock_disponible > 0
@@ -111,6 +154,16 @@ class Prestamo(models.Model):
         verbose_name = "Préstamo"
         verbose_name_plural = "Préstamos"
         ordering = ['-fecha_prestamo']
+        # Índices para la paginación por cursor (campo de orden + id)
+        indexes = [
+            models.Index(fields=['fecha_prestamo', 'id'], name='prestamo_fecha_id_idx'),
+            models.Index(fields=['fecha_devolucion_esperada', 'id'], name='prestamo_fecha_dev_id_idx'),
+            # Filtros frecuentes seguidos de su orden (ver libros/planes.py)
+            models.Index(fields=['usuario', 'estado', 'fecha_prestamo', 'id'], name='prestamo_usuario_estado_idx'),
+            models.Index(fields=['estado', 'fecha_prestamo', 'id'], name='prestamo_estado_fecha_idx'),
+            models.Index(fields=['estado', 'fecha_devolucion_esperada', 'id'], name='prestamo_estado_fecha_dev_idx'),
+            models.Index(fields=['libro', 'fecha_prestamo', 'id'], name='prestamo_libro_fecha_idx'),
+        ]
     
     def __str__(self):
         return f"{self.libro.titulo} - {self.usuario.username} ({self.estado})"
@@ -118,4 +171,106 @@ class Prestamo(models.Model):
     def esta_vencido(self):
         """Verifica si el préstamo está vencido"""
         from datetime import date
-        return self.estado == 'activo' and self.fecha_devolucion_esperada < date.today()
\ No newline at end of file
+        return self.estado == 'activo' and self.fecha_devolucion_esperada < date.today()
+
+
+# ===== ESTADÍSTICAS PRECALCULADAS =====
+# Se actualizan de forma incremental (ver libros/estadisticas.py) y se
+# reconstruyen con: python manage.py reconstruir_estadisticas
+
+class EstadisticaDiaria(models.Model):
+    """Préstamos y devoluciones registrados por día"""
+    fecha = models.DateField(unique=True)
+    prestamos = models.IntegerField(default=0)
+    devoluciones = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name = "Estadística diaria"
+        verbose_name_plural = "Estadísticas diarias"
+        ordering = ['fecha']
+    
+    def __str__(self):
+        return f"{self.fecha}: {self.prestamos} préstamos"
+
+
+class EstadisticaLibro(models.Model):
+    """Total de préstamos por libro"""
+    libro = models.OneToOneField(Libro, on_delete=models.CASCADE, primary_key=True, related_name='estadistica')
+    total_prestamos = models.IntegerField(default=0, db_index=True)
+    
+    class Meta:
+        verbose_name = "Estadística de libro"
+        verbose_name_plural = "Estadísticas de libros"
+    
+    def __str__(self):
+        return f"{self.libro_id}: {self.total_prestamos} préstamos"
+
+
+class EstadisticaAutor(models.Model):
+    """Total de préstamos de los libros de cada autor"""
+    autor = models.OneToOneField(Autor, on_delete=models.CASCADE, primary_key=True, related_name='estadistica')
+    total_prestamos = models.IntegerField(default=0, db_index=True)
+    
+    class Meta:
+        verbose_name = "Estadística de autor"
+        verbose_name_plural = "Estadísticas de autores"
+    
+    def __str__(self):
+        return f"{self.autor_id}: {self.total_prestamos} préstamos"
+
+
+class EstadisticaCategoria(models.Model):
+    """Total de libros por categoría"""
+    categoria = models.OneToOneField(Categoria, on_delete=models.CASCADE, primary_key=True, related_name='estadistica')
+    total_libros = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name = "Estadística de categoría"
+        verbose_name_plural = "Estadísticas de categorías"
+    
+    def __str__(self):
+        return f"{self.categoria_id}: {self.total_libros} libros"
+
+
+class Contador(models.Model):
+    """Totales globales (libros, autores, usuarios)"""
+    nombre = models.CharField(max_length=50, unique=True)
+    valor = models.BigIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = "Contador"
+        verbose_name_plural = "Contadores"
+    
+    def __str__(self):
+        return f"{self.nombre}: {self.valor}"
+
+
+# ===== ÍNDICE DE BÚSQUEDA =====
+# Se mantiene con señales (ver libros/busqueda.py) y se reconstruye con:
+# python manage.py indexar_busqueda
+
+class TerminoBusqueda(models.Model):
+    """Término normalizado de un campo de un libro (índice invertido)"""
+    CAMPO_TITULO = 't'
+    CAMPO_AUTOR = 'a'
+    CAMPO_ISBN = 'i'
+    CAMPO_CHOICES = [
+        (CAMPO_TITULO, 'Título'),
+        (CAMPO_AUTOR, 'Autor'),
+        (CAMPO_ISBN, 'ISBN'),
+    ]
+    
+    termino = models.CharField(max_length=40)
+    campo = models.CharField(max_length=1, choices=CAMPO_CHOICES)
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='terminos_busqueda')
+    
+    class Meta:
+        verbose_name = "Término de búsqueda"
+        verbose_name_plural = "Términos de búsqueda"
+        # Cubre la búsqueda por rango de términos sin leer la tabla
+        indexes = [
+            models.Index(fields=['termino', 'campo', 'libro'], name='termino_busqueda_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.termino} ({self.get_campo_display()}) → {self.libro_id}"
@@ -0,0 +1,247 @@
+"""
+Paginación por cursor (keyset) compartida por la API REST y el servicio SOAP
+
+En lugar de OFFSET + COUNT(*), cada página filtra las filas posteriores a
+los valores de orden de la última fila entregada. Con un índice compuesto
+sobre (campos de orden, id) el coste de cada página es constante sin
+importar su profundidad.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+# ===== UTILIDADES KEYSET =====
+
+def invertir_orden(orden):
+    """Invierte la dirección de cada campo de orden"""
+    return [campo[1:] if campo.startswith('-') else f'-{campo}' for campo in orden]
+
+
+def orden_con_desempate(orden):
+    """Añade 'id' como desempate para que el orden sea total"""
+    orden = list(orden)
+    if not any(campo.lstrip('-') in ('id', 'pk') for campo in orden):
+        orden.append('-id' if orden and orden[0].startswith('-') else 'id')
+    return orden
+
+
+def condicion_keyset(orden, valores):
+    """
+    Condición "fila posterior a `valores`" para el orden dado, p. ej. para
+    ('titulo', 'id'): titulo > t OR (titulo = t AND id > i)
+    """
+    campos = [campo.lstrip('-') for campo in orden]
+    condicion = Q()
+    for i, campo in enumerate(orden):
+        lookup = 'lt' if campo.startswith('-') else 'gt'
+        paso = Q(**{f'{campos[i]}__{lookup}': valores[i]})
+        for previo, valor in zip(campos[:i], valores[:i]):
+            paso &= Q(**{previo: valor})
+        condicion |= paso
+    return condicion
+
+
+def codificar_cursor(valores, reverso=False):
+    """Codifica los valores de orden de una fila como cursor opaco"""
+    datos = {'v': valores}
+    if reverso:
+        datos['r'] = 1
+    texto = json.dumps(datos, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(texto.encode('utf-8')).decode('ascii')
+
+
+def decodificar_cursor(cursor, num_campos):
+    """
+    Devuelve (valores, reverso) de un cursor.
+    Lanza ValueError si el cursor no es válido para `num_campos` campos.
+    """
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        valores = datos['v']
+    except (ValueError, TypeError, KeyError, UnicodeError):
+        raise ValueError('Cursor inválido')
+    if not isinstance(valores, list) or len(valores) != num_campos:
+        raise ValueError('Cursor inválido')
+    return valores, bool(datos.get('r'))
+
+
+def convertir_valores(modelo, campos, valores):
+    """
+    Convierte los valores de un cursor al tipo de su campo de orden de
+    `modelo` (las fechas llegan como texto, por ejemplo). Lanza ValueError si
+    alguno es nulo o no es válido para su campo: el cursor está manipulado.
+    """
+    convertidos = []
+    for campo, valor in zip(campos, valores):
+        if valor is None or isinstance(valor, (list, dict)):
+            raise ValueError('Cursor inválido')
+        actual = modelo
+        try:
+            for parte in campo.split('__'):
+                campo_modelo = actual._meta.get_field(parte)
+                actual = campo_modelo.related_model
+            if campo_modelo.is_relation:
+                campo_modelo = campo_modelo.target_field
+            valor = campo_modelo.to_python(valor)
+        except FieldDoesNotExist:
+            pass  # anotación: se compara tal cual
+        except (ValidationError, TypeError, ValueError):
+            raise ValueError('Cursor inválido')
+        if valor is None:
+            raise ValueError('Cursor inválido')
+        convertidos.append(valor)
+    return convertidos
+
+
+def estimar_total(queryset):
+    """
+    Número aproximado de filas del queryset.
+    En MySQL usa la estimación de EXPLAIN (sin recorrer la tabla); en otros
+    motores recurre a COUNT(*).
+    """
+    conexion = connections[queryset.db]
+    if conexion.vendor != 'mysql':
+        return queryset.count()
+
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with conexion.cursor() as cursor:
+        cursor.execute(f'EXPLAIN {sql}', params)
+        columnas = [columna[0].lower() for columna in cursor.description]
+        fila = cursor.fetchone()
+    if not fila:
+        return 0
+    return int(fila[columnas.index('rows')] or 0)
+
+
+# ===== PAGINACIÓN REST =====
+
+class KeysetPagination(BasePagination):
+    """
+    Paginación por cursor sobre el orden efectivo de la vista (el de
+    OrderingFilter si el cliente envía ?ordering=) más 'id' como desempate.
+
+    Con ?count=estimated la respuesta incluye un total aproximado.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.orden = orden_con_desempate(self.get_ordering(request, queryset, view))
+        self.campos = [campo.lstrip('-') for campo in self.orden]
+        # Con only() (?fields=) los campos de orden también hacen falta para el cursor
+        inmediatos, diferidos = queryset.query.deferred_loading
+        if inmediatos and not diferidos:
+            queryset = queryset.only(*inmediatos, *self.campos)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'estimated':
+            self.count = estimar_total(queryset)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        reverso = False
+        if cursor:
+            try:
+                valores, reverso = decodificar_cursor(cursor, len(self.orden))
+                valores = convertir_valores(queryset.model, self.campos, valores)
+            except ValueError:
+                raise NotFound('Cursor inválido')
+            orden_pagina = invertir_orden(self.orden) if reverso else self.orden
+            queryset = queryset.filter(condicion_keyset(orden_pagina, valores))
+        else:
+            orden_pagina = self.orden
+
+        # Se pide una fila extra para saber si hay más en esa dirección
+        filas = list(queryset.order_by(*orden_pagina)[:self.page_size + 1])
+        hay_mas = len(filas) > self.page_size
+        filas = filas[:self.page_size]
+        if reverso:
+            filas.reverse()
+
+        if reverso:
+            self.tiene_siguiente, self.tiene_anterior = True, hay_mas
+        else:
+            self.tiene_siguiente, self.tiene_anterior = hay_mas, bool(cursor)
+        self.primera = filas[0] if filas else None
+        self.ultima = filas[-1] if filas else None
+        return filas
+
+    def get_page_size(self, request):
+        try:
+            tamano = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(tamano, self.max_page_size))
+
+    def get_ordering(self, request, queryset, view):
+        """Orden de la vista, respetando ?ordering= si hay OrderingFilter"""
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                orden = backend().get_ordering(request, queryset, view)
+                if orden:
+                    return orden
+        return getattr(view, 'ordering', None) or queryset.query.order_by or ['id']
+
+    def valores_de(self, objeto):
+        """Valores de los campos de orden de un objeto"""
+        valores = []
+        for campo in self.campos:
+            valor = objeto
+            for parte in campo.split('__'):
+                valor = getattr(valor, parte)
+            valores.append(valor)
+        return valores
+
+    def get_next_link(self):
+        if not self.tiene_siguiente or self.ultima is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, codificar_cursor(self.valores_de(self.ultima))
+        )
+
+    def get_previous_link(self):
+        if not self.tiene_anterior:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.primera is None:
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param,
+            codificar_cursor(self.valores_de(self.primera), reverso=True)
+        )
+
+    def get_paginated_response(self, data):
+        respuesta = OrderedDict()
+        if self.count is not None:
+            respuesta['count'] = self.count
+        respuesta['next'] = self.get_next_link()
+        respuesta['previous'] = self.get_previous_link()
+        respuesta['results'] = data
+        return Response(respuesta)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer', 'nullable': True},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,141 @@
+"""
+Planes de ejecución (EXPLAIN) de las consultas más frecuentes
+
+_consultas_frecuentes() reproduce, con valores de ejemplo, las consultas
+que lanzan views.py, soap_services.py y los filtros de los ViewSets.
+revisar_consultas() pide a la base de datos el plan de cada una y señala las
+que recorren una tabla completa: suelen indicar que falta un índice (ver
+Meta.indexes en models.py) o que la consulta dejó de usarlo.
+
+En MySQL el optimizador prefiere recorrer las tablas casi vacías, así que la
+revisión solo es representativa con datos (p. ej. tras populate_db.py).
+
+Uso:
+    python manage.py revisar_consultas [--plan]
+"""
+import re
+from datetime import date
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .busqueda import coincidencias
+from .models import Categoria, Libro, Prestamo
+from .paginacion import condicion_keyset
+from .soap_services import ORDEN_LIBROS, ORDEN_PRESTAMOS
+
+TAMANO_PAGINA = 50
+
+
+def _siguiente_pagina(queryset, orden, valores):
+    """Página posterior a `valores` en la paginación por cursor"""
+    return queryset.filter(condicion_keyset(orden, valores)).order_by(*orden)[:TAMANO_PAGINA + 1]
+
+
+def _consultas_frecuentes():
+    hoy = date.today()
+    disponibles = Libro.objects.filter(estado='disponible', stock_disponible__gt=0)
+    activos = Prestamo.objects.filter(estado='activo')
+    return {
+        # Catálogo HTML y API REST de libros
+        'catalogo': Libro.objects.select_related('autor', 'categoria', 'editorial')[:12],
+        'catalogo_por_categoria': Libro.objects.filter(categoria_id=1)[:12],
+        'catalogo_por_autor': Libro.objects.filter(autor_id=1)[:12],
+        'catalogo_con_stock': Libro.objects.filter(stock_disponible__gt=0)[:12],
+        'detalle_libro': Libro.objects.select_related('autor', 'categoria', 'editorial').filter(id=1),
+        'api_libros_pagina': _siguiente_pagina(Libro.objects.all(), ORDEN_LIBROS, ['M', 1]),
+        'api_libros_por_categoria': _siguiente_pagina(
+            Libro.objects.filter(categoria_id=1), ORDEN_LIBROS, ['M', 1]
+        ),
+        'api_libros_por_estado': _siguiente_pagina(
+            Libro.objects.filter(estado='prestado'), ORDEN_LIBROS, ['M', 1]
+        ),
+        'busqueda': coincidencias('cervantes quijote'),
+        # Servicio SOAP
+        'soap_libros_disponibles': _siguiente_pagina(disponibles, ORDEN_LIBROS, ['M', 1]),
+        'soap_libros_por_categoria': Libro.objects.filter(categoria__nombre__icontains='novela'),
+        'soap_prestamos_usuario': Prestamo.objects.filter(usuario_id=1),
+        'soap_prestamos_activos': _siguiente_pagina(activos, ORDEN_PRESTAMOS, [hoy, 1]),
+        # Préstamos: panel, cuenta del usuario y API REST
+        'total_prestamos_activos': activos.order_by().values('id'),
+        'mi_cuenta_activos': activos.filter(usuario_id=1).select_related('libro', 'libro__autor'),
+        'mi_cuenta_historial': Prestamo.objects.filter(usuario_id=1).exclude(estado='activo')[:20],
+        'prestamos_vencidos': activos.filter(fecha_devolucion_esperada__lt=hoy).order_by(
+            'fecha_devolucion_esperada', 'id'
+        ),
+        'api_prestamos_por_libro': _siguiente_pagina(
+            Prestamo.objects.filter(libro_id=1), ORDEN_PRESTAMOS, [hoy, 1]
+        ),
+    }
+
+
+# Tablas pequeñas que se pueden recorrer enteras (LIKE '%...%' sobre categorías)
+TABLAS_PEQUENAS = {Categoria._meta.db_table}
+
+
+# ===== EXPLAIN POR MOTOR =====
+
+_ESCANEO_SQLITE = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+_ESCANEO_POSTGRESQL = re.compile(r'Seq Scan on (\w+)')
+
+
+def _plan_sqlite(cursor, sql, params):
+    cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+    lineas = [fila[-1] for fila in cursor.fetchall()]
+    # "SCAN tabla" sin "USING (COVERING) INDEX" es un recorrido completo
+    tablas = [m.group(1) for m in map(_ESCANEO_SQLITE.match, lineas) if m]
+    return lineas, tablas
+
+
+def _plan_mysql(cursor, sql, params):
+    cursor.execute(f'EXPLAIN {sql}', params)
+    columnas = [columna[0] for columna in cursor.description]
+    filas = [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+    lineas = [
+        f"{fila['table']}: type={fila['type']} key={fila['key']} rows={fila['rows']} "
+        f"{fila.get('Extra') or ''}".rstrip()
+        for fila in filas
+    ]
+    # type=ALL: se leen todas las filas de la tabla
+    tablas = [fila['table'] for fila in filas if fila['type'] == 'ALL']
+    return lineas, tablas
+
+
+def _plan_postgresql(cursor, sql, params):
+    cursor.execute(f'EXPLAIN {sql}', params)
+    lineas = [fila[0] for fila in cursor.fetchall()]
+    tablas = [m.group(1) for linea in lineas for m in _ESCANEO_POSTGRESQL.finditer(linea)]
+    return lineas, tablas
+
+
+_PLANES = {
+    'sqlite': _plan_sqlite,
+    'mysql': _plan_mysql,
+    'postgresql': _plan_postgresql,
+}
+
+
+def explicar(queryset, using=DEFAULT_DB_ALIAS):
+    """
+    Plan de ejecución de `queryset` como (líneas del plan, tablas recorridas
+    enteras). Los alias de tabla de MySQL se devuelven tal cual.
+    """
+    conexion = connections[using]
+    try:
+        plan = _PLANES[conexion.vendor]
+    except KeyError:
+        raise NotImplementedError(f'EXPLAIN no soportado para {conexion.vendor}')
+    sql, params = queryset.query.get_compiler(using=using).as_sql()
+    with conexion.cursor() as cursor:
+        return plan(cursor, sql, params)
+
+
+def revisar_consultas(using=DEFAULT_DB_ALIAS):
+    """
+    Plan de cada consulta frecuente: lista de (nombre, líneas del plan,
+    tablas grandes recorridas enteras).
+    """
+    resultados = []
+    for nombre, queryset in _consultas_frecuentes().items():
+        lineas, tablas = explicar(queryset, using)
+        resultados.append((nombre, lineas, [tabla for tabla in tablas if tabla not in TABLAS_PEQUENAS]))
+    return resultados
@@ -0,0 +1,189 @@
+"""
+Servicio de préstamos compartido por las vistas HTML/REST y el servicio SOAP
+
+El stock se modifica con UPDATE condicionales dentro de una transacción, de
+modo que varias réplicas pueden prestar y devolver el mismo libro a la vez
+sin perder actualizaciones ni dejar el stock en negativo.
+"""
+from collections import Counter
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from . import estadisticas
+from .models import Libro, Prestamo
+
+MULTA_POR_DIA = Decimal('10.00')
+
+
+class PrestamoError(Exception):
+    """Error de negocio al prestar o devolver un libro"""
+
+
+class LibroNoDisponible(PrestamoError):
+    """El libro no tiene ejemplares disponibles para préstamo"""
+
+
+class PrestamoInactivo(PrestamoError):
+    """El préstamo ya fue devuelto o no está activo"""
+
+
+def prestar_libro(libro_id, usuario_id, dias, notas='', verificar_usuario=True):
+    """
+    Presta un ejemplar del libro al usuario por `dias` días.
+
+    En el caso normal son dos consultas: el descuento condicional del stock
+    y el INSERT del préstamo, más la comprobación del usuario si el llamador
+    no lo tiene ya validado (`verificar_usuario=False`). Lanza
+    Libro.DoesNotExist, User.DoesNotExist o LibroNoDisponible.
+    """
+    fecha_devolucion = date.today() + timedelta(days=dias)
+
+    with transaction.atomic():
+        # Dentro de la transacción la comprobación se lee del primario
+        if verificar_usuario and not User.objects.filter(id=usuario_id).exists():
+            raise User.DoesNotExist("Usuario no encontrado")
+
+        # `estado` va antes que `stock_disponible`: MySQL evalúa las
+        # asignaciones en orden, así el CASE ve el stock anterior
+        actualizados = Libro.objects.filter(
+            id=libro_id,
+            estado='disponible',
+            stock_disponible__gt=0,
+        ).update(
+            estado=Case(
+                When(stock_disponible__lte=1, then=Value('prestado')),
+                default=F('estado'),
+            ),
+            stock_disponible=F('stock_disponible') - 1,
+            ultima_actualizacion=timezone.now(),
+        )
+        if not actualizados:
+            titulo = Libro.objects.filter(id=libro_id).values_list('titulo', flat=True).first()
+            if titulo is None:
+                raise Libro.DoesNotExist("Libro no encontrado")
+            raise LibroNoDisponible(f"El libro '{titulo}' no está disponible")
+
+        prestamo = Prestamo.objects.create(
+            libro_id=libro_id,
+            usuario_id=usuario_id,
+            fecha_devolucion_esperada=fecha_devolucion,
+            estado='activo',
+            notas=notas,
+        )
+
+    return prestamo
+
+
+def _cerrar(prestamo, hoy):
+    """
+    Estado, multa y fecha de devolución de un préstamo activo que se devuelve
+    `hoy`: MULTA_POR_DIA por cada día de retraso, y estado 'vencido'.
+
+    El vencimiento se comprueba antes de cambiar el estado (esta_vencido()
+    exige 'activo'). La devolución anterior lo cambiaba primero y nunca
+    cobraba multa: desde este servicio las devoluciones tardías sí la cobran.
+    """
+    if prestamo.esta_vencido():
+        dias_retraso = (hoy - prestamo.fecha_devolucion_esperada).days
+        prestamo.multa = dias_retraso * MULTA_POR_DIA
+        prestamo.estado = 'vencido'
+    else:
+        prestamo.estado = 'devuelto'
+    prestamo.fecha_devolucion_real = hoy
+
+
+def devolver_prestamo(prestamo_id):
+    """
+    Registra la devolución de un préstamo activo y devuelve el ejemplar.
+
+    Calcula la multa si el préstamo está vencido. Devuelve el préstamo
+    actualizado. Lanza Prestamo.DoesNotExist o PrestamoInactivo.
+    """
+    hoy = date.today()
+
+    with transaction.atomic():
+        prestamo = Prestamo.objects.only(
+            'id', 'libro_id', 'estado', 'fecha_devolucion_esperada', 'multa'
+        ).get(id=prestamo_id)
+        if prestamo.estado != 'activo':
+            raise PrestamoInactivo("El préstamo ya fue devuelto o está inactivo")
+        _cerrar(prestamo, hoy)
+
+        # Condicional sobre estado='activo' para que dos devoluciones
+        # simultáneas no repongan el ejemplar dos veces
+        actualizados = Prestamo.objects.filter(id=prestamo_id, estado='activo').update(
+            estado=prestamo.estado,
+            fecha_devolucion_real=hoy,
+            multa=prestamo.multa,
+        )
+        if not actualizados:
+            raise PrestamoInactivo("El préstamo ya fue devuelto o está inactivo")
+
+        Libro.objects.filter(id=prestamo.libro_id).update(
+            stock_disponible=F('stock_disponible') + 1,
+            estado='disponible',
+            ultima_actualizacion=timezone.now(),
+        )
+        # UPDATE no dispara señales: la devolución se cuenta aquí
+        estadisticas.registrar_devolucion(hoy)
+
+    return prestamo
+
+
+def devolver_prestamos(prestamo_ids):
+    """
+    devolver_prestamo para varios préstamos en una sola transacción.
+
+    Devuelve, en el orden de `prestamo_ids`, el préstamo actualizado o la
+    excepción que habría lanzado devolver_prestamo. Los préstamos se leen
+    bloqueados en una consulta y se actualizan con un UPDATE por cada estado
+    y multa resultantes; los libros, con uno por número de ejemplares
+    devueltos.
+    """
+    hoy = date.today()
+    resultados = []
+
+    with transaction.atomic():
+        prestamos = Prestamo.objects.select_for_update().only(
+            'id', 'libro_id', 'estado', 'fecha_devolucion_esperada', 'multa'
+        ).in_bulk(set(prestamo_ids))
+        cerrados = {}  # (estado, multa) -> ids
+        devueltos = Counter()  # libro_id -> ejemplares
+        for prestamo_id in prestamo_ids:
+            prestamo = prestamos.get(prestamo_id)
+            if prestamo is None:
+                resultados.append(Prestamo.DoesNotExist("Préstamo no encontrado"))
+                continue
+            if prestamo.estado != 'activo':
+                # También si el id se repite: la primera vez ya lo cerró
+                resultados.append(PrestamoInactivo("El préstamo ya fue devuelto o está inactivo"))
+                continue
+            _cerrar(prestamo, hoy)
+            cerrados.setdefault((prestamo.estado, prestamo.multa), []).append(prestamo_id)
+            devueltos[prestamo.libro_id] += 1
+            resultados.append(prestamo)
+        if not devueltos:
+            return resultados
+
+        for (estado, multa), ids in cerrados.items():
+            Prestamo.objects.filter(id__in=ids, estado='activo').update(
+                estado=estado, fecha_devolucion_real=hoy, multa=multa,
+            )
+        por_cantidad = {}
+        for libro_id, cantidad in devueltos.items():
+            por_cantidad.setdefault(cantidad, []).append(libro_id)
+        ahora = timezone.now()
+        for cantidad, libro_ids in por_cantidad.items():
+            Libro.objects.filter(id__in=libro_ids).update(
+                stock_disponible=F('stock_disponible') + cantidad,
+                estado='disponible',
+                ultima_actualizacion=ahora,
+            )
+        estadisticas.registrar_devolucion(hoy, cantidad=sum(devueltos.values()))
+
+    return resultados
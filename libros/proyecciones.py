@@ -0,0 +1,179 @@
+"""
+Proyecciones de filas de la base de datos a modelos SOAP
+
+Cada proyección declara las columnas que necesita (``values_list`` con sus
+joins) y un plan de campos precalculado. A partir del plan se compila una
+función que convierte cada tupla en el modelo SOAP sin instanciar modelos
+de Django.
+"""
+from django.db.models import Value
+from django.db.models.functions import Coalesce, Concat
+
+
+class Proyeccion:
+    """
+    Proyección de un queryset a un ComplexModel de spyne.
+
+    `plan` es una lista de tuplas (campo_soap, columnas, transformacion):
+    `columnas` es el nombre de una columna o una tupla de columnas y
+    `transformacion` (opcional) recibe sus valores y devuelve el del campo.
+    """
+
+    def __init__(self, modelo_soap, plan, anotaciones=None):
+        campos_soap = [campo for campo, _, _ in plan]
+        if set(campos_soap) != set(modelo_soap._type_info.keys()):
+            raise ValueError(
+                f"El plan de {modelo_soap.__name__} debe cubrir todos sus campos"
+            )
+
+        self.modelo_soap = modelo_soap
+        self.anotaciones = anotaciones or {}
+
+        columnas = []
+        for _, origen, _ in plan:
+            for columna in _como_tupla(origen):
+                if columna not in columnas:
+                    columnas.append(columna)
+        self.columnas = tuple(columnas)
+        self._indices = {columna: i for i, columna in enumerate(self.columnas)}
+        self.mapear = _compilar(modelo_soap, plan, self._indices)
+
+    def indice(self, columna):
+        """Posición de `columna` dentro de cada fila"""
+        return self._indices[columna]
+
+    def filas(self, queryset):
+        """Restringe el queryset a las columnas de la proyección"""
+        if self.anotaciones:
+            queryset = queryset.annotate(**self.anotaciones)
+        return queryset.values_list(*self.columnas)
+
+    def modelos(self, queryset, chunk_size=None):
+        """Itera el queryset devolviendo modelos SOAP"""
+        filas = self.filas(queryset)
+        if chunk_size:
+            filas = filas.iterator(chunk_size=chunk_size)
+        return map(self.mapear, filas)
+
+
+def _como_tupla(origen):
+    return origen if isinstance(origen, tuple) else (origen,)
+
+
+def _compilar(modelo_soap, plan, indices):
+    """
+    Genera la función fila -> modelo SOAP a partir del plan.
+
+    El objeto se crea sin pasar por ComplexModel.__init__ (que recorre todos
+    los campos por instancia); como el plan cubre todos los campos, el
+    resultado es equivalente.
+    """
+    entorno = {'_nuevo': object.__new__, '_modelo': modelo_soap}
+    lineas = []
+    for n, (campo, origen, transformacion) in enumerate(plan):
+        argumentos = ', '.join(f'fila[{indices[columna]}]' for columna in _como_tupla(origen))
+        if transformacion is None:
+            expresion = argumentos
+        else:
+            entorno[f'_t{n}'] = transformacion
+            expresion = f'_t{n}({argumentos})'
+        lineas.append(f'        {campo!r}: {expresion},')
+
+    codigo = '\n'.join([
+        'def mapear(fila):',
+        '    obj = _nuevo(_modelo)',
+        '    obj.__dict__.update({',
+        *lineas,
+        '    })',
+        '    return obj',
+    ])
+    exec(compile(codigo, f'<proyeccion {modelo_soap.__name__}>', 'exec'), entorno)
+    return entorno['mapear']
+
+
+# ===== TRANSFORMACIONES =====
+
+def _fecha_o_vacio(fecha):
+    return str(fecha) if fecha else ''
+
+
+def _nombre_usuario(nombre, apellido, username):
+    """Equivalente a User.get_full_name() or User.username"""
+    return f"{nombre} {apellido}".strip() or username
+
+
+# ===== PROYECCIONES =====
+
+def proyeccion_libro(modelo_soap):
+    """Proyección de Libro al modelo SOAP resumido (LibroModel)"""
+    return Proyeccion(
+        modelo_soap,
+        [
+            ('id', 'id', None),
+            ('titulo', 'titulo', None),
+            ('isbn', 'isbn', None),
+            ('autor_nombre', 'soap_autor_nombre', None),
+            ('editorial_nombre', 'soap_editorial_nombre', None),
+            ('categoria_nombre', 'soap_categoria_nombre', None),
+            ('fecha_publicacion', 'fecha_publicacion', str),
+            ('numero_paginas', 'numero_paginas', None),
+            ('idioma', 'idioma', None),
+            ('descripcion', 'descripcion', None),
+            ('estado', 'estado', None),
+            ('stock_total', 'stock_total', None),
+            ('stock_disponible', 'stock_disponible', None),
+            ('ubicacion_fisica', 'ubicacion_fisica', None),
+            ('fecha_registro', 'fecha_registro', None),
+            ('ultima_actualizacion', 'ultima_actualizacion', None),
+        ],
+        anotaciones={
+            'soap_autor_nombre': Concat('autor__nombre', Value(' '), 'autor__apellido'),
+            'soap_editorial_nombre': Coalesce('editorial__nombre', Value('Sin editorial')),
+            'soap_categoria_nombre': Coalesce('categoria__nombre', Value('Sin categoría')),
+        },
+    )
+
+
+def proyeccion_prestamo(modelo_soap):
+    """Proyección de Prestamo al modelo SOAP (PrestamoModel)"""
+    return Proyeccion(
+        modelo_soap,
+        [
+            ('id', 'id', None),
+            ('libro_titulo', 'libro__titulo', None),
+            ('usuario_nombre',
+             ('usuario__first_name', 'usuario__last_name', 'usuario__username'),
+             _nombre_usuario),
+            ('fecha_prestamo', 'fecha_prestamo', None),
+            ('fecha_devolucion_esperada', 'fecha_devolucion_esperada', str),
+            ('fecha_devolucion_real', 'fecha_devolucion_real', _fecha_o_vacio),
+            ('estado', 'estado', None),
+            ('multa', 'multa', str),
+        ],
+    )
+
+
+def proyeccion_autor(modelo_soap):
+    """Proyección de Autor al modelo SOAP (AutorModel)"""
+    return Proyeccion(
+        modelo_soap,
+        [
+            ('id', 'id', None),
+            ('nombre', 'nombre', None),
+            ('apellido', 'apellido', None),
+            ('nacionalidad', 'nacionalidad', None),
+            ('biografia', 'biografia', None),
+        ],
+    )
+
+
+def proyeccion_categoria(modelo_soap):
+    """Proyección de Categoria al modelo SOAP (CategoriaModel)"""
+    return Proyeccion(
+        modelo_soap,
+        [
+            ('id', 'id', None),
+            ('nombre', 'nombre', None),
+            ('descripcion', 'descripcion', None),
+        ],
+    )
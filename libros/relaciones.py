@@ -0,0 +1,169 @@
+"""
+Relaciones que un serializer recorre y comprobación de que los ViewSets las
+cargan con select_related / prefetch_related
+
+Un campo con source='autor.nombre' o un serializer anidado lee un objeto
+relacionado por cada fila: sin la JOIN correspondiente en el queryset de la
+vista, una página de N filas cuesta N consultas más (N+1). Los ViewSets
+declaran sus JOIN en `queryset`; el check libros.E001 (registrado en
+apps.py) compara esa declaración con lo que recorre su serializer y falla
+al arrancar o al ejecutar los tests si falta alguna.
+
+Los campos que solo usan la clave (PrimaryKeyRelatedField) no cuentan:
+DRF toma el id de la columna autor_id sin leer el objeto.
+"""
+from django.core import checks
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, RelatedField
+
+
+def _recorrido(modelo, atributos, prefijo, unir, precargar):
+    """
+    Sigue `atributos` desde `modelo` y anota las relaciones atravesadas.
+    Devuelve el modelo final (None si el recorrido sale de los campos del modelo).
+    """
+    ruta = list(prefijo)
+    for atributo in atributos:
+        try:
+            campo = modelo._meta.get_field(atributo)
+        except FieldDoesNotExist:
+            return None  # propiedad o método: no se puede seguir
+        if not campo.is_relation:
+            return None
+        ruta.append(atributo)
+        if campo.many_to_many or campo.one_to_many:
+            precargar.add('__'.join(ruta))
+            return None
+        unir.add('__'.join(ruta))
+        modelo = campo.related_model
+    return modelo
+
+
+def relaciones_serializer(serializer, prefijo=()):
+    """
+    Rutas para select_related y prefetch_related que necesita `serializer`
+    (clase o instancia de ModelSerializer) para no consultar por fila
+    """
+    if isinstance(serializer, type):
+        serializer = serializer()
+    modelo = serializer.Meta.model
+    unir, precargar = set(), set()
+    for campo in serializer.fields.values():
+        if campo.write_only or campo.source == '*':
+            continue
+        atributos = campo.source.split('.')
+        if isinstance(campo, serializers.ListSerializer):
+            _recorrido(modelo, atributos, prefijo, unir, precargar)
+            if isinstance(campo.child, serializers.ModelSerializer):
+                # Lo que recorre cada elemento se precarga junto con la lista
+                anidado = relaciones_serializer(campo.child, (*prefijo, *atributos))
+                precargar.update(*anidado)
+        elif isinstance(campo, serializers.ModelSerializer):
+            if _recorrido(modelo, atributos, prefijo, unir, precargar) is not None:
+                anidado_unir, anidado_precargar = relaciones_serializer(campo, (*prefijo, *atributos))
+                unir |= anidado_unir
+                precargar |= anidado_precargar
+        elif isinstance(campo, ManyRelatedField):
+            _recorrido(modelo, atributos, prefijo, unir, precargar)
+        elif isinstance(campo, RelatedField) and not campo.use_pk_only_optimization():
+            _recorrido(modelo, atributos, prefijo, unir, precargar)  # necesita el objeto
+        else:
+            # El último atributo es un valor de la fila (o la clave, para
+            # PrimaryKeyRelatedField): solo cuentan las relaciones anteriores
+            _recorrido(modelo, atributos[:-1], prefijo, unir, precargar)
+    return unir, precargar
+
+
+def columnas_serializer(serializer, prefijo=()):
+    """
+    Rutas para only() con las columnas que lee `serializer`, o None si algún
+    campo depende de algo que no se puede deducir (source='*' o una
+    propiedad del modelo principal). Una relación de la que se lee una
+    propiedad se carga entera: la propiedad puede usar cualquier columna.
+    """
+    modelo = serializer.Meta.model
+    columnas = {'__'.join((*prefijo, modelo._meta.pk.name))}
+    enteras = set()
+    for campo in serializer.fields.values():
+        if campo.write_only:
+            continue
+        if campo.source == '*':
+            return None
+        ruta, actual, relacion = list(prefijo), modelo, None
+        for atributo in campo.source.split('.'):
+            try:
+                relacion = actual._meta.get_field(atributo)
+            except FieldDoesNotExist:
+                if len(ruta) == len(prefijo):
+                    return None
+                enteras.add('__'.join(ruta))
+                break
+            ruta.append(atributo)
+            if relacion.many_to_many or relacion.one_to_many:
+                break  # se precarga en otra consulta
+            columnas.add('__'.join(ruta))
+            if not relacion.is_relation:
+                break
+            actual = relacion.related_model
+        else:
+            if isinstance(campo, serializers.ModelSerializer):
+                anidadas = columnas_serializer(campo, tuple(ruta))
+                if anidadas is None:
+                    enteras.add('__'.join(ruta))
+                else:
+                    columnas |= anidadas
+            elif isinstance(campo, RelatedField) and not campo.use_pk_only_optimization():
+                enteras.add('__'.join(ruta))
+    return {columna for columna in columnas
+            if not any(columna.startswith(f'{entera}__') for entera in enteras)}
+
+
+def relaciones_queryset(queryset):
+    """Rutas de select_related y prefetch_related declaradas en `queryset`"""
+    def aplanar(arbol, prefijo=''):
+        for nombre, hijos in arbol.items():
+            ruta = f'{prefijo}{nombre}'
+            yield ruta
+            yield from aplanar(hijos, f'{ruta}__')
+
+    seleccion = queryset.query.select_related
+    unir = set(aplanar(seleccion)) if isinstance(seleccion, dict) else set()
+    precargar = {getattr(busqueda, 'prefetch_to', busqueda)
+                 for busqueda in queryset._prefetch_related_lookups}
+    # Precargar una ruta también carga los prefijos de la misma
+    for ruta in list(precargar):
+        partes = ruta.split('__')
+        precargar.update('__'.join(partes[:i]) for i in range(1, len(partes)))
+    return unir, precargar, seleccion is True
+
+
+def faltantes(queryset, serializer):
+    """Rutas que `serializer` recorre y `queryset` no carga"""
+    necesita_unir, necesita_precargar = relaciones_serializer(serializer)
+    unir, precargar, todas = relaciones_queryset(queryset)
+    sin_unir = set() if todas else necesita_unir - unir - precargar
+    return sorted(sin_unir | (necesita_precargar - precargar))
+
+
+@checks.register()
+def comprobar_viewsets(app_configs, **kwargs):
+    """libros.E001: ViewSets cuyo queryset no carga las relaciones de su serializer"""
+    from .urls import router
+
+    errores = []
+    for _, viewset, _ in router.registry:
+        queryset = getattr(viewset, 'queryset', None)
+        serializer = getattr(viewset, 'serializer_class', None)
+        if queryset is None or serializer is None:
+            continue
+        rutas = faltantes(queryset, serializer)
+        if rutas:
+            errores.append(checks.Error(
+                f'{serializer.__name__} lee {", ".join(rutas)} en cada fila, '
+                f'pero el queryset de {viewset.__name__} no las carga',
+                hint=f'Añadir select_related/prefetch_related({", ".join(map(repr, rutas))})',
+                obj=viewset,
+                id='libros.E001',
+            ))
+    return errores
@@ -0,0 +1,104 @@
+"""
+Renderizadores y parsers rápidos para la API REST
+
+- JSON con orjson: mismo media type que el JSONRenderer de DRF, así que lo
+  sustituye sin que los clientes cambien nada. Genera bytes en C en lugar
+  de pasar por json.dumps.
+- MessagePack (application/msgpack o ?format=msgpack): binario y más
+  compacto, para consumidores internos.
+- NDJSON (application/x-ndjson), un objeto JSON por línea: solo como
+  entrada de los endpoints en lote (ver lotes.py), que lo registran ellos.
+
+Las dos librerías son opcionales: settings.py solo registra las clases cuya
+librería está instalada, y sin orjson se sigue usando el JSON de DRF. Los
+tipos que no conocen (Decimal, textos traducibles...) se convierten con el
+mismo codificador que DRF.
+"""
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_convertir = JSONEncoder().default
+
+
+# ===== JSON (orjson) =====
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Sangría a medida (application/json; indent=4): orjson solo sabe sangrar con 2
+        if accepted_media_type and 'indent=' in accepted_media_type:
+            return JSONRenderer().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=_convertir, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONParser(BaseParser):
+    media_type = 'application/json'
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as e:
+            raise ParseError(f'JSON mal formado - {e}')
+
+
+# ===== MESSAGEPACK =====
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_convertir)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, TypeError) as e:
+            raise ParseError(f'MessagePack mal formado - {e}')
+
+
+# ===== NDJSON =====
+
+class NDJSONParser(BaseParser):
+    """Una lista con un elemento por línea; las líneas vacías se ignoran"""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        cargar = orjson.loads if orjson else json.loads
+        elementos = []
+        for numero, linea in enumerate(stream.read().splitlines(), 1):
+            if not linea.strip():
+                continue
+            try:
+                elementos.append(cargar(linea))
+            except ValueError as e:
+                raise ParseError(f'NDJSON mal formado en la línea {numero} - {e}')
+        return elementos
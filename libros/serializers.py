@@ -1,7 +1,57 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from .models import Libro, Autor, Categoria, Editorial, Prestamo
 
-class AutorSerializer(serializers.ModelSerializer):
+
+def _lista(valor):
+    return [parte.strip() for parte in valor.split(',') if parte.strip()] if valor else []
+
+
+class CamposDinamicosMixin:
+    """
+    En lecturas, ?fields=id,titulo limita los campos de la respuesta y
+    ?expand=autor sustituye la clave de una relación de Meta.expandibles por
+    el objeto. Las relaciones expandidas se expanden a su vez con un punto:
+    ?expand=libro.autor. La vista carga solo lo que queda (ver
+    ConsultaAjustadaMixin en views.py).
+    """
+
+    def __init__(self, *args, campos=None, expandir=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        peticion = self.context.get('request')
+        if campos is None and expandir is None and peticion is not None:
+            if peticion.method not in SAFE_METHODS:
+                return
+            campos = _lista(peticion.query_params.get('fields')) or None
+            expandir = _lista(peticion.query_params.get('expand'))
+
+        anidadas = {}
+        for ruta in expandir or []:
+            nombre, _, resto = ruta.partition('.')
+            anidadas.setdefault(nombre, [])
+            if resto:
+                anidadas[nombre].append(resto)
+        expandibles = getattr(self.Meta, 'expandibles', {})
+        desconocidas = sorted(anidadas.keys() - expandibles.keys())
+        if desconocidas:
+            raise serializers.ValidationError(
+                {'expand': f"No se pueden expandir: {', '.join(desconocidas)}"}
+            )
+        for nombre, subrutas in anidadas.items():
+            self.fields[nombre] = expandibles[nombre](read_only=True, expandir=subrutas)
+
+        if campos is not None:
+            desconocidos = sorted(set(campos) - set(self.fields))
+            if desconocidos:
+                raise serializers.ValidationError(
+                    {'fields': f"Campos desconocidos: {', '.join(desconocidos)}"}
+                )
+            # Las relaciones expandidas se incluyen aunque no se nombren
+            for nombre in set(self.fields) - set(campos) - anidadas.keys():
+                self.fields.pop(nombre)
+
+
+class AutorSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     nombre_completo = serializers.CharField(read_only=True)
     
     class Meta:
@@ -9,17 +59,17 @@ class AutorSerializer(serializers.ModelSerializer):
         fields = ['id', 'nombre', 'apellido', 'nombre_completo', 
                   'nacionalidad', 'biografia', 'fecha_nacimiento']
 
-class CategoriaSerializer(serializers.ModelSerializer):
+class CategoriaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = Categoria
         fields = ['id', 'nombre', 'descripcion']
 
-class EditorialSerializer(serializers.ModelSerializer):
+class EditorialSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = Editorial
         fields = ['id', 'nombre', 'pais', 'sitio_web']
 
-class LibroSerializer(serializers.ModelSerializer):
+class LibroSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     autor_nombre = serializers.CharField(source='autor.nombre_completo', read_only=True)
     categoria_nombre = serializers.CharField(source='categoria.nombre', read_only=True)
     editorial_nombre = serializers.CharField(source='editorial.nombre', read_only=True)
@@ -33,8 +83,13 @@ class LibroSerializer(serializers.ModelSerializer):
             'editorial', 'editorial_nombre', 'fecha_registro'
         ]
         read_only_fields = ['fecha_registro']
+        expandibles = {
+            'autor': AutorSerializer,
+            'categoria': CategoriaSerializer,
+            'editorial': EditorialSerializer,
+        }
 
-class PrestamoSerializer(serializers.ModelSerializer):
+class PrestamoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     libro_titulo = serializers.CharField(source='libro.titulo', read_only=True)
     usuario_nombre = serializers.CharField(source='usuario.username', read_only=True)
     
@@ -45,4 +100,5 @@ class PrestamoSerializer(serializers.ModelSerializer):
             'fecha_prestamo', 'fecha_devolucion_esperada', 'fecha_devolucion_real',
             'estado', 'notas'
         ]
-        read_only_fields = ['fecha_prestamo']
\ No newline at end of file
+        read_only_fields = ['fecha_prestamo']
+        expandibles = {'libro': LibroSerializer}
\ No newline at end of file
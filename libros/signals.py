@@ -0,0 +1,131 @@
+"""
+Señales que mantienen al día las estadísticas precalculadas, la caché y los
+índices de búsqueda y autocompletado
+"""
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import autocompletado, busqueda, estadisticas
+from .cache import GRUPO_CATALOGO, GRUPO_PANEL, invalidar
+from .models import Autor, Categoria, Editorial, Libro, Prestamo
+
+
+@receiver(post_save, sender=Prestamo)
+def prestamo_guardado(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        estadisticas.registrar_prestamo(instance)
+
+
+@receiver(post_delete, sender=Prestamo)
+def prestamo_eliminado(sender, instance, **kwargs):
+    estadisticas.registrar_prestamo(instance, cantidad=-1)
+
+
+@receiver(post_save, sender=Libro)
+def libro_guardado(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        estadisticas.ajustar_contador(estadisticas.CONTADOR_LIBROS, 1)
+        estadisticas.ajustar_categoria(instance.categoria_id, 1)
+    elif hasattr(instance, '_categoria_id_original'):
+        if instance._categoria_id_original != instance.categoria_id:
+            estadisticas.ajustar_categoria(instance._categoria_id_original, -1)
+            estadisticas.ajustar_categoria(instance.categoria_id, 1)
+    instance._categoria_id_original = instance.categoria_id
+
+
+@receiver(post_delete, sender=Libro)
+def libro_eliminado(sender, instance, **kwargs):
+    estadisticas.ajustar_contador(estadisticas.CONTADOR_LIBROS, -1)
+    estadisticas.ajustar_categoria(instance.categoria_id, -1)
+
+
+@receiver(post_save, sender=Autor)
+def autor_guardado(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        estadisticas.ajustar_contador(estadisticas.CONTADOR_AUTORES, 1)
+
+
+@receiver(post_delete, sender=Autor)
+def autor_eliminado(sender, instance, **kwargs):
+    estadisticas.ajustar_contador(estadisticas.CONTADOR_AUTORES, -1)
+
+
+@receiver(post_save, sender=User)
+def usuario_guardado(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        estadisticas.ajustar_contador(estadisticas.CONTADOR_USUARIOS, 1)
+
+
+@receiver(post_delete, sender=User)
+def usuario_eliminado(sender, instance, **kwargs):
+    estadisticas.ajustar_contador(estadisticas.CONTADOR_USUARIOS, -1)
+
+
+# ===== INVALIDACIÓN DE CACHÉ =====
+
+@receiver([post_save, post_delete], sender=Autor)
+@receiver([post_save, post_delete], sender=Categoria)
+@receiver([post_save, post_delete], sender=Editorial)
+def catalogo_modificado(sender, raw=False, **kwargs):
+    if not raw:
+        invalidar(GRUPO_CATALOGO, GRUPO_PANEL)
+
+
+@receiver([post_save, post_delete], sender=Libro)
+def libro_modificado(sender, raw=False, **kwargs):
+    if not raw:
+        invalidar(GRUPO_PANEL)
+
+
+# ===== ÍNDICE DE BÚSQUEDA =====
+# El borrado de un libro elimina sus términos en cascada
+
+@receiver(post_save, sender=Libro)
+def indexar_libro(sender, instance, raw=False, **kwargs):
+    if not raw:
+        busqueda.indexar_libro(instance)
+
+
+@receiver(post_save, sender=Autor)
+def indexar_autor(sender, instance, created, raw=False, **kwargs):
+    # Un autor nuevo todavía no tiene libros que indexar
+    if not created and not raw:
+        busqueda.indexar_autor(instance)
+
+
+# ===== AUTOCOMPLETADO =====
+
+@receiver(post_save, sender=Libro)
+def autocompletado_libro_guardado(sender, instance, raw=False, **kwargs):
+    if not raw:
+        autocompletado.libro_guardado(instance)
+
+
+@receiver(post_delete, sender=Libro)
+def autocompletado_libro_eliminado(sender, instance, **kwargs):
+    autocompletado.libro_eliminado(instance)
+
+
+@receiver(post_save, sender=Autor)
+def autocompletado_autor_guardado(sender, instance, raw=False, **kwargs):
+    if not raw:
+        autocompletado.autor_guardado(instance)
+
+
+@receiver(post_delete, sender=Autor)
+def autocompletado_autor_eliminado(sender, instance, **kwargs):
+    autocompletado.autor_eliminado(instance)
+
+
+@receiver(post_save, sender=Categoria)
+def autocompletado_categoria_guardada(sender, instance, raw=False, **kwargs):
+    if not raw:
+        autocompletado.categoria_guardada(instance)
+
+
+@receiver(post_delete, sender=Categoria)
+def autocompletado_categoria_eliminada(sender, instance, **kwargs):
+    autocompletado.categoria_eliminada(instance)
@@ -1,13 +1,29 @@
 """
 Servicios SOAP para el Sistema de Biblioteca
 """
+from datetime import date, timedelta
+
 from spyne import Application, rpc, ServiceBase, Integer, Unicode, Boolean, DateTime, Array, ComplexModel
 from spyne.protocol.soap import Soap11
+from spyne.model.fault import Fault
 from spyne.server.django import DjangoApplication
+from django.conf import settings
+from django.db import transaction
 from django.views.decorators.csrf import csrf_exempt
-from datetime import datetime, timedelta
 from libros.models import Libro, Autor, Categoria, Editorial, Prestamo
+from libros.busqueda import CAMPO_AUTOR, CAMPO_TITULO, filtrar_libros
+from libros.cache import GRUPO_CATALOGO, TIMEOUT_CATALOGO, obtener as obtener_de_cache
+from libros.lotes import LotePrestamos
+from libros.prestamos import (
+    LibroNoDisponible, PrestamoInactivo, devolver_prestamo, devolver_prestamos, prestar_libro
+)
+from libros.paginacion import codificar_cursor, condicion_keyset, convertir_valores, decodificar_cursor
+from libros.proyecciones import (
+    proyeccion_libro, proyeccion_prestamo, proyeccion_autor, proyeccion_categoria
+)
 from django.contrib.auth.models import User
+from biblioteca_project.db.replicas import lecturas_en_replica
+from biblioteca_project.instrumentacion import nombrar_vista
 
 
 # ===== MODELOS COMPLEJOS SOAP =====
@@ -95,6 +111,169 @@ class ResultadoOperacion(ComplexModel):
     mensaje = Unicode
     id = Integer
 
+
+class ResultadoLibroModel(ComplexModel):
+    """Resultado de obtener_libros para uno de los id pedidos"""
+    id = Integer
+    encontrado = Boolean
+    libro = LibroDetalladoModel
+
+
+class SolicitudPrestamoModel(ComplexModel):
+    """Un préstamo de crear_prestamos_lote"""
+    libro_id = Integer
+    usuario_id = Integer
+    dias_prestamo = Integer
+
+
+class PaginaLibrosModel(ComplexModel):
+    """Página de libros con el cursor de la página siguiente"""
+    libros = Array(LibroModel)
+    siguiente_cursor = Unicode
+    hay_mas = Boolean
+
+
+class PaginaPrestamosModel(ComplexModel):
+    """Página de préstamos con el cursor de la página siguiente"""
+    prestamos = Array(PrestamoModel)
+    siguiente_cursor = Unicode
+    hay_mas = Boolean
+
+
+# ===== UTILIDADES =====
+
+LIMITE_POR_DEFECTO = 50
+LIMITE_MAXIMO = 500
+# Los listados sin paginar (listar_libros...) devuelven todas las filas.
+# Spyne construye el sobre entero en memoria (Soap11 genera un árbol lxml y
+# DjangoApplication une todo el cuerpo antes de crear el HttpResponse), así
+# que la memoria crece con la tabla (casi 1 KB de XML por libro, más el
+# árbol lxml). Con settings.SOAP_LIMITE_LISTADO_COMPLETO responden con un
+# Fault si pasan de ese número de filas; para más están las *_paginado.
+LIMITE_LISTADO_COMPLETO = getattr(settings, 'SOAP_LIMITE_LISTADO_COMPLETO', None)
+
+ORDEN_LIBROS = ('titulo', 'id')
+ORDEN_PRESTAMOS = ('-fecha_prestamo', '-id')
+
+
+PROYECCION_LIBRO = proyeccion_libro(LibroModel)
+PROYECCION_PRESTAMO = proyeccion_prestamo(PrestamoModel)
+PROYECCION_AUTOR = proyeccion_autor(AutorModel)
+PROYECCION_CATEGORIA = proyeccion_categoria(CategoriaModel)
+
+
+def _comprobar_lote(elementos):
+    """Lista de elementos de una operación en lote, acotada a LIMITE_MAXIMO"""
+    elementos = list(elementos or [])
+    if len(elementos) > LIMITE_MAXIMO:
+        raise Fault('Client.DemasiadosElementos',
+                    f'Como máximo {LIMITE_MAXIMO} elementos por petición')
+    return elementos
+
+
+def _libro_detallado(libro):
+    """LibroDetalladoModel de un libro leído con su autor, editorial y categoría"""
+    autor_model = AutorModel(
+        id=libro.autor.id,
+        nombre=libro.autor.nombre,
+        apellido=libro.autor.apellido,
+        nacionalidad=libro.autor.nacionalidad or '',
+        biografia=libro.autor.biografia or ''
+    )
+
+    editorial_model = EditorialModel(
+        id=libro.editorial.id if libro.editorial else 0,
+        nombre=libro.editorial.nombre if libro.editorial else 'Sin editorial',
+        pais=libro.editorial.pais if libro.editorial else '',
+        sitio_web=libro.editorial.sitio_web if libro.editorial else ''
+    )
+
+    categoria_model = CategoriaModel(
+        id=libro.categoria.id if libro.categoria else 0,
+        nombre=libro.categoria.nombre if libro.categoria else 'Sin categoría',
+        descripcion=libro.categoria.descripcion if libro.categoria else ''
+    )
+
+    return LibroDetalladoModel(
+        id=libro.id,
+        titulo=libro.titulo,
+        isbn=libro.isbn,
+        numero_paginas=libro.numero_paginas,
+        idioma=libro.idioma,
+        descripcion=libro.descripcion or '',
+        estado=libro.estado,
+        stock_total=libro.stock_total,
+        stock_disponible=libro.stock_disponible,
+        ubicacion_fisica=libro.ubicacion_fisica or '',
+        fecha_publicacion=str(libro.fecha_publicacion),
+        fecha_registro=libro.fecha_registro,
+        ultima_actualizacion=libro.ultima_actualizacion,
+        autor=autor_model,
+        editorial=editorial_model,
+        categoria=categoria_model
+    )
+
+
+def _mensaje_error(errores):
+    """Mensaje de ResultadoOperacion para los errores de un préstamo del lote"""
+    for campo, mensaje in (('libro', 'Libro no encontrado'), ('usuario', 'Usuario no encontrado')):
+        if any(getattr(error, 'code', None) == 'does_not_exist' for error in errores.get(campo, [])):
+            return mensaje
+    return '; '.join(str(error) for lista in errores.values() for error in lista)
+
+
+def _normalizar_limite(limite):
+    """Acota el tamaño de página pedido por el cliente"""
+    if not limite or limite < 1:
+        return LIMITE_POR_DEFECTO
+    return min(limite, LIMITE_MAXIMO)
+
+
+def _listado_completo(queryset, proyeccion, orden, operacion_paginada):
+    """
+    Todas las filas de `queryset` como modelos SOAP, o Fault si hay límite y
+    son más de LIMITE_LISTADO_COMPLETO (se lee una de más para saberlo)
+    """
+    filas = proyeccion.filas(queryset.order_by(*orden))
+    if LIMITE_LISTADO_COMPLETO is None:
+        return [proyeccion.mapear(fila) for fila in filas]
+    filas = list(filas[:LIMITE_LISTADO_COMPLETO + 1])
+    if len(filas) > LIMITE_LISTADO_COMPLETO:
+        raise Fault(
+            'Client.DemasiadosResultados',
+            f'El listado tiene más de {LIMITE_LISTADO_COMPLETO} resultados: use {operacion_paginada}',
+        )
+    return [proyeccion.mapear(fila) for fila in filas]
+
+
+def _paginar_por_cursor(queryset, proyeccion, orden, cursor, limite):
+    """
+    Paginación keyset: filtra las filas posteriores al cursor según `orden`
+    (campos con '-' son descendentes) sin OFFSET ni COUNT.
+    Devuelve (modelos SOAP, siguiente_cursor).
+    """
+    limite = _normalizar_limite(limite)
+    campos = [campo.lstrip('-') for campo in orden]
+
+    if cursor:
+        try:
+            valores, _ = decodificar_cursor(cursor, len(orden))
+            valores = convertir_valores(queryset.model, campos, valores)
+        except ValueError:
+            raise Fault('Client.CursorInvalido', 'El cursor de paginación no es válido')
+        queryset = queryset.filter(condicion_keyset(orden, valores))
+
+    # Se pide una fila extra para saber si hay página siguiente
+    filas = list(proyeccion.filas(queryset.order_by(*orden))[:limite + 1])
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        ultima = filas[-1]
+        siguiente = codificar_cursor([ultima[proyeccion.indice(campo)] for campo in campos])
+
+    return [proyeccion.mapear(fila) for fila in filas], siguiente
+
+
 # ===== SERVICIOS SOAP =====
 
 class BibliotecaService(ServiceBase):
@@ -111,198 +290,102 @@ class BibliotecaService(ServiceBase):
         """
         try:
             libro = Libro.objects.select_related('autor', 'editorial', 'categoria').get(id=libro_id)
-            
-            # Crear modelo de autor
-            autor_model = AutorModel(
-                id=libro.autor.id,
-                nombre=libro.autor.nombre,
-                apellido=libro.autor.apellido,
-                nacionalidad=libro.autor.nacionalidad or '',
-                biografia=libro.autor.biografia or ''
-            )
-            
-            # Crear modelo de editorial
-            editorial_model = EditorialModel(
-                id=libro.editorial.id if libro.editorial else 0,
-                nombre=libro.editorial.nombre if libro.editorial else 'Sin editorial',
-                pais=libro.editorial.pais if libro.editorial else '',
-                sitio_web=libro.editorial.sitio_web if libro.editorial else ''
-            )
-            
-            # Crear modelo de categoría
-            categoria_model = CategoriaModel(
-                id=libro.categoria.id if libro.categoria else 0,
-                nombre=libro.categoria.nombre if libro.categoria else 'Sin categoría',
-                descripcion=libro.categoria.descripcion if libro.categoria else ''
-            )
-            
-            return LibroDetalladoModel(
-                id=libro.id,
-                titulo=libro.titulo,
-                isbn=libro.isbn,
-                numero_paginas=libro.numero_paginas,
-                idioma=libro.idioma,
-                descripcion=libro.descripcion or '',
-                estado=libro.estado,
-                stock_total=libro.stock_total,
-                stock_disponible=libro.stock_disponible,
-                ubicacion_fisica=libro.ubicacion_fisica or '',
-                fecha_publicacion=str(libro.fecha_publicacion),
-                fecha_registro=libro.fecha_registro,
-                ultima_actualizacion=libro.ultima_actualizacion,
-                autor=autor_model,
-                editorial=editorial_model,
-                categoria=categoria_model
-            )
+            return _libro_detallado(libro)
         except Libro.DoesNotExist:
             return None
     
+    @rpc(Array(Integer), _returns=Array(ResultadoLibroModel))
+    def obtener_libros(ctx, libro_ids):
+        """
+        Obtiene varios libros por ID con una sola consulta, en el orden
+        pedido; los que no existen vuelven con encontrado=False
+        """
+        libro_ids = _comprobar_lote(libro_ids)
+        libros = Libro.objects.select_related('autor', 'editorial', 'categoria').in_bulk(
+            {libro_id for libro_id in libro_ids if libro_id is not None}
+        )
+        resultados = []
+        for libro_id in libro_ids:
+            libro = libros.get(libro_id)
+            resultados.append(ResultadoLibroModel(
+                id=libro_id,
+                encontrado=libro is not None,
+                libro=_libro_detallado(libro) if libro is not None else None
+            ))
+        return resultados
+    
     @rpc(_returns=Array(LibroModel))
     def listar_libros(ctx):
-        """Lista todos los libros disponibles"""
-        libros = Libro.objects.select_related('autor', 'editorial', 'categoria').all()
-        resultado = []
-        
-        for libro in libros:
-            resultado.append(LibroModel(
-                id=libro.id,
-                titulo=libro.titulo,
-                isbn=libro.isbn,
-                autor_nombre=f"{libro.autor.nombre} {libro.autor.apellido}",
-                editorial_nombre=libro.editorial.nombre if libro.editorial else 'Sin editorial',
-                categoria_nombre=libro.categoria.nombre if libro.categoria else 'Sin categoría',
-                fecha_publicacion=str(libro.fecha_publicacion),
-                numero_paginas=libro.numero_paginas,
-                idioma=libro.idioma,
-                descripcion=libro.descripcion or '',
-                estado=libro.estado,
-                stock_total=libro.stock_total,
-                stock_disponible=libro.stock_disponible,
-                ubicacion_fisica=libro.ubicacion_fisica or '',
-                fecha_registro=libro.fecha_registro,
-                ultima_actualizacion=libro.ultima_actualizacion
-            ))
-        
-        return resultado
+        """
+        Lista todos los libros en una sola respuesta, construida entera en
+        memoria. Si el servidor fija SOAP_LIMITE_LISTADO_COMPLETO y hay más,
+        Fault Client.DemasiadosResultados: usar listar_libros_paginado
+        """
+        return _listado_completo(Libro.objects.all(), PROYECCION_LIBRO, ORDEN_LIBROS, 'listar_libros_paginado')
+    
+    @rpc(Unicode, Integer, _returns=PaginaLibrosModel)
+    def listar_libros_paginado(ctx, cursor, limite):
+        """
+        Lista libros por páginas usando un cursor (keyset).
+        Enviar cursor vacío para la primera página.
+        """
+        libros, siguiente = _paginar_por_cursor(
+            Libro.objects.all(), PROYECCION_LIBRO, ORDEN_LIBROS, cursor, limite
+        )
+        return PaginaLibrosModel(
+            libros=libros,
+            siguiente_cursor=siguiente or '',
+            hay_mas=siguiente is not None
+        )
+    
+    @rpc(Integer, Integer, _returns=Array(LibroModel))
+    def listar_libros_rango(ctx, offset, limite):
+        """Lista libros con offset/límite (preferir listar_libros_paginado)"""
+        offset = max(offset or 0, 0)
+        limite = _normalizar_limite(limite)
+        libros = Libro.objects.order_by(*ORDEN_LIBROS)[offset:offset + limite]
+        return list(PROYECCION_LIBRO.modelos(libros))
     
     @rpc(Unicode, _returns=Array(LibroModel))
     def buscar_libros_por_titulo(ctx, titulo):
-        """Busca libros por título (búsqueda parcial)"""
-        libros = Libro.objects.filter(titulo__icontains=titulo).select_related('autor', 'editorial', 'categoria')
-        resultado = []
-        
-        for libro in libros:
-            resultado.append(LibroModel(
-                id=libro.id,
-                titulo=libro.titulo,
-                isbn=libro.isbn,
-                autor_nombre=f"{libro.autor.nombre} {libro.autor.apellido}",
-                editorial_nombre=libro.editorial.nombre if libro.editorial else 'Sin editorial',
-                categoria_nombre=libro.categoria.nombre if libro.categoria else 'Sin categoría',
-                fecha_publicacion=str(libro.fecha_publicacion),
-                numero_paginas=libro.numero_paginas,
-                idioma=libro.idioma,
-                descripcion=libro.descripcion or '',
-                estado=libro.estado,
-                stock_total=libro.stock_total,
-                stock_disponible=libro.stock_disponible,
-                ubicacion_fisica=libro.ubicacion_fisica or '',
-                fecha_registro=libro.fecha_registro,
-                ultima_actualizacion=libro.ultima_actualizacion
-            ))
-        
-        return resultado
+        """Busca libros por palabras (o su comienzo) del título"""
+        libros = filtrar_libros(Libro.objects.all(), titulo, campos=(CAMPO_TITULO,))
+        return list(PROYECCION_LIBRO.modelos(libros))
     
     @rpc(Unicode, _returns=Array(LibroModel))
     def buscar_libros_por_autor(ctx, autor_apellido):
-        """Busca libros por apellido del autor"""
-        libros = Libro.objects.filter(
-            autor__apellido__icontains=autor_apellido
-        ).select_related('autor', 'editorial', 'categoria')
-        
-        resultado = []
-        for libro in libros:
-            resultado.append(LibroModel(
-                id=libro.id,
-                titulo=libro.titulo,
-                isbn=libro.isbn,
-                autor_nombre=f"{libro.autor.nombre} {libro.autor.apellido}",
-                editorial_nombre=libro.editorial.nombre if libro.editorial else 'Sin editorial',
-                categoria_nombre=libro.categoria.nombre if libro.categoria else 'Sin categoría',
-                fecha_publicacion=str(libro.fecha_publicacion),
-                numero_paginas=libro.numero_paginas,
-                idioma=libro.idioma,
-                descripcion=libro.descripcion or '',
-                estado=libro.estado,
-                stock_total=libro.stock_total,
-                stock_disponible=libro.stock_disponible,
-                ubicacion_fisica=libro.ubicacion_fisica or '',
-                fecha_registro=libro.fecha_registro,
-                ultima_actualizacion=libro.ultima_actualizacion
-            ))
-        
-        return resultado
+        """Busca libros por nombre o apellido del autor"""
+        libros = filtrar_libros(Libro.objects.all(), autor_apellido, campos=(CAMPO_AUTOR,))
+        return list(PROYECCION_LIBRO.modelos(libros))
     
     @rpc(_returns=Array(LibroModel))
     def listar_libros_disponibles(ctx):
-        """Lista solo los libros disponibles para préstamo"""
-        libros = Libro.objects.filter(
-            estado='disponible',
-            stock_disponible__gt=0
-        ).select_related('autor', 'editorial', 'categoria')
-        
-        resultado = []
-        for libro in libros:
-            resultado.append(LibroModel(
-                id=libro.id,
-                titulo=libro.titulo,
-                isbn=libro.isbn,
-                autor_nombre=f"{libro.autor.nombre} {libro.autor.apellido}",
-                editorial_nombre=libro.editorial.nombre if libro.editorial else 'Sin editorial',
-                categoria_nombre=libro.categoria.nombre if libro.categoria else 'Sin categoría',
-                fecha_publicacion=str(libro.fecha_publicacion),
-                numero_paginas=libro.numero_paginas,
-                idioma=libro.idioma,
-                descripcion=libro.descripcion or '',
-                estado=libro.estado,
-                stock_total=libro.stock_total,
-                stock_disponible=libro.stock_disponible,
-                ubicacion_fisica=libro.ubicacion_fisica or '',
-                fecha_registro=libro.fecha_registro,
-                ultima_actualizacion=libro.ultima_actualizacion
-            ))
-        
-        return resultado
+        """
+        Lista solo los libros disponibles para préstamo. Con
+        SOAP_LIMITE_LISTADO_COMPLETO, Fault Client.DemasiadosResultados si
+        hay más: usar listar_libros_disponibles_paginado
+        """
+        libros = Libro.objects.filter(estado='disponible', stock_disponible__gt=0)
+        return _listado_completo(libros, PROYECCION_LIBRO, ORDEN_LIBROS, 'listar_libros_disponibles_paginado')
+    
+    @rpc(Unicode, Integer, _returns=PaginaLibrosModel)
+    def listar_libros_disponibles_paginado(ctx, cursor, limite):
+        """Lista por páginas los libros disponibles para préstamo"""
+        libros, siguiente = _paginar_por_cursor(
+            Libro.objects.filter(estado='disponible', stock_disponible__gt=0),
+            PROYECCION_LIBRO, ORDEN_LIBROS, cursor, limite
+        )
+        return PaginaLibrosModel(
+            libros=libros,
+            siguiente_cursor=siguiente or '',
+            hay_mas=siguiente is not None
+        )
     
     @rpc(Unicode, _returns=Array(LibroModel))
     def buscar_libros_por_categoria(ctx, categoria_nombre):
         """Busca libros por categoría"""
-        libros = Libro.objects.filter(
-            categoria__nombre__icontains=categoria_nombre
-        ).select_related('autor', 'editorial', 'categoria')
-        
-        resultado = []
-        for libro in libros:
-            resultado.append(LibroModel(
-                id=libro.id,
-                titulo=libro.titulo,
-                isbn=libro.isbn,
-                autor_nombre=f"{libro.autor.nombre} {libro.autor.apellido}",
-                editorial_nombre=libro.editorial.nombre if libro.editorial else 'Sin editorial',
-                categoria_nombre=libro.categoria.nombre if libro.categoria else 'Sin categoría',
-                fecha_publicacion=str(libro.fecha_publicacion),
-                numero_paginas=libro.numero_paginas,
-                idioma=libro.idioma,
-                descripcion=libro.descripcion or '',
-                estado=libro.estado,
-                stock_total=libro.stock_total,
-                stock_disponible=libro.stock_disponible,
-                ubicacion_fisica=libro.ubicacion_fisica or '',
-                fecha_registro=libro.fecha_registro,
-                ultima_actualizacion=libro.ultima_actualizacion
-            ))
-        
-        return resultado
+        libros = Libro.objects.filter(categoria__nombre__icontains=categoria_nombre)
+        return list(PROYECCION_LIBRO.modelos(libros))
     
 
     # ===== SERVICIOS DE PRÉSTAMOS =====
@@ -311,40 +394,16 @@ class BibliotecaService(ServiceBase):
     def crear_prestamo(ctx, libro_id, usuario_id, dias_prestamo):
         """Crea un nuevo préstamo de libro"""
         try:
-            libro = Libro.objects.get(id=libro_id)
-            usuario = User.objects.get(id=usuario_id)
-            
-            # Verificar disponibilidad
-            if not libro.esta_disponible():
-                return ResultadoOperacion(
-                    exito=False,
-                    mensaje=f"El libro '{libro.titulo}' no está disponible",
-                    id=0
-                )
-            
-            # Calcular fecha de devolución
-            fecha_devolucion = (datetime.now() + timedelta(days=dias_prestamo)).date()
-            
-            # Crear préstamo
-            prestamo = Prestamo.objects.create(
-                libro=libro,
-                usuario=usuario,
-                fecha_devolucion_esperada=fecha_devolucion,
-                estado='activo'
-            )
-            
-            # Actualizar stock del libro
-            libro.stock_disponible -= 1
-            if libro.stock_disponible == 0:
-                libro.estado = 'prestado'
-            libro.save()
+            prestamo = prestar_libro(libro_id, usuario_id, dias_prestamo)
             
             return ResultadoOperacion(
                 exito=True,
-                mensaje=f"Préstamo creado exitosamente. Devolver antes del {fecha_devolucion}",
+                mensaje=f"Préstamo creado exitosamente. Devolver antes del {prestamo.fecha_devolucion_esperada}",
                 id=prestamo.id
             )
             
+        except LibroNoDisponible as e:
+            return ResultadoOperacion(exito=False, mensaje=str(e), id=0)
         except Libro.DoesNotExist:
             return ResultadoOperacion(exito=False, mensaje="Libro no encontrado", id=0)
         except User.DoesNotExist:
@@ -354,36 +413,12 @@ class BibliotecaService(ServiceBase):
     
     @rpc(Integer, _returns=ResultadoOperacion)
     def devolver_libro(ctx, prestamo_id):
-        """Registra la devolución de un libro"""
+        """
+        Registra la devolución de un libro. Si el préstamo está vencido cobra
+        una multa de $10 por día de retraso, indicada en el mensaje
+        """
         try:
-            prestamo = Prestamo.objects.get(id=prestamo_id)
-            
-            if prestamo.estado != 'activo':
-                return ResultadoOperacion(
-                    exito=False,
-                    mensaje="El préstamo ya fue devuelto o está inactivo",
-                    id=prestamo_id
-                )
-            
-            # Registrar devolución
-            from datetime import date
-            prestamo.fecha_devolucion_real = date.today()
-            prestamo.estado = 'devuelto'
-            
-            # Calcular multa si está vencido
-            if prestamo.esta_vencido():
-                dias_retraso = (date.today() - prestamo.fecha_devolucion_esperada).days
-                prestamo.multa = dias_retraso * 10.00  # $10 por día
-                prestamo.estado = 'vencido'
-            
-            prestamo.save()
-            
-            # Actualizar stock del libro
-            libro = prestamo.libro
-            libro.stock_disponible += 1
-            if libro.stock_disponible > 0:
-                libro.estado = 'disponible'
-            libro.save()
+            prestamo = devolver_prestamo(prestamo_id)
             
             mensaje = f"Libro devuelto exitosamente"
             if prestamo.multa > 0:
@@ -395,86 +430,126 @@ class BibliotecaService(ServiceBase):
                 id=prestamo_id
             )
             
+        except PrestamoInactivo as e:
+            return ResultadoOperacion(exito=False, mensaje=str(e), id=prestamo_id)
         except Prestamo.DoesNotExist:
             return ResultadoOperacion(exito=False, mensaje="Préstamo no encontrado", id=0)
         except Exception as e:
             return ResultadoOperacion(exito=False, mensaje=f"Error: {str(e)}", id=0)
     
+    @rpc(Array(SolicitudPrestamoModel), Boolean, _returns=Array(ResultadoOperacion))
+    def crear_prestamos_lote(ctx, solicitudes, atomico):
+        """
+        Crea varios préstamos en una transacción (ver libros/lotes.py) y
+        devuelve el resultado de cada uno en el orden pedido. Con atomico
+        no se crea ninguno si alguno falla.
+        """
+        solicitudes = _comprobar_lote(solicitudes)
+        hoy = date.today()
+        elementos = [{
+            'libro': solicitud.libro_id,
+            'usuario': solicitud.usuario_id,
+            'fecha_devolucion_esperada': hoy + timedelta(days=solicitud.dias_prestamo),
+        } if solicitud is not None and solicitud.dias_prestamo is not None else None
+            for solicitud in solicitudes]
+        # Dentro de la transacción también la validación lee del primario
+        with transaction.atomic():
+            resultado = LotePrestamos(atomico=bool(atomico)).crear(elementos)
+
+        respuesta = []
+        for indice, elemento in enumerate(elementos):
+            if elemento is None:
+                respuesta.append(ResultadoOperacion(
+                    exito=False, mensaje="Faltan los días de préstamo", id=0
+                ))
+            elif indice in resultado.ids:
+                respuesta.append(ResultadoOperacion(
+                    exito=True,
+                    mensaje=f"Préstamo creado exitosamente. Devolver antes del "
+                            f"{elemento['fecha_devolucion_esperada']}",
+                    id=resultado.ids[indice]
+                ))
+            elif indice in resultado.errores:
+                respuesta.append(ResultadoOperacion(
+                    exito=False, mensaje=_mensaje_error(resultado.errores[indice]), id=0
+                ))
+            else:
+                respuesta.append(ResultadoOperacion(
+                    exito=False, mensaje="No se creó: otro préstamo del lote falló", id=0
+                ))
+        return respuesta
+    
+    @rpc(Array(Integer), _returns=Array(ResultadoOperacion))
+    def devolver_libros_lote(ctx, prestamo_ids):
+        """Registra la devolución de varios préstamos en una transacción"""
+        prestamo_ids = _comprobar_lote(prestamo_ids)
+        respuesta = []
+        for prestamo_id, resultado in zip(prestamo_ids, devolver_prestamos(prestamo_ids)):
+            if isinstance(resultado, Prestamo):
+                mensaje = "Libro devuelto exitosamente"
+                if resultado.multa > 0:
+                    mensaje += f". Multa: ${resultado.multa}"
+                respuesta.append(ResultadoOperacion(exito=True, mensaje=mensaje, id=prestamo_id))
+            elif isinstance(resultado, PrestamoInactivo):
+                respuesta.append(ResultadoOperacion(exito=False, mensaje=str(resultado), id=prestamo_id))
+            else:
+                respuesta.append(ResultadoOperacion(exito=False, mensaje="Préstamo no encontrado", id=0))
+        return respuesta
+    
     @rpc(Integer, _returns=Array(PrestamoModel))
     def obtener_prestamos_usuario(ctx, usuario_id):
         """Obtiene todos los préstamos de un usuario"""
-        prestamos = Prestamo.objects.filter(usuario_id=usuario_id).select_related('libro', 'usuario')
-        resultado = []
-        
-        for prestamo in prestamos:
-            resultado.append(PrestamoModel(
-                id=prestamo.id,
-                libro_titulo=prestamo.libro.titulo,
-                usuario_nombre=prestamo.usuario.get_full_name() or prestamo.usuario.username,
-                fecha_prestamo=prestamo.fecha_prestamo,
-                fecha_devolucion_esperada=str(prestamo.fecha_devolucion_esperada),
-                fecha_devolucion_real=str(prestamo.fecha_devolucion_real) if prestamo.fecha_devolucion_real else '',
-                estado=prestamo.estado,
-                multa=str(prestamo.multa)
-            ))
-        
-        return resultado
+        prestamos = Prestamo.objects.filter(usuario_id=usuario_id)
+        return list(PROYECCION_PRESTAMO.modelos(prestamos))
     
     @rpc(_returns=Array(PrestamoModel))
     def listar_prestamos_activos(ctx):
-        """Lista todos los préstamos activos"""
-        prestamos = Prestamo.objects.filter(estado='activo').select_related('libro', 'usuario')
-        resultado = []
-        
-        for prestamo in prestamos:
-            resultado.append(PrestamoModel(
-                id=prestamo.id,
-                libro_titulo=prestamo.libro.titulo,
-                usuario_nombre=prestamo.usuario.get_full_name() or prestamo.usuario.username,
-                fecha_prestamo=prestamo.fecha_prestamo,
-                fecha_devolucion_esperada=str(prestamo.fecha_devolucion_esperada),
-                fecha_devolucion_real='',
-                estado=prestamo.estado,
-                multa=str(prestamo.multa)
-            ))
-        
-        return resultado
+        """
+        Lista todos los préstamos activos. Con SOAP_LIMITE_LISTADO_COMPLETO,
+        Fault Client.DemasiadosResultados si hay más: usar
+        listar_prestamos_activos_paginado
+        """
+        prestamos = Prestamo.objects.filter(estado='activo')
+        return _listado_completo(
+            prestamos, PROYECCION_PRESTAMO, ORDEN_PRESTAMOS, 'listar_prestamos_activos_paginado'
+        )
+    
+    @rpc(Unicode, Integer, _returns=PaginaPrestamosModel)
+    def listar_prestamos_activos_paginado(ctx, cursor, limite):
+        """Lista por páginas los préstamos activos, del más reciente al más antiguo"""
+        prestamos, siguiente = _paginar_por_cursor(
+            Prestamo.objects.filter(estado='activo'),
+            PROYECCION_PRESTAMO, ORDEN_PRESTAMOS, cursor, limite
+        )
+        return PaginaPrestamosModel(
+            prestamos=prestamos,
+            siguiente_cursor=siguiente or '',
+            hay_mas=siguiente is not None
+        )
     
     # ===== SERVICIOS DE AUTORES =====
     
     @rpc(_returns=Array(AutorModel))
     def listar_autores(ctx):
         """Lista todos los autores"""
-        autores = Autor.objects.all()
-        resultado = []
-        
-        for autor in autores:
-            resultado.append(AutorModel(
-                id=autor.id,
-                nombre=autor.nombre,
-                apellido=autor.apellido,
-                nacionalidad=autor.nacionalidad or '',
-                biografia=autor.biografia or ''
-            ))
-        
-        return resultado
+        filas = obtener_de_cache(
+            GRUPO_CATALOGO, 'soap:autores',
+            lambda: list(PROYECCION_AUTOR.filas(Autor.objects.all())),
+            TIMEOUT_CATALOGO
+        )
+        return [PROYECCION_AUTOR.mapear(fila) for fila in filas]
     
     # ===== SERVICIOS DE CATEGORÍAS =====
     
     @rpc(_returns=Array(CategoriaModel))
     def listar_categorias(ctx):
         """Lista todas las categorías"""
-        categorias = Categoria.objects.all()
-        resultado = []
-        
-        for categoria in categorias:
-            resultado.append(CategoriaModel(
-                id=categoria.id,
-                nombre=categoria.nombre,
-                descripcion=categoria.descripcion or ''
-            ))
-        
-        return resultado
+        filas = obtener_de_cache(
+            GRUPO_CATALOGO, 'soap:categorias',
+            lambda: list(PROYECCION_CATEGORIA.filas(Categoria.objects.all())),
+            TIMEOUT_CATALOGO
+        )
+        return [PROYECCION_CATEGORIA.mapear(fila) for fila in filas]
 
 
 # ===== CONFIGURACIÓN DE LA APLICACIÓN SOAP =====
@@ -486,5 +561,12 @@ soap_app = Application(
     out_protocol=Soap11()
 )
 
+# Las peticiones SOAP se miden por operación y no todas juntas bajo /soap/
+soap_app.event_manager.add_listener(
+    'method_call', lambda ctx: nombrar_vista(f'soap:{ctx.descriptor.name}')
+)
+
 # Vista Django para el servicio SOAP
-django_soap_application = csrf_exempt(DjangoApplication(soap_app))
\ No newline at end of file
+# Todo llega por POST, pero las operaciones de consulta pueden leer de las
+# réplicas; las escrituras ocurren en transacciones sobre el primario
+django_soap_application = lecturas_en_replica(csrf_exempt(DjangoApplication(soap_app)))
\ No newline at end of file
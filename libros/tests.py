@@ -1,3 +1,1892 @@
-from django.test import TestCase
+import argparse
+import csv
+import gzip
+import ipaddress
+import json
+import os
+import runpy
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from http.cookies import SimpleCookie
+from io import StringIO
+from pathlib import Path
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from spyne.model.fault import Fault
+from spyne.server.null import NullServer
+
+from benchmarks import carga, comun
+from biblioteca_project.db.mysql import base as mysql_base
+from biblioteca_project.db.pool import PoolAgotado, PoolConexiones
+from biblioteca_project import instrumentacion, metricas
+from biblioteca_project.db.replicas import (
+    COOKIE_PRIMARIO, ReplicasMiddleware, RouterReplicas, lecturas_en_replica, usar_primario,
+)
+
+from . import (
+    autocompletado, busqueda, estadisticas, exportacion, generador, lotes, planes, relaciones, renderizadores,
+)
+from . import cache as cache_catalogo
+from .cache import lista_categorias, totales_panel
+from .models import (
+    Autor, Categoria, Contador, Editorial, EstadisticaAutor, EstadisticaCategoria,
+    EstadisticaDiaria, EstadisticaLibro, Libro, Prestamo, TerminoBusqueda,
+)
+from .paginacion import codificar_cursor
+from .serializers import LibroSerializer, PrestamoSerializer
+from .urls import router
+from .views import PrestamoViewSet
+from .prestamos import LibroNoDisponible, PrestamoInactivo, devolver_prestamo, prestar_libro
+from .soap_services import LibroModel, PROYECCION_LIBRO, PROYECCION_PRESTAMO, SolicitudPrestamoModel, soap_app
+
+
+def crear_catalogo(num_libros=5, stock=1):
+    """Crea un autor, una editorial, una categoría y `num_libros` libros"""
+    autor = Autor.objects.create(nombre='Jorge Luis', apellido='Borges')
+    editorial = Editorial.objects.create(nombre='Sur', pais='Argentina')
+    categoria = Categoria.objects.create(nombre='Cuento')
+    libros = [
+        Libro.objects.create(
+            titulo=f'Libro {i:03d}',
+            isbn=f'978000000{i:04d}',
+            autor=autor,
+            editorial=editorial,
+            categoria=categoria,
+            fecha_publicacion=date(1944, 1, 1),
+            numero_paginas=100 + i,
+            stock_total=stock,
+            stock_disponible=stock,
+        )
+        for i in range(num_libros)
+    ]
+    return autor, editorial, categoria, libros
+
+
+class SoapPaginacionTests(TestCase):
+    """Listados paginados del servicio SOAP"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor, cls.editorial, cls.categoria, cls.libros = crear_catalogo(7)
+        cls.usuario = User.objects.create_user(username='lector', password='x')
+        for libro in cls.libros[:5]:
+            Prestamo.objects.create(
+                libro=libro,
+                usuario=cls.usuario,
+                fecha_devolucion_esperada=date.today() + timedelta(days=14),
+            )
+
+    def setUp(self):
+        self.servicio = NullServer(soap_app, ostr=False).service
+
+    def test_listar_libros_devuelve_todos(self):
+        resultado = list(self.servicio.listar_libros())
+        self.assertEqual([l.titulo for l in resultado], [l.titulo for l in self.libros])
+
+    def test_listado_completo_acotado(self):
+        # Sin límite (por defecto) se devuelven todas las filas
+        self.assertIsNone(settings.SOAP_LIMITE_LISTADO_COMPLETO)
+        self.assertEqual(len(list(self.servicio.listar_libros())), len(self.libros))
+        with mock.patch('libros.soap_services.LIMITE_LISTADO_COMPLETO', 7):
+            self.assertEqual(len(list(self.servicio.listar_libros())), 7)
+        with mock.patch('libros.soap_services.LIMITE_LISTADO_COMPLETO', 4):
+            for operacion in (self.servicio.listar_libros, self.servicio.listar_prestamos_activos):
+                with self.assertRaises(Fault) as error:
+                    operacion()
+                self.assertEqual(error.exception.faultcode, 'Client.DemasiadosResultados')
+                self.assertIn('_paginado', error.exception.faultstring)
+
+    def test_paginado_recorre_todas_las_paginas(self):
+        titulos, cursor, paginas = [], '', 0
+        while True:
+            pagina = self.servicio.listar_libros_paginado(cursor, 3)
+            titulos.extend(l.titulo for l in pagina.libros)
+            paginas += 1
+            if not pagina.hay_mas:
+                break
+            cursor = pagina.siguiente_cursor
+        self.assertEqual(paginas, 3)
+        self.assertEqual(titulos, [l.titulo for l in self.libros])
+
+    def test_rango_offset_limite(self):
+        resultado = self.servicio.listar_libros_rango(2, 3)
+        self.assertEqual([l.id for l in resultado], [l.id for l in self.libros[2:5]])
+
+    def test_prestamos_activos_paginado(self):
+        primera = self.servicio.listar_prestamos_activos_paginado('', 4)
+        segunda = self.servicio.listar_prestamos_activos_paginado(primera.siguiente_cursor, 4)
+        ids = [p.id for p in primera.prestamos] + [p.id for p in segunda.prestamos]
+        self.assertEqual(ids, sorted(Prestamo.objects.values_list('id', flat=True), reverse=True))
+        self.assertFalse(segunda.hay_mas)
+
+    def test_cursor_invalido(self):
+        with self.assertRaises(Fault):
+            self.servicio.listar_libros_paginado('no-es-un-cursor', 3)
+
+    def test_cursor_con_valores_invalidos(self):
+        for valores in (['Libro 000', 'abc'], [None, 1]):
+            with self.assertRaises(Fault) as error:
+                self.servicio.listar_libros_paginado(codificar_cursor(valores), 3)
+            self.assertEqual(error.exception.faultcode, 'Client.CursorInvalido')
+        with self.assertRaises(Fault):
+            self.servicio.listar_prestamos_activos_paginado(codificar_cursor(['ayer', 1]), 3)
+
+
+class ProyeccionSoapTests(TestCase):
+    """La proyección compilada produce lo mismo que construir el modelo a mano"""
+
+    @classmethod
+    def setUpTestData(cls):
+        _, _, _, cls.libros = crear_catalogo(2)
+        Libro.objects.filter(id=cls.libros[1].id).update(editorial=None, categoria=None)
+        usuario = User.objects.create_user(username='lector', first_name='Ana', password='x')
+        Prestamo.objects.create(
+            libro=cls.libros[0],
+            usuario=usuario,
+            fecha_devolucion_esperada=date(2030, 1, 1),
+        )
+
+    def test_libro(self):
+        modelos = list(PROYECCION_LIBRO.modelos(Libro.objects.all()))
+        for modelo, libro in zip(modelos, Libro.objects.select_related('autor', 'editorial', 'categoria')):
+            esperado = LibroModel(
+                id=libro.id,
+                titulo=libro.titulo,
+                isbn=libro.isbn,
+                autor_nombre=f"{libro.autor.nombre} {libro.autor.apellido}",
+                editorial_nombre=libro.editorial.nombre if libro.editorial else 'Sin editorial',
+                categoria_nombre=libro.categoria.nombre if libro.categoria else 'Sin categoría',
+                fecha_publicacion=str(libro.fecha_publicacion),
+                numero_paginas=libro.numero_paginas,
+                idioma=libro.idioma,
+                descripcion=libro.descripcion or '',
+                estado=libro.estado,
+                stock_total=libro.stock_total,
+                stock_disponible=libro.stock_disponible,
+                ubicacion_fisica=libro.ubicacion_fisica or '',
+                fecha_registro=libro.fecha_registro,
+                ultima_actualizacion=libro.ultima_actualizacion
+            )
+            self.assertEqual(modelo.__dict__, esperado.__dict__)
+        self.assertEqual(modelos[1].editorial_nombre, 'Sin editorial')
+
+    def test_prestamo(self):
+        modelo = next(PROYECCION_PRESTAMO.modelos(Prestamo.objects.all()))
+        self.assertEqual(modelo.usuario_nombre, 'Ana')
+        self.assertEqual(modelo.fecha_devolucion_esperada, '2030-01-01')
+        self.assertEqual(modelo.fecha_devolucion_real, '')
+        self.assertEqual(modelo.multa, '0.00')
+
+    def test_una_consulta(self):
+        with self.assertNumQueries(1):
+            list(PROYECCION_LIBRO.modelos(Libro.objects.all()))
+
+
+class PaginacionCursorRestTests(TestCase):
+    """Paginación por cursor de los ViewSets"""
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_catalogo(12)
+        # Títulos repetidos: el desempate por id debe evitar saltos o duplicados
+        Libro.objects.filter(id__in=Libro.objects.values('id')[:6]).update(titulo='Repetido')
+
+    def recorrer(self, url):
+        ids = []
+        while url:
+            respuesta = self.client.get(url)
+            self.assertEqual(respuesta.status_code, 200)
+            ids.extend(libro['id'] for libro in respuesta.json()['results'])
+            url = respuesta.json()['next']
+        return ids
+
+    def test_recorre_en_orden_sin_duplicados(self):
+        ids = self.recorrer('/api/libros/?page_size=4')
+        esperado = list(Libro.objects.order_by('titulo', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, esperado)
+
+    def test_respeta_ordering_del_cliente(self):
+        ids = self.recorrer('/api/libros/?page_size=5&ordering=-stock_disponible')
+        esperado = list(Libro.objects.order_by('-stock_disponible', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, esperado)
+
+    def test_enlace_anterior(self):
+        primera = self.client.get('/api/libros/?page_size=4').json()
+        segunda = self.client.get(primera['next']).json()
+        self.assertIsNone(primera['previous'])
+        anterior = self.client.get(segunda['previous']).json()
+        self.assertEqual(anterior['results'], primera['results'])
+
+    def test_sin_count_por_defecto(self):
+        respuesta = self.client.get('/api/libros/').json()
+        self.assertNotIn('count', respuesta)
+        respuesta = self.client.get('/api/libros/?count=estimated').json()
+        self.assertEqual(respuesta['count'], 12)
+
+    def test_cursor_invalido(self):
+        self.assertEqual(self.client.get('/api/libros/?cursor=xyz').status_code, 404)
+
+    def test_cursor_con_valores_invalidos(self):
+        # Cursores bien codificados cuyos valores no encajan con los campos de orden
+        for url, valores in (
+            ('/api/libros/', ['Libro 000', 'abc']),
+            ('/api/libros/', [None, 1]),
+            ('/api/libros/', ['Libro 000', [1]]),
+            ('/api/libros/?ordering=fecha_publicacion', ['no-es-fecha', 1]),
+        ):
+            separador = '&' if '?' in url else '?'
+            respuesta = self.client.get(f'{url}{separador}cursor={codificar_cursor(valores)}')
+            self.assertEqual(respuesta.status_code, 404, (url, valores))
+        # Las fechas del cursor llegan como texto y se convierten
+        respuesta = self.client.get(
+            f'/api/libros/?ordering=fecha_publicacion&cursor={codificar_cursor(["1944-01-01", 0])}'
+        )
+        self.assertEqual(respuesta.status_code, 200)
+
+
+class ServicioPrestamosTests(TestCase):
+    """Préstamo y devolución con descuento atómico de stock"""
+
+    @classmethod
+    def setUpTestData(cls):
+        _, _, _, (cls.libro,) = crear_catalogo(1, stock=2)
+        cls.usuario = User.objects.create_user(username='lector', password='x')
+
+    def test_prestar_y_devolver(self):
+        devolver_prestamo(prestar_libro(self.libro.id, self.usuario.id, 7).id)
+
+        # Con las filas de estadísticas ya creadas: SAVEPOINT, UPDATE del
+        # stock, INSERT, autor del libro, 3 UPDATE de estadísticas, RELEASE
+        with self.assertNumQueries(8):
+            prestamo = prestar_libro(self.libro.id, self.usuario.id, 7, verificar_usuario=False)
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.stock_disponible, 1)
+        self.assertEqual(self.libro.estado, 'disponible')
+
+        devolver_prestamo(prestamo.id)
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.stock_disponible, 2)
+        with self.assertRaises(PrestamoInactivo):
+            devolver_prestamo(prestamo.id)
+
+    def test_ultimo_ejemplar_marca_prestado(self):
+        prestar_libro(self.libro.id, self.usuario.id, 7)
+        prestar_libro(self.libro.id, self.usuario.id, 7)
+        self.libro.refresh_from_db()
+        self.assertEqual((self.libro.stock_disponible, self.libro.estado), (0, 'prestado'))
+        with self.assertRaises(LibroNoDisponible):
+            prestar_libro(self.libro.id, self.usuario.id, 7)
+
+    def test_devolucion_vencida_genera_multa(self):
+        prestamo = prestar_libro(self.libro.id, self.usuario.id, 7)
+        Prestamo.objects.filter(id=prestamo.id).update(
+            fecha_devolucion_esperada=date.today() - timedelta(days=3)
+        )
+        prestamo = devolver_prestamo(prestamo.id)
+        self.assertEqual(prestamo.estado, 'vencido')
+        self.assertEqual(prestamo.multa, 30)
+        guardado = Prestamo.objects.get(id=prestamo.id)
+        self.assertEqual((guardado.estado, guardado.multa), ('vencido', Decimal('30.00')))
+        self.assertEqual(guardado.fecha_devolucion_real, date.today())
+
+    def test_multa_de_la_devolucion_soap(self):
+        # Las devoluciones tardías cobran MULTA_POR_DIA por día; a tiempo, nada
+        servicio = NullServer(soap_app, ostr=False).service
+        a_tiempo = prestar_libro(self.libro.id, self.usuario.id, 7)
+        tardio = prestar_libro(self.libro.id, self.usuario.id, 7)
+        Prestamo.objects.filter(id=tardio.id).update(fecha_devolucion_esperada=date.today() - timedelta(days=1))
+        self.assertEqual(servicio.devolver_libro(a_tiempo.id).mensaje, 'Libro devuelto exitosamente')
+        self.assertEqual(servicio.devolver_libro(tardio.id).mensaje, 'Libro devuelto exitosamente. Multa: $10.00')
+        self.assertEqual(
+            dict(Prestamo.objects.values_list('estado', 'multa')),
+            {'devuelto': Decimal('0.00'), 'vencido': Decimal('10.00')},
+        )
+
+    def test_errores(self):
+        with self.assertRaises(Libro.DoesNotExist):
+            prestar_libro(999, self.usuario.id, 7)
+        with self.assertRaises(User.DoesNotExist):
+            prestar_libro(self.libro.id, 999, 7)
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.stock_disponible, 2)
+
+    def test_soap_y_rest_usan_el_servicio(self):
+        servicio = NullServer(soap_app, ostr=False).service
+        self.assertTrue(servicio.crear_prestamo(self.libro.id, self.usuario.id, 7).exito)
+        respuesta = self.client.post('/api/prestamos/', {
+            'libro': self.libro.id,
+            'usuario': self.usuario.id,
+            'fecha_devolucion_esperada': date.today() + timedelta(days=7),
+        })
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertFalse(servicio.crear_prestamo(self.libro.id, self.usuario.id, 7).exito)
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.stock_disponible, 0)
+
+
+class PrestamosConcurrentesTests(TransactionTestCase):
+    """Varios hilos compiten por los mismos ejemplares"""
+
+    HILOS = 8
+    INTENTOS_POR_HILO = 5
+    STOCK = 10
+
+    def test_stock_nunca_negativo(self):
+        _, _, _, (libro,) = crear_catalogo(1, stock=self.STOCK)
+        usuario = User.objects.create_user(username='lector', password='x')
+        exitos, errores = [], []
+        barrera = threading.Barrier(self.HILOS)
+
+        def trabajador():
+            try:
+                barrera.wait()
+                for _ in range(self.INTENTOS_POR_HILO):
+                    while True:
+                        try:
+                            prestar_libro(libro.id, usuario.id, 7, verificar_usuario=False)
+                            exitos.append(1)
+                        except LibroNoDisponible:
+                            pass
+                        except OperationalError:
+                            # SQLite bloquea la tabla entre escritores: reintentar
+                            continue
+                        break
+            except Exception as e:
+                errores.append(e)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=trabajador) for _ in range(self.HILOS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        self.assertEqual(len(exitos), self.STOCK)
+        # Sin la transacción de TestCase las lecturas irían a la réplica (DB_SQLITE=1)
+        with usar_primario():
+            libro.refresh_from_db()
+            self.assertEqual(Prestamo.objects.filter(libro=libro).count(), self.STOCK)
+        self.assertEqual(libro.stock_disponible, 0)
+        self.assertEqual(libro.estado, 'prestado')
+
+
+class EstadisticasTests(TestCase):
+    """Histograma de préstamos del panel de estadísticas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        _, _, _, libros = crear_catalogo(3, stock=5)
+        usuario = User.objects.create_user(username='lector', password='x')
+        hoy = date.today()
+        for dias_atras in (0, 0, 2, 40, 200):
+            prestamo = Prestamo.objects.create(
+                libro=libros[dias_atras % 3],
+                usuario=usuario,
+                fecha_devolucion_esperada=hoy + timedelta(days=14),
+            )
+            Prestamo.objects.filter(id=prestamo.id).update(
+                fecha_prestamo=hoy - timedelta(days=dias_atras)
+            )
+        # Las fechas se movieron con UPDATE: recalcular las estadísticas
+        estadisticas.reconstruir()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_numero_de_consultas_no_depende_de_la_ventana(self):
+        self.client.get('/api/estadisticas/')  # contadores en caché
+        for dias in (7, 30, 90, 365):
+            with self.assertNumQueries(4):
+                respuesta = self.client.get(f'/api/estadisticas/?dias={dias}')
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertEqual(respuesta.context['dias'], dias)
+
+    def test_histograma_rellena_dias_vacios(self):
+        respuesta = self.client.get('/api/estadisticas/?dias=7')
+        datos = json.loads(respuesta.context['prestamos_data'])
+        self.assertEqual(len(datos), 7)
+        self.assertEqual(datos[-1], 2)
+        self.assertEqual(datos[-3], 1)
+        self.assertEqual(sum(datos), 3)
+
+        respuesta = self.client.get('/api/estadisticas/?dias=365')
+        self.assertEqual(sum(json.loads(respuesta.context['prestamos_data'])), 5)
+
+    def test_ventana_invalida_usa_la_de_defecto(self):
+        respuesta = self.client.get('/api/estadisticas/?dias=12')
+        self.assertEqual(respuesta.context['dias'], 30)
+
+
+class EstadisticasPrecalculadasTests(TestCase):
+    """Actualización incremental y reconstrucción de las estadísticas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor, _, cls.categoria, cls.libros = crear_catalogo(3, stock=5)
+        cls.usuario = User.objects.create_user(username='lector', password='x')
+
+    def setUp(self):
+        cache.clear()
+
+    def instantanea(self):
+        return {
+            'dias': list(EstadisticaDiaria.objects.values_list('fecha', 'prestamos', 'devoluciones')),
+            'libros': sorted(EstadisticaLibro.objects.values_list('libro_id', 'total_prestamos')),
+            'autores': sorted(EstadisticaAutor.objects.values_list('autor_id', 'total_prestamos')),
+            'categorias': sorted(EstadisticaCategoria.objects.values_list('categoria_id', 'total_libros')),
+            'contadores': sorted(Contador.objects.values_list('nombre', 'valor')),
+        }
+
+    def test_incremental_coincide_con_reconstruccion(self):
+        prestamos = [prestar_libro(libro.id, self.usuario.id, 7) for libro in self.libros * 2]
+        devolver_prestamo(prestamos[0].id)
+        prestamos[1].delete()
+        otra = Categoria.objects.create(nombre='Ensayo')
+        libro = Libro.objects.get(id=self.libros[2].id)
+        libro.categoria = otra
+        libro.save()
+
+        incremental = self.instantanea()
+        self.assertEqual(incremental['dias'], [(date.today(), 5, 1)])
+        self.assertEqual(incremental['autores'], [(self.autor.id, 5)])
+        self.assertIn((otra.id, 1), incremental['categorias'])
+
+        estadisticas.reconstruir()
+        self.assertEqual(self.instantanea(), incremental)
+
+    def test_panel_lee_las_estadisticas(self):
+        for libro in (self.libros[0], self.libros[0], self.libros[1]):
+            prestar_libro(libro.id, self.usuario.id, 7)
+        respuesta = self.client.get('/api/estadisticas/')
+        self.assertEqual(
+            [(fila.libro_id, fila.total_prestamos) for fila in respuesta.context['top_libros']],
+            [(self.libros[0].id, 2), (self.libros[1].id, 1)],
+        )
+        self.assertEqual(respuesta.context['total_libros'], 3)
+        self.assertEqual(respuesta.context['total_usuarios'], 1)
+
+    def test_comando_reconstruir(self):
+        Contador.objects.all().delete()
+        salida = StringIO()
+        call_command('reconstruir_estadisticas', stdout=salida)
+        self.assertIn('reconstruidas', salida.getvalue())
+        self.assertEqual(estadisticas.contadores('libros')['libros'], 3)
+
+
+class MigracionEstadisticasTests(TransactionTestCase):
+    """La migración 0003 rellena las estadísticas con los datos existentes"""
+
+    ANTES = [('libros', '0002_indices_paginacion_cursor')]
+    DESPUES = [('libros', '0003_estadisticas_precalculadas')]
+
+    def tearDown(self):
+        ejecutor = MigrationExecutor(connection)
+        ejecutor.migrate(ejecutor.loader.graph.leaf_nodes())
+
+    def test_migrar_sobre_datos_existentes(self):
+        ejecutor = MigrationExecutor(connection)
+        ejecutor.migrate(self.ANTES)
+        apps = ejecutor.loader.project_state(self.ANTES).apps
+        autor = apps.get_model('libros', 'Autor').objects.create(nombre='Julio', apellido='Cortázar')
+        categoria = apps.get_model('libros', 'Categoria').objects.create(nombre='Novela')
+        Libro = apps.get_model('libros', 'Libro')
+        libros = [
+            Libro.objects.create(titulo=f'Libro {i}', isbn=f'97800000000{i:02d}', autor=autor,
+                                 categoria=categoria, fecha_publicacion=date(1963, 1, 1), numero_paginas=300)
+            for i in range(3)
+        ]
+        usuario = apps.get_model('auth', 'User').objects.create(username='lector')
+        Prestamo = apps.get_model('libros', 'Prestamo')
+        for libro in (libros[0], libros[0], libros[1]):
+            Prestamo.objects.create(libro=libro, usuario=usuario,
+                                    fecha_devolucion_esperada=date.today() + timedelta(days=7))
+
+        ejecutor = MigrationExecutor(connection)
+        ejecutor.migrate(self.DESPUES)
+
+        with usar_primario():
+            self.assertEqual(sorted(Contador.objects.values_list('nombre', 'valor')),
+                             [('autores', 1), ('libros', 3), ('usuarios', 1)])
+            self.assertEqual(sorted(EstadisticaLibro.objects.values_list('libro_id', 'total_prestamos')),
+                             [(libros[0].id, 2), (libros[1].id, 1)])
+            self.assertEqual(list(EstadisticaAutor.objects.values_list('autor_id', 'total_prestamos')),
+                             [(autor.id, 3)])
+            self.assertEqual(list(EstadisticaCategoria.objects.values_list('categoria_id', 'total_libros')),
+                             [(categoria.id, 3)])
+            self.assertEqual(list(EstadisticaDiaria.objects.values_list('fecha', 'prestamos')),
+                             [(date.today(), 3)])
+
+
+class MigracionIndiceBusquedaTests(TransactionTestCase):
+    """La migración 0004 indexa los libros existentes como lo haría busqueda.py"""
+
+    ANTES = [('libros', '0003_estadisticas_precalculadas')]
+    DESPUES = [('libros', '0004_indice_busqueda')]
+
+    def tearDown(self):
+        ejecutor = MigrationExecutor(connection)
+        ejecutor.migrate(ejecutor.loader.graph.leaf_nodes())
+
+    def test_migrar_sobre_datos_existentes(self):
+        ejecutor = MigrationExecutor(connection)
+        ejecutor.migrate(self.ANTES)
+        apps = ejecutor.loader.project_state(self.ANTES).apps
+        autor = apps.get_model('libros', 'Autor').objects.create(nombre='Julio', apellido='Cortázar')
+        libro = apps.get_model('libros', 'Libro').objects.create(
+            titulo='Historias de cronopios y de famas', isbn='9788466331890', autor=autor,
+            fecha_publicacion=date(1962, 1, 1), numero_paginas=160,
+        )
+
+        ejecutor = MigrationExecutor(connection)
+        ejecutor.migrate(self.DESPUES)
+
+        with usar_primario():
+            self.assertEqual(
+                sorted(TerminoBusqueda.objects.values_list('campo', 'termino')),
+                sorted(busqueda.terminos_de_libro(libro.titulo, libro.isbn, autor.nombre, autor.apellido)),
+            )
+
+
+class CacheTests(TestCase):
+    """Caché de datos de referencia invalidada por señales"""
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_catalogo(2)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_catalogo_se_sirve_de_cache(self):
+        lista_categorias()
+        with self.assertNumQueries(0):
+            self.assertEqual([c.nombre for c in lista_categorias()], ['Cuento'])
+
+    def test_guardar_categoria_invalida(self):
+        lista_categorias()
+        with self.captureOnCommitCallbacks(execute=True):
+            Categoria.objects.create(nombre='Ensayo')
+        self.assertEqual([c.nombre for c in lista_categorias()], ['Cuento', 'Ensayo'])
+
+    def test_cambios_en_libros_invalidan_el_panel(self):
+        self.assertEqual(totales_panel()['total_libros'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            libro = Libro.objects.first()
+            libro.pk = None
+            libro.isbn = '9789999999999'
+            libro.save()
+        self.assertEqual(totales_panel()['total_libros'], 3)
+
+    def test_soap_listar_categorias_usa_cache(self):
+        servicio = NullServer(soap_app, ostr=False).service
+        servicio.listar_categorias()
+        with self.assertNumQueries(0):
+            self.assertEqual([c.nombre for c in servicio.listar_categorias()], ['Cuento'])
+
+
+class BusquedaTests(TestCase):
+    """Índice de búsqueda de libros usado por HTML, REST y SOAP"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor, editorial, categoria, _ = crear_catalogo(0)
+        cls.garcia = Autor.objects.create(nombre='Gabriel', apellido='García Márquez')
+        datos = [
+            ('Cien años de soledad', '9780307474728', cls.garcia),
+            ('El amor en los tiempos del cólera', '9780307389732', cls.garcia),
+            ('Ficciones', '9788420633121', cls.autor),
+            ('Soledades', '9788437600000', cls.autor),
+        ]
+        cls.libros = {
+            titulo: Libro.objects.create(
+                titulo=titulo, isbn=isbn, autor=autor, editorial=editorial,
+                categoria=categoria, fecha_publicacion=date(1967, 1, 1), numero_paginas=300,
+            )
+            for titulo, isbn, autor in datos
+        }
+
+    def titulos(self, texto, **kwargs):
+        return [libro.titulo for libro in busqueda.buscar_libros(texto, **kwargs)]
+
+    def test_terminos_sin_acentos_ni_palabras_vacias(self):
+        self.assertEqual(busqueda.terminos('El Amor en los tiempos del CÓLERA'),
+                         ['amor', 'tiempos', 'colera'])
+
+    def test_todos_los_terminos_y_prefijos(self):
+        self.assertEqual(self.titulos('garcia colera'), ['El amor en los tiempos del cólera'])
+        self.assertEqual(self.titulos('márq cien'), ['Cien años de soledad'])
+        self.assertEqual(self.titulos('978843'), ['Soledades'])
+        self.assertEqual(self.titulos('borges cien'), [])
+        self.assertEqual(self.titulos('de la'), [])
+
+    def test_isbn_por_partes(self):
+        self.assertEqual(busqueda.termino_isbn('978-84-376'), '97884376')
+        self.assertIsNone(busqueda.termino_isbn('9788437'))
+        self.assertIsNone(busqueda.termino_isbn('cien 84'))
+        self.assertEqual(self.titulos('978-84-376'), ['Soledades'])
+        self.assertEqual(self.titulos(' 978 0307 '), ['Cien años de soledad', 'El amor en los tiempos del cólera'])
+        self.assertEqual(self.titulos('978-84-376', campos=(busqueda.CAMPO_TITULO,)), [])
+
+    def test_terminos_cortos(self):
+        self.assertEqual(self.titulos('ci'), ['Cien años de soledad', 'Ficciones'])
+        self.assertEqual(self.titulos('Ga'), ['Cien años de soledad', 'El amor en los tiempos del cólera'])
+        self.assertEqual(self.titulos('97'), list(self.libros))
+        self.assertEqual(self.titulos('ci so'), ['Cien años de soledad'])
+        self.assertEqual(self.titulos('ci', campos=(busqueda.CAMPO_AUTOR,)), [])
+        respuesta = self.client.get('/api/libros/', {'search': 'fi'})
+        self.assertEqual([libro['titulo'] for libro in respuesta.json()['results']], ['Ficciones'])
+
+    def test_relevancia(self):
+        # Coincidencia exacta en el título antes que por prefijo
+        self.assertEqual(self.titulos('soledad'), ['Cien años de soledad', 'Soledades'])
+        self.assertEqual(self.titulos('soledad', campos=(busqueda.CAMPO_AUTOR,)), [])
+
+    def test_senales_mantienen_el_indice(self):
+        libro = self.libros['Ficciones']
+        libro.titulo = 'El Aleph'
+        libro.save()
+        self.assertEqual(self.titulos('aleph'), ['El Aleph'])
+        self.assertEqual(self.titulos('ficciones'), [])
+
+        self.autor.apellido = 'Acevedo'
+        self.autor.save()
+        self.assertEqual(self.titulos('acevedo'), ['El Aleph', 'Soledades'])
+        self.assertEqual(self.titulos('borges'), [])
+
+        libro.delete()
+        self.assertFalse(TerminoBusqueda.objects.filter(libro_id=libro.id).exists())
+
+    def test_reconstruir_indice(self):
+        esperado = set(TerminoBusqueda.objects.values_list('libro_id', 'campo', 'termino'))
+        TerminoBusqueda.objects.all().delete()
+        salida = StringIO()
+        call_command('indexar_busqueda', stdout=salida)
+        self.assertIn('4 libros', salida.getvalue())
+        self.assertEqual(set(TerminoBusqueda.objects.values_list('libro_id', 'campo', 'termino')), esperado)
+
+    def test_vista_html(self):
+        respuesta = self.client.get('/api/busqueda/', {'q': 'Garcia'})
+        self.assertEqual(
+            {libro.titulo for libro in respuesta.context['resultados']},
+            {'Cien años de soledad', 'El amor en los tiempos del cólera'},
+        )
+
+    def test_api_rest(self):
+        respuesta = self.client.get('/api/libros/', {'search': 'marquez'})
+        self.assertEqual(
+            [libro['titulo'] for libro in respuesta.json()['results']],
+            ['Cien años de soledad', 'El amor en los tiempos del cólera'],
+        )
+        self.assertEqual(len(self.client.get('/api/libros/', {'search': ''}).json()['results']), 4)
+
+    def test_soap(self):
+        servicio = NullServer(soap_app, ostr=False).service
+        self.assertEqual([l.titulo for l in servicio.buscar_libros_por_titulo('soled')],
+                         ['Cien años de soledad', 'Soledades'])
+        self.assertEqual([l.titulo for l in servicio.buscar_libros_por_autor('Garcia')],
+                         ['Cien años de soledad', 'El amor en los tiempos del cólera'])
+
+
+class AutocompletadoTests(TestCase):
+    """Índice en memoria de /api/autocomplete/"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor, _, cls.categoria, _ = crear_catalogo(0)
+        cls.libro = Libro.objects.create(
+            titulo='Historia universal de la infamia', isbn='9788420633138', autor=cls.autor,
+            fecha_publicacion=date(1935, 1, 1), numero_paginas=150,
+        )
+
+    def setUp(self):
+        autocompletado.indice.construir()
+
+    def sugerencias(self, prefijo, **kwargs):
+        return [(s['tipo'], s['texto']) for s in autocompletado.autocompletar(prefijo, **kwargs)]
+
+    def test_prefijos_de_titulo_autor_y_categoria(self):
+        self.assertEqual(self.sugerencias('histo'), [('libro', 'Historia universal de la infamia')])
+        self.assertEqual(self.sugerencias('Borg'), [('autor', 'Borges Jorge Luis')])
+        self.assertEqual(self.sugerencias('jorge l'), [('autor', 'Jorge Luis Borges')])
+        self.assertEqual(self.sugerencias('CUÉN'), [('categoria', 'Cuento')])
+        self.assertEqual(self.sugerencias('universal'), [])
+        self.assertEqual(self.sugerencias('c', tipos=['libro']), [])
+
+    def test_sin_consultas(self):
+        with self.assertNumQueries(0):
+            self.sugerencias('histo')
+
+    def test_senales_actualizan_el_indice(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            libro = Libro.objects.get(id=self.libro.id)
+            libro.titulo = 'El libro de arena'
+            libro.save()
+        self.assertEqual(self.sugerencias('histo'), [])
+        self.assertEqual(self.sugerencias('el libro'), [('libro', 'El libro de arena')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Categoria.objects.create(nombre='Ensayo')
+            Autor.objects.get(id=self.autor.id).delete()
+        self.assertEqual(self.sugerencias('ens'), [('categoria', 'Ensayo')])
+        self.assertEqual(self.sugerencias('borges'), [])
+        self.assertEqual(self.sugerencias('el libro'), [])
+
+    def test_cambios_durante_una_reconstruccion(self):
+        indice = autocompletado.IndiceAutocompletado()
+
+        def catalogo():
+            # Llega un cambio mientras se lee el catálogo
+            indice.agregar(autocompletado.TIPO_LIBRO, 99, 'Ficciones')
+            yield from ()
+
+        indice.construir(registros=catalogo())
+        self.assertEqual([s['id'] for s in indice.buscar('ficc')], [99])
+
+    def test_filtro_por_tipo(self):
+        indice = autocompletado.IndiceAutocompletado()
+        indice.construir(registros=[
+            *(r for i in range(200) for r in autocompletado._registros_de(
+                autocompletado.TIPO_LIBRO, i, (f'Cuento {i:03d}',))),
+            *autocompletado._registros_de(autocompletado.TIPO_AUTOR, 1, ('Cuento Apellido', 'Apellido Cuento')),
+            *autocompletado._registros_de(autocompletado.TIPO_CATEGORIA, 1, ('Cuentos',)),
+        ])
+        # Cada tipo tiene su arreglo: los 200 libros no se recorren para la categoría
+        with mock.patch.object(indice, '_registros', {**indice._registros, 'l': None}):
+            self.assertEqual(indice.buscar('cuento', tipos=['categoria']),
+                             [{'tipo': 'categoria', 'id': 1, 'texto': 'Cuentos'}])
+        self.assertEqual([(s['tipo'], s['texto']) for s in indice.buscar('cuento', limite=3)], [
+            ('libro', 'Cuento 000'), ('libro', 'Cuento 001'), ('libro', 'Cuento 002'),
+        ])
+        self.assertEqual([(s['tipo'], s['texto']) for s in indice.buscar('cuento a', tipos=['autor', 'libro'])],
+                         [('autor', 'Cuento Apellido')])
+        self.assertEqual(indice.buscar('cuento', tipos=['otro']), [])
+
+    def test_precargar(self):
+        with mock.patch.object(autocompletado, 'indice', autocompletado.IndiceAutocompletado()), \
+                mock.patch.object(autocompletado.connections, 'close_all') as cerrar:
+            autocompletado.precargar()
+            self.assertTrue(autocompletado.indice.construido)
+            with self.assertNumQueries(0):
+                self.assertEqual(len(autocompletado.autocompletar('histo')), 1)
+            self.assertTrue(cerrar.called)
+
+        # Sin base de datos el índice se deja para la primera consulta
+        with mock.patch.object(autocompletado, 'indice', autocompletado.IndiceAutocompletado()), \
+                mock.patch.object(autocompletado.connections, 'close_all'), \
+                mock.patch.object(autocompletado, '_leer_catalogo', side_effect=DatabaseError('sin tablas')), \
+                self.assertLogs('libros.autocompletado', 'WARNING'):
+            autocompletado.precargar()
+            self.assertFalse(autocompletado.indice.construido)
+
+    def test_api(self):
+        respuesta = self.client.get('/api/autocomplete/', {'q': 'his', 'limite': 5})
+        self.assertEqual(respuesta.json()['results'], [
+            {'tipo': 'libro', 'id': self.libro.id, 'texto': 'Historia universal de la infamia'},
+        ])
+        self.assertEqual(self.client.get('/api/autocomplete/').json()['results'], [])
+
+
+class PoolConexionesTests(TestCase):
+    """Pool de conexiones del backend MySQL, con sqlite3 como sustituto"""
+
+    def crear_pool(self, **opciones):
+        return PoolConexiones(
+            crear=lambda: sqlite3.connect(':memory:', check_same_thread=False),
+            validar=lambda conexion: conexion.execute('SELECT 1').fetchone() == (1,),
+            cerrar=lambda conexion: conexion.close(),
+            **opciones
+        )
+
+    def test_reutiliza_bajo_carga_concurrente(self):
+        pool = self.crear_pool(tamano_maximo=3, espera_maxima=5)
+        errores = []
+
+        def trabajar():
+            try:
+                for _ in range(20):
+                    conexion = pool.obtener()
+                    conexion.execute('SELECT 1').fetchone()
+                    pool.devolver(conexion)
+            except Exception as e:
+                errores.append(e)
+
+        hilos = [threading.Thread(target=trabajar) for _ in range(12)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        estado = pool.estadisticas()
+        self.assertLessEqual(estado['creadas'], 3)
+        self.assertEqual(estado['creadas'] + estado['reutilizadas'], 240)
+        self.assertEqual(estado['en_uso'], 0)
+        self.assertEqual(estado['libres'], estado['creadas'])
+
+    def test_agotado(self):
+        pool = self.crear_pool(tamano_maximo=1, espera_maxima=0.05)
+        conexion = pool.obtener()
+        with self.assertRaises(PoolAgotado):
+            pool.obtener()
+        self.assertEqual(pool.estadisticas()['agotado'], 1)
+        pool.devolver(conexion)
+        self.assertIs(pool.obtener(), conexion)
+
+    def test_vida_maxima_y_validacion(self):
+        pool = self.crear_pool(vida_maxima=0)
+        primera = pool.obtener()
+        pool.devolver(primera)
+        self.assertIsNot(pool.obtener(), primera)
+
+        pool = self.crear_pool(validar_tras=0)
+        muerta = pool.obtener()
+        pool.devolver(muerta)
+        muerta.close()
+        nueva = pool.obtener()
+        self.assertIsNot(nueva, muerta)
+        self.assertEqual(pool.estadisticas()['descartadas'], 1)
+
+    def test_conexion_no_reutilizable(self):
+        pool = self.crear_pool()
+        conexion = pool.obtener()
+        pool.devolver(conexion, reutilizable=False)
+        self.assertEqual(pool.estadisticas()['libres'], 0)
+
+    def test_endpoint_interno(self):
+        respuesta = self.client.get('/interno/pool/')
+        self.assertIn('default', respuesta.json()['bases_de_datos'])
+        self.assertEqual(self.client.get('/interno/pool/', REMOTE_ADDR='10.0.0.1').status_code, 403)
+
+    @override_settings(REDES_INTERNAS=[ipaddress.ip_network('127.0.0.1'), ipaddress.ip_network('172.28.0.0/16')])
+    def test_endpoint_interno_desde_una_red(self):
+        # Prometheus en otro contenedor de la red de docker-compose
+        self.assertEqual(self.client.get('/interno/pool/', REMOTE_ADDR='172.28.0.7').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='172.28.3.1').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='172.29.0.1').status_code, 403)
+
+    def test_internal_ips_mal_escritas_impiden_arrancar(self):
+        comprobar = [sys.executable, '-c', 'import biblioteca_project.settings']
+        entorno = {**os.environ, 'INTERNAL_IPS': '127.0.0.1, 172.28.0.0/16'}
+        subprocess.run(comprobar, env=entorno, check=True, capture_output=True)
+        error = subprocess.run(comprobar, env={**entorno, 'INTERNAL_IPS': '127.0.0.1,172.28.0.0/40'},
+                               capture_output=True, text=True)
+        self.assertNotEqual(error.returncode, 0)
+        self.assertIn('172.28.0.0/40', error.stderr)
+
+
+class BackendMysqlPoolTests(SimpleTestCase):
+    """
+    Préstamo y devolución de conexiones del backend biblioteca_project.db.mysql,
+    con conexiones MySQLdb simuladas
+    """
+    ALIAS = 'pool_pruebas'
+
+    def setUp(self):
+        self.creadas = []
+
+        def nueva_conexion(wrapper, conn_params):
+            conexion = mock.Mock(name=f'conexion{len(self.creadas)}')
+            self.creadas.append(conexion)
+            return conexion
+
+        for objetivo, atributo, valor in (
+            (mysql_base.mysql.DatabaseWrapper, 'get_new_connection', nueva_conexion),
+            (mysql_base.DatabaseWrapper, 'init_connection_state', lambda wrapper: None),
+        ):
+            parche = mock.patch.object(objetivo, atributo, valor)
+            parche.start()
+            self.addCleanup(parche.stop)
+        self.addCleanup(lambda: [mysql_base._pools.pop(clave) for clave in list(mysql_base._pools)
+                                 if clave[0] == self.ALIAS])
+
+    def wrapper(self, conn_max_age=0):
+        return mysql_base.DatabaseWrapper({
+            **connection.settings_dict,
+            'ENGINE': 'biblioteca_project.db.mysql', 'NAME': 'biblioteca', 'USER': 'root',
+            'PASSWORD': '', 'HOST': 'localhost', 'PORT': '3306', 'OPTIONS': {},
+            'CONN_MAX_AGE': conn_max_age, 'POOL': {'TAMANO_MAXIMO': 2, 'VALIDAR_TRAS': 30},
+        }, self.ALIAS)
+
+    def pool(self):
+        return mysql_base.pools()[self.ALIAS]
+
+    def test_cerrar_devuelve_y_otro_hilo_reutiliza(self):
+        primero, segundo = self.wrapper(), self.wrapper()
+        primero.connect()
+        conexion = primero.connection
+        primero.close()
+        conexion.rollback.assert_called_once_with()
+        conexion.close.assert_not_called()
+        self.assertIsNone(primero.connection)
+        self.assertEqual(self.pool().estadisticas()['libres'], 1)
+
+        # Otro wrapper (otro hilo) con la misma configuración la recibe
+        segundo.connect()
+        self.assertIs(segundo.connection, conexion)
+        self.assertEqual(len(self.creadas), 1)
+        self.assertEqual(self.pool().estadisticas()['reutilizadas'], 1)
+
+    def test_conexion_rota_se_descarta(self):
+        wrapper = self.wrapper()
+        wrapper.connect()
+        rota = wrapper.connection
+        rota.rollback.side_effect = mysql_base.Database.OperationalError(2013, 'Lost connection')
+        wrapper.close()
+        rota.close.assert_called_once_with()
+        self.assertEqual(self.pool().estadisticas()['libres'], 0)
+        wrapper.connect()
+        self.assertIsNot(wrapper.connection, rota)
+
+    def test_tras_errores_se_valida(self):
+        wrapper = self.wrapper()
+        wrapper.connect()
+        conexion = wrapper.connection
+        conexion.ping.side_effect = mysql_base.Database.OperationalError(2006, 'Gone away')
+        wrapper.errors_occurred = True
+        wrapper.close()
+        conexion.ping.assert_called_once_with()
+        self.assertEqual(self.pool().estadisticas()['descartadas'], 1)
+
+    def test_cerrada_dentro_de_atomic_no_se_reutiliza(self):
+        wrapper = self.wrapper()
+        wrapper.connect()
+        conexion = wrapper.connection
+        wrapper.in_atomic_block = True
+        wrapper.close()
+        conexion.rollback.assert_not_called()
+        conexion.close.assert_called_once_with()
+        self.assertEqual(self.pool().estadisticas()['en_uso'], 0)
+
+    def test_conn_max_age(self):
+        # CONN_MAX_AGE=0: al final de cada petición Django la "cierra" y vuelve al pool
+        wrapper = self.wrapper(conn_max_age=0)
+        wrapper.connect()
+        conexion = wrapper.connection
+        wrapper.close_if_unusable_or_obsolete()
+        self.assertIsNone(wrapper.connection)
+        self.assertEqual(self.pool().estadisticas()['libres'], 1)
+        conexion.close.assert_not_called()
+
+        # Con CONN_MAX_AGE el wrapper la conserva entre peticiones sin pasar por el pool
+        persistente = self.wrapper(conn_max_age=60)
+        persistente.connect()
+        self.assertIs(persistente.connection, conexion)
+        persistente.health_check_enabled = False
+        persistente.close_if_unusable_or_obsolete()
+        self.assertIs(persistente.connection, conexion)
+        self.assertEqual(self.pool().estadisticas()['en_uso'], 1)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class RouterReplicasTests(SimpleTestCase):
+    """Lecturas a réplicas con lectura de lo escrito en el primario"""
+
+    def setUp(self):
+        self.router = RouterReplicas()
+
+    def peticion(self, metodo='get', vista=None, cookies=None, escribir=False):
+        """Pasa una petición por el middleware; devuelve (lecturas, respuesta)"""
+        request = getattr(RequestFactory(), metodo)('/')
+        request.COOKIES.update(cookies or {})
+        lecturas = []
+
+        def vista_prueba(request):
+            lecturas.append(self.router.db_for_read(Libro))
+            if escribir:
+                self.router.db_for_write(Prestamo)
+                lecturas.append(self.router.db_for_read(Libro))
+            return HttpResponse()
+
+        vista = vista or vista_prueba
+        middleware = ReplicasMiddleware(lambda request: (
+            middleware.process_view(request, vista, (), {}) or vista(request)
+        ))
+        return lecturas, middleware(request)
+
+    def test_lecturas_y_escrituras(self):
+        self.assertEqual(self.router.db_for_read(Libro), 'replica1')
+        self.assertEqual(self.router.db_for_write(Libro), 'default')
+        with usar_primario():
+            self.assertEqual(self.router.db_for_read(Libro), 'default')
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.router.db_for_read(Libro), 'default')
+
+    def test_leer_lo_escrito(self):
+        lecturas, respuesta = self.peticion(escribir=True)
+        self.assertEqual(lecturas, ['replica1', 'default'])
+        self.assertIn(COOKIE_PRIMARIO, respuesta.cookies)
+
+        # La siguiente petición del mismo cliente aún lee del primario
+        lecturas, respuesta = self.peticion(cookies={COOKIE_PRIMARIO: '1'})
+        self.assertEqual(lecturas, ['default'])
+        self.assertNotIn(COOKIE_PRIMARIO, respuesta.cookies)
+
+    def test_peticiones_de_escritura(self):
+        lecturas, _ = self.peticion('post')
+        self.assertEqual(lecturas, ['default'])
+
+        vista_lectura = lecturas_en_replica(lambda request: HttpResponse(self.router.db_for_read(Libro)))
+        _, respuesta = self.peticion('post', vista=vista_lectura)
+        self.assertEqual(respuesta.content, b'replica1')
+
+    def test_exportacion_elige_la_base_de_datos_durante_la_peticion(self):
+        # Las filas se leen al consumir la respuesta, con el middleware ya restaurado
+        with mock.patch.object(exportacion.Exportacion, 'bloques', autospec=True, return_value=iter([])) as bloques:
+            for cookies in ({}, {COOKIE_PRIMARIO: '1'}):
+                self.client.cookies = SimpleCookie(cookies)
+                b''.join(self.client.get('/api/exportar/libros/').streaming_content)
+        self.assertEqual([llamada.kwargs['using'] for llamada in bloques.call_args_list], ['replica1', 'default'])
+
+
+class PlanesConsultasTests(TestCase):
+    """Las consultas frecuentes no recorren tablas completas"""
+
+    def test_consultas_frecuentes_usan_indices(self):
+        escaneos = {nombre: tablas for nombre, _, tablas in planes.revisar_consultas() if tablas}
+        self.assertEqual(escaneos, {})
+
+    def test_detecta_escaneo_completo(self):
+        _, tablas = planes.explicar(Libro.objects.filter(idioma='Inglés').order_by())
+        self.assertEqual(tablas, [Libro._meta.db_table])
+
+
+class GeneradorDatosTests(TestCase):
+    """Datos sintéticos para pruebas de carga"""
+
+    def generar(self, **opciones):
+        return generador.generar(
+            usuarios=20, autores=10, editoriales=3, categorias=4, libros=200, prestamos=1000,
+            informar=lambda mensaje: None, **opciones
+        )
+
+    def test_genera_datos_coherentes(self):
+        # La caché se invalida al confirmar la transacción
+        with self.captureOnCommitCallbacks(execute=True):
+            totales = self.generar(proporcion_activos=0.2, proporcion_vencidos=0.5)
+        self.assertEqual(totales['prestamos'], 1000)
+        self.assertEqual(Libro.objects.count(), 200)
+        self.assertEqual(Prestamo.objects.count(), 1000)
+
+        # El stock de cada libro descuenta sus préstamos activos
+        activos = Prestamo.objects.filter(estado='activo')
+        self.assertEqual(activos.count(), 200)
+        por_libro = {}
+        for libro_id in activos.values_list('libro_id', flat=True):
+            por_libro[libro_id] = por_libro.get(libro_id, 0) + 1
+        for libro in Libro.objects.all():
+            self.assertEqual(libro.stock_disponible, libro.stock_total - por_libro.get(libro.id, 0))
+            self.assertEqual(libro.estado == 'prestado', libro.stock_disponible == 0)
+
+        vencidos = activos.filter(fecha_devolucion_esperada__lt=date.today()).count()
+        self.assertTrue(60 <= vencidos <= 140, vencidos)
+        self.assertFalse(Prestamo.objects.filter(fecha_prestamo__gt=date.today()).exists())
+        self.assertTrue(Prestamo.objects.filter(fecha_prestamo__lt=date.today() - timedelta(days=30)).exists())
+
+        # Popularidad sesgada: el libro más prestado supera con mucho la media
+        self.assertGreater(EstadisticaLibro.objects.order_by('-total_prestamos')[0].total_prestamos, 25)
+        # Se reconstruyen el índice de búsqueda y los contadores
+        libro = Libro.objects.first()
+        self.assertIn(libro, busqueda.buscar_libros(libro.titulo))
+        self.assertEqual(totales_panel()['total_libros'], 200)
+
+    def test_misma_semilla_mismos_datos(self):
+        self.generar(semilla=7, reconstruir=False)
+        primeros = list(Libro.objects.order_by('id').values_list('titulo', 'stock_total'))
+        Prestamo.objects.all().delete()
+        Libro.objects.all().delete()
+        self.generar(semilla=7, reconstruir=False)
+        segundos = list(Libro.objects.order_by('id').values_list('titulo', 'stock_total'))[-200:]
+        self.assertEqual(primeros, segundos)
+
+    def test_rechaza_libros_sin_autores(self):
+        with self.assertRaises(ValueError):
+            generador.generar(autores=0, libros=10, prestamos=0, informar=lambda mensaje: None)
+
+
+class InstrumentacionTests(TestCase):
+    """Tiempo, consultas y consultas repetidas por vista"""
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_catalogo(3)
+
+    def setUp(self):
+        instrumentacion.reiniciar()
+
+    def test_agrega_por_vista(self):
+        self.client.get('/api/libros/')
+        self.client.get('/api/libros/')
+        self.client.get(f'/api/libros/{Libro.objects.first().id}/')
+
+        series = instrumentacion.estadisticas()
+        self.assertEqual(series['libro-list']['peticiones'], 2)
+        self.assertEqual(series['libro-detail']['peticiones'], 1)
+        self.assertGreater(series['libro-list']['consultas'], 0)
+        self.assertEqual(sum(series['libro-list']['cubos']), 2)
+
+    def test_operaciones_soap(self):
+        sobre = (
+            '<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" '
+            'xmlns:tns="biblioteca.soap.services"><soapenv:Body><tns:obtener_libro>'
+            f'<tns:libro_id>{Libro.objects.first().id}</tns:libro_id>'
+            '</tns:obtener_libro></soapenv:Body></soapenv:Envelope>'
+        )
+        respuesta = self.client.post('/soap/', sobre, content_type='text/xml; charset=utf-8')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(instrumentacion.estadisticas()['soap:obtener_libro']['peticiones'], 1)
+
+    def test_server_timing_solo_en_debug(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/libros/'))
+        with override_settings(DEBUG=True):
+            cabecera = self.client.get('/api/libros/')['Server-Timing']
+        self.assertRegex(cabecera, r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ consultas"')
+
+    def test_detecta_consultas_repetidas(self):
+        ids = list(Libro.objects.values_list('id', flat=True))
+
+        def vista_n_mas_1(request):
+            for libro_id in ids:
+                Libro.objects.filter(id=libro_id).exists()
+            return HttpResponse()
+
+        middleware = instrumentacion.InstrumentacionMiddleware(vista_n_mas_1)
+        middleware.umbral_repetidas = 2
+        with self.assertLogs('biblioteca_project.instrumentacion', 'WARNING') as registro:
+            middleware(RequestFactory().get('/'))
+
+        serie = instrumentacion.estadisticas()[instrumentacion.SIN_RUTA]
+        self.assertEqual(serie['consultas'], 3)
+        self.assertEqual(serie['con_repetidas'], 1)
+        self.assertIn('2 repetidas', registro.output[0])
+
+        def vista_por_bloques(request):
+            with instrumentacion.por_bloques():
+                vista_n_mas_1(request)
+            return HttpResponse()
+
+        instrumentacion.reiniciar()
+        middleware = instrumentacion.InstrumentacionMiddleware(vista_por_bloques)
+        middleware.umbral_repetidas = 2
+        with self.assertNoLogs('biblioteca_project.instrumentacion', 'WARNING'):
+            middleware(RequestFactory().get('/'))
+        serie = instrumentacion.estadisticas()[instrumentacion.SIN_RUTA]
+        self.assertEqual((serie['consultas'], serie['con_repetidas']), (3, 0))
+
+        # Solo como with ajustado al bucle: no decora un método entero
+        with self.assertRaises(TypeError):
+            instrumentacion.por_bloques()(vista_n_mas_1)
+
+
+class MetricasTests(TestCase):
+    """Endpoint /metrics y suma de las métricas de varios procesos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_catalogo(3)
+
+    def setUp(self):
+        instrumentacion.reiniciar()
+
+    def test_formato_prometheus(self):
+        self.client.get('/api/libros/')
+        self.client.get('/api/libros/')
+        lista_categorias()
+        lista_categorias()
+
+        respuesta = self.client.get('/metrics')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta['Content-Type'].startswith('text/plain; version=0.0.4'))
+        texto = respuesta.content.decode()
+        self.assertIn('# TYPE biblioteca_peticion_duracion_segundos histogram', texto)
+        self.assertIn('biblioteca_peticiones_total{vista="libro-list"} 2', texto)
+        self.assertIn('biblioteca_peticion_duracion_segundos_bucket{vista="libro-list",le="+Inf"} 2', texto)
+        self.assertIn('biblioteca_peticion_duracion_segundos_count{vista="libro-list"} 2', texto)
+        self.assertRegex(texto, r'biblioteca_cache_aciertos_total\{grupo="catalogo"\} [1-9]')
+
+        # Los cubos son acumulados: nunca decrecen
+        cubos = [int(linea.rsplit(' ', 1)[1]) for linea in texto.splitlines()
+                 if linea.startswith('biblioteca_peticion_duracion_segundos_bucket{vista="libro-list"')]
+        self.assertEqual(cubos, sorted(cubos))
+
+    def test_solo_peticiones_internas(self):
+        respuesta = self.client.get('/metrics', REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(respuesta.status_code, 403)
+
+    def test_suma_procesos_y_acumula_los_terminados(self):
+        terminado = subprocess.Popen([sys.executable, '-c', 'pass'])
+        terminado.wait()
+        serie = {'peticiones': 5, 'errores': 1, 'segundos': 0.5, 'segundos_bd': 0.1, 'consultas': 20,
+                 'con_repetidas': 0, 'max_consultas': 4,
+                 'cubos': [5] + [0] * len(instrumentacion.CUBOS_MS)}
+        ajena = {'pid': terminado.pid, 'vistas': {'libro-list': serie}, 'cache': {},
+                 'pools': {'default': {'en_uso': 3, 'libres': 1, 'creadas': 7}}}
+        self.client.get('/api/libros/')
+
+        with tempfile.TemporaryDirectory() as directorio, override_settings(METRICAS_DIR=directorio):
+            fichero = Path(directorio) / f'{terminado.pid}-1.json'
+            fichero.write_text(json.dumps(ajena), encoding='utf-8')
+
+            total = metricas.recoger()
+            self.assertEqual(total['vistas']['libro-list']['peticiones'], 6)
+            self.assertEqual(total['vistas']['libro-list']['errores'], 1)
+            self.assertEqual(total['pools']['default'], {'creadas': 7})
+            self.assertEqual(total['procesos'], 1)
+
+            # El fichero del proceso terminado pasa al acumulado sin contarse dos veces
+            self.assertFalse(fichero.exists())
+            self.assertEqual(metricas.recoger()['vistas']['libro-list']['peticiones'], 6)
+
+
+class GetCondicionalTests(TestCase):
+    """ETag y Last-Modified del detalle y el listado de libros"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor, _, cls.categoria, cls.libros = crear_catalogo(3)
+        cls.usuario = User.objects.create_user('lector', password='x')
+
+    def no_serializa(self):
+        return mock.patch.object(LibroSerializer, 'to_representation',
+                                 side_effect=AssertionError('no debía serializar'))
+
+    def test_detalle_304_sin_serializar(self):
+        url = f'/api/libros/{self.libros[0].id}/'
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta['ETag'].startswith('W/"'))
+        self.assertIn('Last-Modified', respuesta)
+        self.assertIn('max-age=0', respuesta['Cache-Control'])
+
+        with self.no_serializa(), self.assertNumQueries(1):
+            no_modificado = self.client.get(url, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(no_modificado.status_code, 304)
+        self.assertEqual(no_modificado.content, b'')
+        self.assertEqual(no_modificado['ETag'], respuesta['ETag'])
+
+        with self.no_serializa():
+            no_modificado = self.client.get(url, HTTP_IF_MODIFIED_SINCE=respuesta['Last-Modified'])
+        self.assertEqual(no_modificado.status_code, 304)
+
+        # Un préstamo actualiza el stock y con él la versión del libro
+        prestar_libro(self.libros[0].id, self.usuario.id, 14)
+        modificado = self.client.get(url, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(modificado.status_code, 200)
+        self.assertEqual(modificado.json()['stock_disponible'], 0)
+
+    def test_cambios_en_la_categoria_invalidan(self):
+        url = f'/api/libros/{self.libros[0].id}/'
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.categoria.nombre = 'Cuentos'
+            self.categoria.save()
+        respuesta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['categoria_nombre'], 'Cuentos')
+
+    def test_invalidacion_desde_otro_proceso(self):
+        # Otro worker que modifica un autor solo incrementa la versión en la
+        # caché compartida: el ETag se calcula con ella en cada petición
+        url = '/api/libros/?page_size=2'
+        etag = self.client.get(url)['ETag']
+        cache.incr(cache_catalogo._clave_version(cache_catalogo.GRUPO_CATALOGO))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        detalle = f'/api/libros/{self.libros[0].id}/'
+        etag = self.client.get(detalle)['ETag']
+        cache.incr(cache_catalogo._clave_version(cache_catalogo.GRUPO_CATALOGO))
+        self.assertEqual(self.client.get(detalle, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_listado_304_y_cambios_en_la_pagina(self):
+        url = '/api/libros/?page_size=2'
+        # Las filas de la página se leen una vez para el ETag y la respuesta
+        with self.assertNumQueries(1):
+            etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(f'{url}&fields=id,titulo')
+        self.assertEqual(list(respuesta.json()['results'][0]), ['id', 'titulo'])
+        self.assertNotIn('Last-Modified', self.client.get(url))
+
+        with self.no_serializa(), self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Otra página u otro formato tienen otro ETag
+        self.assertNotEqual(self.client.get('/api/libros/?page_size=3')['ETag'], etag)
+        self.assertNotEqual(self.client.get(url, HTTP_ACCEPT='text/html')['ETag'], etag)
+
+        # Un libro nuevo que entra en la página la cambia
+        Libro.objects.create(titulo='Aleph', isbn='9780000009999', autor=self.autor,
+                             fecha_publicacion=date(1949, 1, 1), numero_paginas=146,
+                             stock_total=1, stock_disponible=1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detalle_html_304_sin_renderizar(self):
+        url = f'/api/libro/{self.libros[0].id}/'
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('private', respuesta['Cache-Control'])
+
+        with self.assertTemplateNotUsed('libros/detalle_libro.html'):
+            no_modificado = self.client.get(url, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(no_modificado.status_code, 304)
+
+        # Con sesión la página muestra otras acciones
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 200)
+
+    def test_libro_inexistente(self):
+        self.assertEqual(self.client.get('/api/libros/999999/').status_code, 404)
+        self.assertEqual(self.client.get('/api/libro/999999/').status_code, 404)
+
+
+@skipUnless(renderizadores.orjson, 'orjson no está instalado')
+class RenderizadoresTests(TestCase):
+    """JSON con orjson y MessagePack en la API REST"""
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_catalogo(3)
+
+    def test_orjson_equivale_al_json_de_drf(self):
+        datos = {'multa': Decimal('12.50'), 'error': gettext_lazy('Este campo es requerido.'),
+                 'titulo': 'Ficciones ñ', 'lista': [1, None, True], 3: 'clave numérica'}
+        rapido = renderizadores.ORJSONRenderer().render(datos)
+        self.assertEqual(json.loads(rapido), json.loads(JSONRenderer().render(datos)))
+        # Sangría pedida por el cliente: se delega en el JSON de DRF
+        sangrado = renderizadores.ORJSONRenderer().render(datos, 'application/json; indent=4')
+        self.assertIn(b'\n    "multa"', sangrado)
+
+    def test_api_usa_orjson(self):
+        respuesta = self.client.get('/api/libros/')
+        self.assertIsInstance(respuesta.accepted_renderer, renderizadores.ORJSONRenderer)
+        self.assertEqual(respuesta['Content-Type'], 'application/json')
+        self.assertEqual(len(respuesta.json()['results']), 3)
+
+    def test_parser_orjson(self):
+        respuesta = self.client.post('/api/categorias/', {'nombre': 'Poesía'}, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 201)
+        respuesta = self.client.post('/api/categorias/', '{"nombre": ', content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('JSON mal formado', respuesta.json()['detail'])
+
+    @skipUnless(renderizadores.msgpack, 'msgpack no está instalado')
+    def test_messagepack(self):
+        respuesta = self.client.get('/api/libros/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(respuesta['Content-Type'], 'application/msgpack')
+        libros = renderizadores.msgpack.unpackb(respuesta.content)['results']
+        self.assertEqual(libros, self.client.get('/api/libros/').json()['results'])
+
+        cuerpo = renderizadores.msgpack.packb({'nombre': 'Ensayo'})
+        respuesta = self.client.post('/api/categorias/', cuerpo, content_type='application/msgpack')
+        self.assertEqual(respuesta.status_code, 201)
+
+
+class ConsultasListadosTests(TestCase):
+    """Los listados de la API no hacen una consulta más por fila (N+1)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        generador.generar(usuarios=25, autores=25, editoriales=25, categorias=25, libros=25,
+                          prestamos=25, reconstruir=False, informar=lambda mensaje: None)
+
+    def assertConsultasNoCrecen(self, url, paginacion, tamanos=(2, 20)):
+        """Falla si pedir más filas por página cuesta más consultas"""
+        consultas = []
+        for tamano in tamanos:
+            with mock.patch.object(paginacion, 'page_size', tamano), \
+                    CaptureQueriesContext(connection) as capturadas:
+                respuesta = self.client.get(url)
+            self.assertEqual(respuesta.status_code, 200, url)
+            self.assertEqual(len(respuesta.json()['results']), tamano,
+                             f'{url}: hacen falta al menos {tamano} filas')
+            consultas.append(len(capturadas))
+        self.assertEqual(
+            consultas[0], consultas[-1],
+            f'{url}: {consultas[0]} consultas con {tamanos[0]} filas y '
+            f'{consultas[-1]} con {tamanos[-1]}:\n' + '\n'.join(c['sql'] for c in capturadas),
+        )
+
+    def test_listados_de_la_api(self):
+        for prefijo, viewset, _ in router.registry:
+            with self.subTest(prefijo):
+                self.assertConsultasNoCrecen(f'/api/{prefijo}/', viewset.pagination_class)
+
+    def test_detecta_n_mas_1(self):
+        with mock.patch.object(PrestamoViewSet, 'get_queryset', lambda vista: Prestamo.objects.all()), \
+                self.assertLogs('biblioteca_project.instrumentacion', 'WARNING'):
+            with self.assertRaisesMessage(AssertionError, 'consultas con 2 filas'):
+                self.assertConsultasNoCrecen('/api/prestamos/', PrestamoViewSet.pagination_class)
+
+    def test_check_de_relaciones(self):
+        self.assertEqual(relaciones.comprobar_viewsets(None), [])
+        self.assertEqual(relaciones.faltantes(Prestamo.objects.all(), PrestamoSerializer),
+                         ['libro', 'usuario'])
+        self.assertEqual(relaciones.faltantes(Libro.objects.select_related('autor'), LibroSerializer),
+                         ['categoria', 'editorial'])
+        self.assertEqual(relaciones.faltantes(Libro.objects.select_related(), LibroSerializer), [])
+
+
+class CamposDinamicosTests(TestCase):
+    """?fields= y ?expand= en la API REST"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor, cls.editorial, _, cls.libros = crear_catalogo(5)
+        cls.usuario = User.objects.create_user('lector', password='x')
+        cls.prestamo = prestar_libro(cls.libros[0].id, cls.usuario.id, 14)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return respuesta.json(), [consulta['sql'] for consulta in consultas]
+
+    def test_fields_reduce_las_columnas_leidas(self):
+        datos, consultas = self.get('/api/libros/?fields=id,titulo,stock_disponible')
+        self.assertEqual(set(datos['results'][0]), {'id', 'titulo', 'stock_disponible'})
+        pagina = consultas[-1]
+        self.assertNotIn('descripcion', pagina)
+        self.assertNotIn('JOIN', pagina)
+
+        datos, _ = self.get(f'/api/libros/{self.libros[1].id}/?fields=titulo')
+        self.assertEqual(datos, {'titulo': 'Libro 001'})
+
+    def test_expand(self):
+        datos, consultas = self.get('/api/libros/?fields=id,autor_nombre&expand=autor,editorial')
+        libro = datos['results'][0]
+        self.assertEqual(libro['autor']['nombre_completo'], 'Jorge Luis Borges')
+        self.assertEqual(libro['editorial']['nombre'], 'Sur')
+        self.assertEqual(libro['autor_nombre'], 'Jorge Luis Borges')
+        self.assertNotIn('descripcion', consultas[-1])
+
+        datos, consultas = self.get('/api/prestamos/?fields=id,libro&expand=libro.autor')
+        self.assertEqual(datos['results'][0]['libro']['autor']['apellido'], 'Borges')
+        self.assertEqual(len(consultas), 1)
+
+    def test_cursor_con_campos_reducidos(self):
+        datos, _ = self.get('/api/libros/?fields=id&ordering=-titulo&page_size=2')
+        self.assertEqual([libro['id'] for libro in datos['results']],
+                         [self.libros[4].id, self.libros[3].id])
+        with self.assertNumQueries(1):
+            siguiente = self.client.get(datos['next']).json()
+        self.assertEqual([libro['id'] for libro in siguiente['results']],
+                         [self.libros[2].id, self.libros[1].id])
+
+    def test_nombres_desconocidos(self):
+        respuesta = self.client.get('/api/libros/?fields=id,titlo')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('titlo', respuesta.json()['fields'])
+        respuesta = self.client.get('/api/libros/?expand=usuario')
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_escrituras_ignoran_los_parametros(self):
+        respuesta = self.client.post('/api/categorias/?fields=id', {'nombre': 'Poesía'},
+                                     content_type='application/json')
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(respuesta.json()['nombre'], 'Poesía')
+
+
+
+class LotesTests(TestCase):
+    """Altas, cambios y bajas en lote en /api/libros/lote/ y /api/prestamos/lote/"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor, cls.editorial, cls.categoria, cls.libros = crear_catalogo(3)
+        cls.usuario = User.objects.create_user('lector', password='x')
+
+    def enviar(self, metodo, url, elementos, formato='json'):
+        if formato == 'ndjson':
+            cuerpo, tipo = '\n'.join(json.dumps(e) for e in elementos), 'application/x-ndjson'
+        else:
+            cuerpo, tipo = json.dumps(elementos), 'application/json'
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, metodo)(url, cuerpo, content_type=tipo)
+
+    def nuevos(self, desde, cantidad):
+        return [{
+            'titulo': f'Nuevo {i}', 'isbn': f'979000000{i:04d}', 'autor': self.autor.id,
+            'categoria': self.categoria.id, 'editorial': self.editorial.id,
+            'fecha_publicacion': '2001-01-01', 'numero_paginas': 120,
+        } for i in range(desde, desde + cantidad)]
+
+    def test_alta_de_libros(self):
+        autocompletado.indice.construir()
+        contador = estadisticas.contadores(estadisticas.CONTADOR_LIBROS)[estadisticas.CONTADOR_LIBROS]
+        elementos = self.nuevos(0, 3) + [
+            {**self.nuevos(3, 1)[0], 'isbn': self.libros[0].isbn},  # ya existe
+            {**self.nuevos(4, 1)[0], 'isbn': '9790000000000'},      # repetido en el lote
+            {**self.nuevos(5, 1)[0], 'autor': 999999},
+            'no es un libro',
+        ]
+        respuesta = self.enviar('post', '/api/libros/lote/', elementos)
+        self.assertEqual(respuesta.status_code, 207)
+        datos = respuesta.json()
+        self.assertEqual((datos['total'], datos['correctos'], datos['errores']), (7, 3, 4))
+        resultados = datos['resultados']
+        self.assertEqual([r['indice'] for r in resultados], list(range(7)))
+        self.assertIn('isbn', resultados[3]['errores'])
+        self.assertIn('isbn', resultados[4]['errores'])
+        self.assertIn('autor', resultados[5]['errores'])
+        self.assertIn('non_field_errors', resultados[6]['errores'])
+
+        libro = Libro.objects.get(id=resultados[0]['id'])
+        self.assertEqual(libro.titulo, 'Nuevo 0')
+        # Lo que harían las señales de cada libro
+        self.assertEqual(estadisticas.contadores(estadisticas.CONTADOR_LIBROS)[estadisticas.CONTADOR_LIBROS],
+                         contador + 3)
+        self.assertEqual(EstadisticaCategoria.objects.get(categoria=self.categoria).total_libros, 6)
+        self.assertEqual(len(busqueda.buscar_libros('nuevo borges')), 3)
+        self.assertEqual(len(autocompletado.autocompletar('nuevo', tipos=['libro'])), 3)
+
+    def test_consultas_no_crecen_con_el_lote(self):
+        consultas = []
+        for desde, cantidad in ((0, 5), (100, 50)):
+            with CaptureQueriesContext(connection) as capturadas:
+                respuesta = self.enviar('post', '/api/libros/lote/', self.nuevos(desde, cantidad))
+            self.assertEqual(respuesta.status_code, 201, respuesta.content)
+            consultas.append(len(capturadas))
+        self.assertEqual(consultas[0], consultas[1])
+
+    def test_ndjson_y_atomico(self):
+        elementos = self.nuevos(0, 2) + [{**self.nuevos(2, 1)[0], 'numero_paginas': 'muchas'}]
+        respuesta = self.enviar('post', '/api/libros/lote/?atomico=1', elementos, formato='ndjson')
+        self.assertEqual(respuesta.status_code, 400)
+        datos = respuesta.json()
+        self.assertEqual((datos['correctos'], datos['errores'], datos['omitidos']), (0, 1, 2))
+        self.assertEqual([(r['indice'], r['estado']) for r in datos['resultados']],
+                         [(0, 'omitido'), (1, 'omitido'), (2, 'error')])
+        self.assertFalse(Libro.objects.filter(titulo__startswith='Nuevo').exists())
+
+        respuesta = self.enviar('post', '/api/libros/lote/', elementos, formato='ndjson')
+        self.assertEqual(respuesta.status_code, 207)
+        self.assertEqual([r['estado'] for r in respuesta.json()['resultados']], ['correcto', 'correcto', 'error'])
+        self.assertEqual(Libro.objects.filter(titulo__startswith='Nuevo').count(), 2)
+
+        # Un PATCH atómico con un error tampoco modifica los demás
+        nuevo = Libro.objects.get(titulo='Nuevo 0')
+        respuesta = self.enviar('patch', '/api/libros/lote/?atomico=1', [
+            {'id': nuevo.id, 'titulo': 'Cambiado'}, {'id': 999999, 'titulo': 'No existe'},
+        ])
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual([r['estado'] for r in respuesta.json()['resultados']], ['omitido', 'error'])
+        nuevo.refresh_from_db()
+        self.assertEqual(nuevo.titulo, 'Nuevo 0')
+
+        respuesta = self.client.post('/api/libros/lote/', '{"titulo": "x"}\n{',
+                                     content_type='application/x-ndjson')
+        self.assertEqual(respuesta.status_code, 400)
+        respuesta = self.client.post('/api/libros/lote/', {'titulo': 'x'}, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_modificacion_y_baja(self):
+        otra = Categoria.objects.create(nombre='Ensayo')
+        estadisticas.reconstruir()
+        primero, segundo, tercero = self.libros
+        respuesta = self.enviar('patch', '/api/libros/lote/', [
+            {'id': primero.id, 'titulo': 'Ficciones'},
+            {'id': segundo.id, 'categoria': otra.id},
+            {'id': tercero.id, 'isbn': primero.isbn},
+            {'id': 999999, 'titulo': 'No existe'},
+            {'titulo': 'Sin id'},
+        ])
+        self.assertEqual(respuesta.status_code, 207)
+        self.assertEqual([r.get('id') for r in respuesta.json()['resultados']],
+                         [primero.id, segundo.id, None, None, None])
+        primero.refresh_from_db()
+        self.assertEqual(primero.titulo, 'Ficciones')
+        self.assertGreater(primero.ultima_actualizacion, self.libros[2].ultima_actualizacion)
+        self.assertEqual(busqueda.buscar_libros('ficciones'), [primero])
+        self.assertEqual(EstadisticaCategoria.objects.get(categoria=otra).total_libros, 1)
+        self.assertEqual(EstadisticaCategoria.objects.get(categoria=self.categoria).total_libros, 2)
+
+        respuesta = self.enviar('delete', '/api/libros/lote/', [primero.id, {'id': segundo.id}, 999999])
+        self.assertEqual(respuesta.status_code, 207)
+        self.assertEqual(list(Libro.objects.values_list('id', flat=True)), [tercero.id])
+        self.assertEqual(EstadisticaCategoria.objects.get(categoria=otra).total_libros, 0)
+
+    def test_prestamos_descuentan_stock(self):
+        libro = self.libros[0]
+        devolucion = (date.today() + timedelta(days=14)).isoformat()
+        elementos = [
+            {'libro': libro.id, 'usuario': self.usuario.id, 'fecha_devolucion_esperada': devolucion},
+            {'libro': libro.id, 'usuario': self.usuario.id, 'fecha_devolucion_esperada': devolucion},
+            {'libro': self.libros[1].id, 'usuario': self.usuario.id,
+             'fecha_devolucion_esperada': devolucion, 'estado': 'devuelto'},
+        ]
+        respuesta = self.enviar('post', '/api/prestamos/lote/', elementos)
+        self.assertEqual(respuesta.status_code, 207)
+        resultados = respuesta.json()['resultados']
+        self.assertIn('no está disponible', resultados[1]['errores']['libro'][0])
+
+        libro.refresh_from_db()
+        self.assertEqual((libro.stock_disponible, libro.estado), (0, 'prestado'))
+        self.libros[1].refresh_from_db()
+        self.assertEqual(self.libros[1].stock_disponible, 1)
+        self.assertEqual(Prestamo.objects.count(), 2)
+        self.assertEqual(EstadisticaLibro.objects.get(libro=libro).total_prestamos, 1)
+        self.assertEqual(EstadisticaAutor.objects.get(autor=self.autor).total_prestamos, 2)
+        self.assertEqual(EstadisticaDiaria.objects.get(fecha=date.today()).prestamos, 2)
+
+    def test_consultas_por_elemento_se_detectan(self):
+        instrumentacion.reiniciar()
+        # Los INSERT por bloques se repiten a propósito y no cuentan
+        with mock.patch.object(lotes, 'TAMANO_BLOQUE', 1), \
+                self.assertNoLogs('biblioteca_project.instrumentacion', 'WARNING'):
+            respuesta = self.enviar('post', '/api/libros/lote/', self.nuevos(0, 15))
+        self.assertEqual(respuesta.status_code, 201)
+
+        def validar(serializer, datos):
+            # Un N+1 en la validación de cada elemento
+            Autor.objects.filter(id=datos['autor'].id).exists()
+            return datos
+
+        with mock.patch.object(LibroSerializer, 'validate', validar), \
+                self.assertLogs('biblioteca_project.instrumentacion', 'WARNING') as registro:
+            respuesta = self.enviar('post', '/api/libros/lote/', self.nuevos(100, 15))
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertIn('14 repetidas', registro.output[0])
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_bloquea_las_filas_que_lee(self):
+        devolucion = (date.today() + timedelta(days=14)).isoformat()
+        with CaptureQueriesContext(connection) as capturadas:
+            self.enviar('patch', '/api/libros/lote/', [{'id': self.libros[0].id, 'titulo': 'Otro'}])
+            self.enviar('post', '/api/prestamos/lote/', [
+                {'libro': self.libros[1].id, 'usuario': self.usuario.id,
+                 'fecha_devolucion_esperada': devolucion, 'estado': 'devuelto'},
+            ])
+        bloqueos = [c['sql'] for c in capturadas if c['sql'].endswith('FOR UPDATE')]
+        self.assertEqual(len(bloqueos), 2 + (not connection.features.can_return_rows_from_bulk_insert))
+
+
+class SoapLotesTests(TestCase):
+    """Operaciones SOAP sobre varios libros o préstamos a la vez"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor, cls.editorial, _, cls.libros = crear_catalogo(4, stock=2)
+        cls.usuario = User.objects.create_user(username='lector', password='x')
+
+    def setUp(self):
+        self.servicio = NullServer(soap_app, ostr=False).service
+
+    def solicitud(self, libro_id, usuario_id=None, dias=14):
+        return SolicitudPrestamoModel(libro_id=libro_id, usuario_id=usuario_id or self.usuario.id,
+                                      dias_prestamo=dias)
+
+    def test_obtener_libros_en_una_consulta(self):
+        ids = [self.libros[2].id, 999999, self.libros[0].id, self.libros[2].id]
+        with self.assertNumQueries(1):
+            resultados = list(self.servicio.obtener_libros(ids))
+        self.assertEqual([r.id for r in resultados], ids)
+        self.assertEqual([r.encontrado for r in resultados], [True, False, True, True])
+        self.assertEqual(resultados[0].libro.titulo, 'Libro 002')
+        self.assertEqual(resultados[2].libro.autor.apellido, 'Borges')
+        self.assertIsNone(resultados[1].libro)
+
+    def test_crear_prestamos_lote(self):
+        libro = self.libros[0]
+        resultados = list(self.servicio.crear_prestamos_lote([
+            self.solicitud(libro.id), self.solicitud(libro.id), self.solicitud(libro.id),
+            self.solicitud(999999), self.solicitud(libro.id, usuario_id=999999),
+        ], False))
+        self.assertEqual([r.exito for r in resultados], [True, True, False, False, False])
+        self.assertIn('no está disponible', resultados[2].mensaje)
+        self.assertEqual(resultados[3].mensaje, 'Libro no encontrado')
+        self.assertEqual(resultados[4].mensaje, 'Usuario no encontrado')
+        self.assertEqual(sorted(Prestamo.objects.values_list('id', flat=True)),
+                         sorted(r.id for r in resultados[:2]))
+        libro.refresh_from_db()
+        self.assertEqual((libro.stock_disponible, libro.estado), (0, 'prestado'))
+
+        # Con atomico no se crea ninguno si alguno falla
+        resultados = list(self.servicio.crear_prestamos_lote(
+            [self.solicitud(self.libros[1].id), self.solicitud(libro.id)], True
+        ))
+        self.assertEqual([r.exito for r in resultados], [False, False])
+        self.assertEqual(Prestamo.objects.count(), 2)
+
+    def test_devolver_libros_lote(self):
+        vencido = prestar_libro(self.libros[0].id, self.usuario.id, 14)
+        Prestamo.objects.filter(id=vencido.id).update(fecha_devolucion_esperada=date.today() - timedelta(days=2))
+        prestamos = [vencido] + [prestar_libro(libro.id, self.usuario.id, 14) for libro in self.libros[:3]]
+        ids = [p.id for p in prestamos]
+
+        resultados = list(self.servicio.devolver_libros_lote(ids + [ids[1], 999999]))
+        self.assertEqual([r.exito for r in resultados], [True] * 4 + [False, False])
+        self.assertIn('Multa: $20', resultados[0].mensaje)
+        self.assertIn('ya fue devuelto', resultados[4].mensaje)
+        self.assertEqual(resultados[5].mensaje, 'Préstamo no encontrado')
+
+        self.assertEqual(Prestamo.objects.get(id=vencido.id).estado, 'vencido')
+        self.assertEqual(Prestamo.objects.filter(estado='devuelto').count(), 3)
+        self.assertEqual(list(Libro.objects.order_by('id').values_list('stock_disponible', flat=True)),
+                         [2, 2, 2, 2])
+        self.assertEqual(EstadisticaDiaria.objects.get(fecha=date.today()).devoluciones, 4)
+
+
+class ExportacionTests(TestCase):
+    """Exportación en streaming de /api/exportar/<recurso>/"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor, cls.editorial, cls.categoria, cls.libros = crear_catalogo(5)
+
+    def descargar(self, url, **cabeceras):
+        respuesta = self.client.get(url, **cabeceras)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.streaming)
+        return respuesta, b''.join(respuesta.streaming_content)
+
+    def test_ndjson_con_los_campos_del_serializer(self):
+        respuesta, cuerpo = self.descargar('/api/exportar/libros/')
+        self.assertEqual(respuesta['Content-Type'], 'application/x-ndjson')
+        self.assertNotIn('Content-Encoding', respuesta)
+        esperado = json.loads(JSONRenderer().render(LibroSerializer(self.libros, many=True).data))
+        self.assertEqual([json.loads(linea) for linea in cuerpo.decode().splitlines()], esperado)
+
+    def test_csv_por_bloques_con_gzip(self):
+        with mock.patch.object(exportacion, 'TAMANO_BLOQUE', 2), self.assertNumQueries(3):
+            respuesta, cuerpo = self.descargar('/api/exportar/libros/?formato=csv', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(respuesta['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', respuesta['Vary'])
+        filas = list(csv.reader(StringIO(gzip.decompress(cuerpo).decode())))
+        self.assertEqual(filas[0], exportacion.EXPORTACIONES['libros'].nombres)
+        self.assertEqual([int(fila[0]) for fila in filas[1:]], [libro.id for libro in self.libros])
+        self.assertEqual(filas[1][filas[0].index('autor_nombre')], 'Jorge Luis Borges')
+
+    def test_accept_encoding_con_calidades(self):
+        casos = {
+            'gzip': True, 'GZIP;q=0.5, br': True, 'br, *': True, 'x-gzip': True,
+            'gzip;q=0': False, 'gzip; q=0.0, br': False, '*;q=0.5, gzip;q=0': False,
+            'br, *;q=0': False, 'identity': False, '': False, 'gzip;q=nada': False,
+        }
+        for cabecera, esperado in casos.items():
+            with self.subTest(cabecera=cabecera):
+                peticion = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=cabecera)
+                self.assertIs(exportacion.acepta_gzip(peticion), esperado)
+
+        respuesta, cuerpo = self.descargar('/api/exportar/libros/', HTTP_ACCEPT_ENCODING='gzip;q=0, br')
+        self.assertNotIn('Content-Encoding', respuesta)
+        self.assertEqual(len(cuerpo.decode().splitlines()), len(self.libros))
+
+    def test_recursos_y_formatos(self):
+        usuario = User.objects.create_user('lector', password='x')
+        prestamo = prestar_libro(self.libros[0].id, usuario.id, 14)
+        _, cuerpo = self.descargar('/api/exportar/prestamos/')
+        self.assertEqual(json.loads(cuerpo), json.loads(JSONRenderer().render(PrestamoSerializer(prestamo).data)))
+        # Sin filas, el CSV lleva solo la cabecera
+        Prestamo.objects.all().delete()
+        _, cuerpo = self.descargar('/api/exportar/prestamos/?formato=csv')
+        self.assertEqual(cuerpo.decode().splitlines(), [','.join(exportacion.EXPORTACIONES['prestamos'].nombres)])
+
+        self.assertEqual(self.client.get('/api/exportar/usuarios/').status_code, 404)
+        self.assertEqual(self.client.get('/api/exportar/libros/?formato=xml').status_code, 400)
+        self.assertEqual(self.client.post('/api/exportar/libros/').status_code, 405)
+
+
+class CargaTests(SimpleTestCase):
+    """Generador de carga de benchmarks/carga.py"""
+
+    def test_tasa_fija_cuenta_la_cola(self):
+        class DestinoLento:
+            def enviar(self, peticion):
+                time.sleep(0.05)
+                return 200
+
+        peticiones = [{'nombre': 'GET /', 'ruta': '/', 'metodo': 'GET', 'cabeceras': {}, 'peso': 1}]
+        # Una petición cada 10 ms que tarda 50 ms: cada una sale 40 ms más
+        # tarde que la anterior respecto a su instante previsto
+        _, resultados = carga.reproducir(peticiones, DestinoLento(), concurrencia=1, duracion=10,
+                                         max_peticiones=5, tasa=100)
+        latencias = [latencia for latencia, _ in resultados['GET /']]
+        self.assertEqual(len(latencias), 5)
+        self.assertLess(latencias[0], 45 + 50)
+        self.assertGreater(latencias[-1], 50 + 4 * 35)
+        self.assertEqual(latencias, sorted(latencias))
+
+    def test_percentil(self):
+        valores = list(range(1, 101))
+        self.assertEqual(comun.percentil(valores, 50), 51)
+        self.assertEqual(comun.percentil(valores, 99), 100)
+        self.assertEqual(comun.percentil(valores, 100), 100)
+        self.assertEqual(comun.percentil([7], 95), 7)
+        resumen = carga.resumir([(10.0, False), (20.0, True), (30.0, False), (40.0, False)], 2)
+        self.assertEqual((resumen['p50_ms'], resumen['p99_ms'], resumen['por_segundo']), (30.0, 40.0, 2.0))
+        self.assertEqual(resumen['tasa_errores'], 0.25)
+
+    def test_convertir_colecciones_de_postman(self):
+        sobre = ('<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">'
+                 '<soapenv:Body><tns:crear_prestamo><tns:libro_id>1</tns:libro_id>'
+                 '</tns:crear_prestamo></soapenv:Body></soapenv:Envelope>')
+        coleccion = {'item': [
+            {'name': 'Libros', 'item': [
+                {'request': {'method': 'GET', 'url': {'raw': 'http://127.0.0.1:8000/api/libros/12/?fields=id'}}},
+                {'request': {'method': 'POST', 'url': 'http://localhost:8000/api/autores/',
+                             'body': {'mode': 'raw', 'raw': '{"nombre": "Julio"}',
+                                      'options': {'raw': {'language': 'json'}}}}},
+            ]},
+            {'request': {'method': 'POST', 'url': {'raw': 'http://localhost:8000/soap/'},
+                         'header': [{'key': 'Content-Type', 'value': 'text/xml'},
+                                    {'key': 'X-Apagada', 'value': '1', 'disabled': True}],
+                         'body': {'mode': 'raw', 'raw': sobre}}},
+        ]}
+        with tempfile.TemporaryDirectory() as directorio:
+            entrada = Path(directorio) / 'coleccion.json'
+            salida = Path(directorio) / 'traza.jsonl'
+            entrada.write_text(json.dumps(coleccion), encoding='utf-8')
+            with mock.patch('builtins.print'):
+                carga.convertir(argparse.Namespace(colecciones=[str(entrada)], salida=str(salida)))
+            traza = carga.cargar_traza(salida)
+
+        self.assertEqual([(p['nombre'], p['metodo'], p['ruta'], p['escritura']) for p in traza], [
+            ('GET /api/libros/{id}/?fields', 'GET', '/api/libros/12/?fields=id', False),
+            ('POST /api/autores/', 'POST', '/api/autores/', True),
+            ('SOAP crear_prestamo', 'POST', '/soap/', True),
+        ])
+        self.assertEqual(traza[1]['cabeceras'], {'Content-Type': 'application/json'})
+        self.assertEqual(traza[2]['cabeceras'], {'Content-Type': 'text/xml'})
+        self.assertEqual(traza[2]['cuerpo'], sobre)
+
+
+class ConfiguracionServidorTests(SimpleTestCase):
+    """Valores de gunicorn.conf.py según las variables de entorno"""
+
+    RUTA = Path(settings.BASE_DIR) / 'gunicorn.conf.py'
+
+    def configuracion(self, **entorno):
+        variables = {clave: valor for clave, valor in os.environ.items()
+                     if not clave.startswith('SERVIDOR_') and clave != 'REDIS_URL'}
+        with mock.patch.dict(os.environ, {**variables, **entorno}, clear=True):
+            return runpy.run_path(str(self.RUTA))
+
+    def test_varios_workers_necesitan_redis(self):
+        self.assertEqual(self.configuracion()['workers'], 1)
+        self.assertGreater(self.configuracion(REDIS_URL='redis://redis:6379/1')['workers'], 1)
+        self.assertEqual(self.configuracion(SERVIDOR_WORKERS='1')['workers'], 1)
+        with self.assertRaisesMessage(RuntimeError, 'REDIS_URL'):
+            self.configuracion(SERVIDOR_WORKERS='4')
+
+    def test_sin_preload_hup_carga_el_codigo_nuevo(self):
+        self.assertFalse(self.configuracion()['preload_app'])
+        self.assertTrue(self.configuracion(SERVIDOR_PRELOAD='1')['preload_app'])
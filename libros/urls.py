@@ -13,6 +13,8 @@ router.register(r'prestamos', views.PrestamoViewSet)
 urlpatterns = [
     # API REST
     path('', include(router.urls)),
+    path('autocomplete/', views.autocompletado, name='autocompletado'),
+    path('exportar/<str:recurso>/', views.exportar, name='exportar'),
     
     # Vistas tradicionales
     path('index/', views.index, name='index'),
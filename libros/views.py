@@ -1,13 +1,29 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
 from django.core.paginator import Paginator
-from django.db.models import Q, Count
+from django.db import router
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_GET
 from rest_framework import viewsets, filters
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticatedOrReadOnly
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from django_filters.rest_framework import DjangoFilterBackend
 from datetime import date, timedelta
 
+from . import condicional, exportacion, lotes, relaciones
+from .autocompletado import LIMITE_POR_DEFECTO as LIMITE_AUTOCOMPLETADO, autocompletar
+from .busqueda import BusquedaLibrosFilter, buscar_libros
+from .cache import lista_autores, lista_categorias, totales_panel
+from .estadisticas import libros_por_categoria, prestamos_por_dia, top_autores, top_libros
 from .models import Libro, Autor, Categoria, Editorial, Prestamo
+from .paginacion import KeysetPagination
+from .prestamos import LibroNoDisponible, prestar_libro
+from .renderizadores import NDJSONParser
 from .serializers import (
     LibroSerializer, AutorSerializer, CategoriaSerializer,
     EditorialSerializer, PrestamoSerializer
@@ -15,18 +31,110 @@ from .serializers import (
 
 # ========== VIEWSETS REST API ==========
 
-class LibroViewSet(viewsets.ModelViewSet):
+class ConsultaAjustadaMixin:
+    """
+    En lecturas el queryset carga solo las columnas y JOIN que usa el
+    serializer de esta petición (?fields=, ?expand=; ver serializers.py)
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request is None or self.request.method not in SAFE_METHODS:
+            return queryset
+        serializer = self.get_serializer()
+        unir, precargar = relaciones.relaciones_serializer(serializer)
+        queryset = queryset.select_related(None)
+        if unir:
+            queryset = queryset.select_related(*unir)
+        _, ya_precargadas, _ = relaciones.relaciones_queryset(queryset)
+        if precargar - ya_precargadas:
+            queryset = queryset.prefetch_related(*(precargar - ya_precargadas))
+        columnas = relaciones.columnas_serializer(serializer)
+        return queryset.only(*columnas) if columnas else queryset
+
+class LoteMixin:
+    """
+    POST (altas), PATCH (cambios, cada elemento con su id) y DELETE (bajas,
+    una lista de id) en /lote/ con una lista JSON o NDJSON de elementos.
+    Responde el resultado de cada elemento por su índice; con ?atomico=1 no
+    se guarda nada si alguno falla. Ver lotes.py.
+    """
+    lote_class = None
+
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_path='lote',
+            parser_classes=[*api_settings.DEFAULT_PARSER_CLASSES, NDJSONParser])
+    def lote(self, request):
+        elementos = request.data
+        if not isinstance(elementos, list):
+            raise ValidationError({'non_field_errors': ['Se esperaba una lista de elementos']})
+        if len(elementos) > lotes.MAXIMO_ELEMENTOS:
+            raise ValidationError({'non_field_errors': [
+                f'Como máximo {lotes.MAXIMO_ELEMENTOS} elementos por petición'
+            ]})
+        operaciones = self.lote_class(
+            self.get_serializer_context(),
+            atomico=request.query_params.get('atomico') in ('1', 'true'),
+        )
+        if request.method == 'POST':
+            resultado = operaciones.crear(elementos)
+        elif request.method == 'PATCH':
+            resultado = operaciones.actualizar(elementos)
+        else:
+            resultado = operaciones.eliminar(elementos)
+        return Response(resultado.datos(), status=resultado.codigo(creacion=request.method == 'POST'))
+
+class LibroViewSet(LoteMixin, ConsultaAjustadaMixin, viewsets.ModelViewSet):
     """ViewSet para gestión de libros via API REST"""
-    queryset = Libro.objects.all()
+    # Las JOIN que necesita el serializer (comprobadas por relaciones.py)
+    queryset = Libro.objects.select_related('autor', 'categoria', 'editorial')
     serializer_class = LibroSerializer
     # permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # ?search= usa el índice de búsqueda (título, ISBN y autor)
+    filter_backends = [DjangoFilterBackend, BusquedaLibrosFilter, filters.OrderingFilter]
     filterset_fields = ['categoria', 'autor', 'editorial', 'estado']
-    search_fields = ['titulo', 'isbn', 'autor__nombre', 'autor__apellido']
     ordering_fields = ['titulo', 'fecha_publicacion', 'stock_disponible']
     ordering = ['titulo']
+    pagination_class = KeysetPagination
+    lote_class = lotes.LoteLibros
+
+    # GET condicional (ver condicional.py): el detalle calcula el ETag con
+    # una consulta de ultima_actualizacion; el listado lo calcula con las
+    # filas de la página, que se leen una sola vez y son las que se
+    # serializan si no hay 304
 
-class AutorViewSet(viewsets.ModelViewSet):
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        # Con only() (?fields=) ultima_actualizacion también hace falta para el ETag
+        inmediatos, diferidos = queryset.query.deferred_loading
+        if inmediatos and not diferidos:
+            queryset = queryset.only(*inmediatos, 'ultima_actualizacion')
+        libros = self.paginate_queryset(queryset)
+        # La página cambia si cambian sus filas o aparece o desaparece la siguiente
+        valor_etag = condicional.etag_filas(
+            [(libro.id, libro.ultima_actualizacion) for libro in libros],
+            self.paginator.tiene_siguiente, request.get_full_path(), request.accepted_renderer.format,
+        )
+        return condicional.responder(
+            request, lambda: self.get_paginated_response(self.get_serializer(libros, many=True).data),
+            valor_etag,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            ultima_actualizacion = self.get_queryset().filter(pk=kwargs['pk']).values_list(
+                'ultima_actualizacion', flat=True
+            ).first()
+        except (TypeError, ValueError):
+            ultima_actualizacion = None
+        if ultima_actualizacion is None:
+            return super().retrieve(request, *args, **kwargs)  # 404
+        valor_etag = condicional.etag_libro(ultima_actualizacion, request.accepted_renderer.format)
+        return condicional.responder(
+            request, lambda: super(LibroViewSet, self).retrieve(request, *args, **kwargs),
+            valor_etag, ultima_actualizacion,
+        )
+
+class AutorViewSet(ConsultaAjustadaMixin, viewsets.ModelViewSet):
     """ViewSet para gestión de autores"""
     queryset = Autor.objects.all()
     serializer_class = AutorSerializer
@@ -35,39 +143,100 @@ class AutorViewSet(viewsets.ModelViewSet):
     search_fields = ['nombre', 'apellido', 'nacionalidad']
     ordering_fields = ['nombre', 'apellido']
     ordering = ['apellido']
+    pagination_class = KeysetPagination
 
-class CategoriaViewSet(viewsets.ModelViewSet):
+class CategoriaViewSet(ConsultaAjustadaMixin, viewsets.ModelViewSet):
     """ViewSet para gestión de categorías"""
     queryset = Categoria.objects.all()
     serializer_class = CategoriaSerializer
     # permission_classes = [IsAuthenticatedOrReadOnly]
 
-class EditorialViewSet(viewsets.ModelViewSet):
+class EditorialViewSet(ConsultaAjustadaMixin, viewsets.ModelViewSet):
     """ViewSet para gestión de editoriales"""
     queryset = Editorial.objects.all()
     serializer_class = EditorialSerializer
     # permission_classes = [IsAuthenticatedOrReadOnly]
 
-class PrestamoViewSet(viewsets.ModelViewSet):
+class PrestamoViewSet(LoteMixin, ConsultaAjustadaMixin, viewsets.ModelViewSet):
     """ViewSet para gestión de préstamos"""
-    queryset = Prestamo.objects.all()
+    queryset = Prestamo.objects.select_related('libro', 'usuario')
     serializer_class = PrestamoSerializer
     # permission_classes = [IsAuthenticatedOrReadOnly]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['estado', 'usuario', 'libro']
     ordering_fields = ['fecha_prestamo', 'fecha_devolucion_esperada']
     ordering = ['-fecha_prestamo']
+    pagination_class = KeysetPagination
+    lote_class = lotes.LotePrestamos
+
+    def perform_create(self, serializer):
+        """Los préstamos activos pasan por el servicio para descontar stock"""
+        datos = serializer.validated_data
+        if datos.get('estado', 'activo') != 'activo':
+            serializer.save()
+            return
+        
+        dias = (datos['fecha_devolucion_esperada'] - date.today()).days
+        try:
+            serializer.instance = prestar_libro(
+                datos['libro'].id, datos['usuario'].id, dias,
+                notas=datos.get('notas', ''), verificar_usuario=False
+            )
+        except LibroNoDisponible as e:
+            raise ValidationError({'libro': str(e)})
+
+@api_view(['GET'])
+def autocompletado(request):
+    """
+    Sugerencias por prefijo de títulos, autores y categorías.
+    GET /api/autocomplete/?q=cien&limite=10&tipo=libro
+    """
+    try:
+        limite = max(1, int(request.query_params.get('limite', LIMITE_AUTOCOMPLETADO)))
+    except ValueError:
+        limite = LIMITE_AUTOCOMPLETADO
+    tipos = request.query_params.getlist('tipo') or None
+    return Response({
+        'results': autocompletar(request.query_params.get('q', ''), limite, tipos),
+    })
+
+@require_GET
+def exportar(request, recurso):
+    """
+    Todos los libros, autores o préstamos en una sola respuesta, generada
+    según se envía: GET /api/exportar/libros/?formato=csv (ndjson por
+    defecto), comprimida con gzip si el cliente la acepta. Ver exportacion.py.
+    """
+    if recurso not in exportacion.EXPORTACIONES:
+        raise Http404
+    formato = request.GET.get('formato', 'ndjson')
+    if formato not in exportacion.FORMATOS:
+        return HttpResponseBadRequest(f'Formato no soportado: use {" o ".join(exportacion.FORMATOS)}')
+    tipo, extension = exportacion.FORMATOS[formato]
+    gzip = exportacion.acepta_gzip(request)
+    # El router decide réplica o primario (cookie de lectura de lo escrito)
+    # ahora: al generar la respuesta el middleware ya ha restaurado su estado
+    using = router.db_for_read(exportacion.EXPORTACIONES[recurso].modelo)
+    partes = exportacion.contenido(recurso, formato, gzip, using=using)
+    if isinstance(request, ASGIRequest):
+        partes = exportacion.asincrono(partes)
+    response = StreamingHttpResponse(partes, content_type=tipo)
+    response['Content-Disposition'] = f'attachment; filename="{recurso}.{extension}"'
+    if gzip:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
 
 # ========== VISTAS TRADICIONALES ==========
 
 def index(request):
     """Página de inicio de la app libros"""
-    from django.contrib.auth.models import User
+    totales = totales_panel()
     context = {
-        'total_libros': Libro.objects.count(),
-        'total_autores': Autor.objects.count(),
-        'prestamos_activos': Prestamo.objects.filter(estado='activo').count(),
-        'total_usuarios': User.objects.count(),
+        'total_libros': totales['total_libros'],
+        'total_autores': totales['total_autores'],
+        'prestamos_activos': totales['prestamos_activos'],
+        'total_usuarios': totales['total_usuarios'],
     }
     return render(request, 'libros/index.html', context)
 
@@ -96,20 +265,29 @@ def catalogo(request):
     
     context = {
         'libros': libros,
-        'total_libros': Libro.objects.count(),
-        'categorias': Categoria.objects.all(),
-        'autores': Autor.objects.all(),
+        'total_libros': totales_panel()['total_libros'],
+        'categorias': lista_categorias(),
+        'autores': lista_autores(),
     }
     return render(request, 'libros/catalogo.html', context)
 
 def detalle_libro(request, libro_id):
     """Vista de detalle de un libro"""
-    libro = get_object_or_404(
-        Libro.objects.select_related('autor', 'categoria', 'editorial'),
-        id=libro_id
+    ultima_actualizacion = get_object_or_404(
+        Libro.objects.values_list('ultima_actualizacion', flat=True), id=libro_id
     )
-    context = {'libro': libro}
-    return render(request, 'libros/detalle_libro.html', context)
+
+    def generar():
+        libro = get_object_or_404(
+            Libro.objects.select_related('autor', 'categoria', 'editorial'),
+            id=libro_id
+        )
+        context = {'libro': libro}
+        return render(request, 'libros/detalle_libro.html', context)
+
+    # La página muestra acciones distintas según haya sesión iniciada
+    valor_etag = condicional.etag_libro(ultima_actualizacion, request.user.is_authenticated)
+    return condicional.responder(request, generar, valor_etag, ultima_actualizacion, privada=True)
 
 def busqueda(request):
     """Vista de búsqueda de libros"""
@@ -117,73 +295,63 @@ def busqueda(request):
     resultados = []
     
     if query:
-        resultados = Libro.objects.filter(
-            Q(titulo__icontains=query) |
-            Q(isbn__icontains=query) |
-            Q(autor__nombre__icontains=query) |
-            Q(autor__apellido__icontains=query)
-        ).select_related('autor', 'categoria')[:50]
+        # Los 50 más relevantes según el índice de búsqueda
+        resultados = buscar_libros(
+            query, limite=50,
+            queryset=Libro.objects.select_related('autor', 'categoria')
+        )
     
     context = {
         'query': query,
         'resultados': resultados,
-        'categorias': Categoria.objects.all(),
-        'autores': Autor.objects.all(),
+        'categorias': lista_categorias(),
+        'autores': lista_autores(),
     }
     return render(request, 'libros/busqueda.html', context)
 
+# Ventanas (en días) permitidas para el histograma de préstamos
+VENTANAS_ESTADISTICAS = (7, 30, 90, 365)
+VENTANA_POR_DEFECTO = 30
+
 def estadisticas(request):
-    """Vista de estadísticas del sistema"""
-    from django.contrib.auth.models import User
+    """Vista de estadísticas del sistema (lee las estadísticas precalculadas)"""
     import json
-    from datetime import timedelta
     
-    # Libros por categoría
-    libros_por_categoria = Categoria.objects.annotate(
-        total=Count('libros')
-    ).order_by('-total')
+    try:
+        dias = int(request.GET.get('dias', VENTANA_POR_DEFECTO))
+    except ValueError:
+        dias = VENTANA_POR_DEFECTO
+    if dias not in VENTANAS_ESTADISTICAS:
+        dias = VENTANA_POR_DEFECTO
+    
+    # Libros por categoría (una consulta, reutilizada para el gráfico)
+    categorias = list(libros_por_categoria())
     
     # Datos para gráfico de categorías (convertir a listas de Python)
-    categorias_labels = list(libros_por_categoria.values_list('nombre', flat=True))
-    categorias_data = list(libros_por_categoria.values_list('total', flat=True))
-    
-    # Préstamos del último mes (por día)
-    hoy = date.today()
-    hace_30_dias = hoy - timedelta(days=30)
-    
-    prestamos_labels = []
-    prestamos_data = []
-    for i in range(30):
-        dia = hace_30_dias + timedelta(days=i)
-        prestamos_del_dia = Prestamo.objects.filter(
-            fecha_prestamo=dia
-        ).count()
-        prestamos_labels.append(dia.strftime('%d/%m'))
-        prestamos_data.append(prestamos_del_dia)
-    
-    # Autores más prestados
-    autores_prestados = Autor.objects.annotate(
-        total_prestamos=Count('libros__prestamos')
-    ).order_by('-total_prestamos')[:10]
-    
-    # Libros más populares
-    libros_populares = Libro.objects.annotate(
-        total_prestamos=Count('prestamos')
-    ).order_by('-total_prestamos')[:10]
+    categorias_labels = [categoria.nombre for categoria in categorias]
+    categorias_data = [categoria.total for categoria in categorias]
+    
+    # Préstamos por día en la ventana elegida
+    prestamos_labels, prestamos_data = prestamos_por_dia(dias, date.today())
+    
+    totales = totales_panel()
     
     context = {
-        'total_libros': Libro.objects.count(),
-        'prestamos_activos': Prestamo.objects.filter(estado='activo').count(),
-        'total_usuarios': User.objects.count(),
-        'libros_disponibles': Libro.objects.filter(stock_disponible__gt=0).count(),
-        'libros_por_categoria': libros_por_categoria,
+        'total_libros': totales['total_libros'],
+        'prestamos_activos': totales['prestamos_activos'],
+        'total_usuarios': totales['total_usuarios'],
+        'libros_disponibles': totales['libros_disponibles'],
+        'libros_por_categoria': categorias,
         # Convertir a JSON para JavaScript (usar json.dumps)
         'categorias_labels': json.dumps(categorias_labels),
         'categorias_data': json.dumps(categorias_data),
         'prestamos_labels': json.dumps(prestamos_labels),
         'prestamos_data': json.dumps(prestamos_data),
-        'top_autores': autores_prestados,
-        'top_libros': libros_populares,
+        'dias': dias,
+        'ventanas': VENTANAS_ESTADISTICAS,
+        # Autores y libros más prestados
+        'top_autores': top_autores(),
+        'top_libros': top_libros(),
     }
     return render(request, 'libros/estadisticas.html', context)
 
@@ -212,21 +380,13 @@ def solicitar_prestamo(request, libro_id):
     
     if request.method == 'POST':
         dias = int(request.POST.get('dias', 14))
-        fecha_devolucion = date.today() + timedelta(days=dias)
         
-        if libro.stock_disponible > 0:
-            prestamo = Prestamo.objects.create(
-                libro=libro,
-                usuario=request.user,
-                fecha_devolucion_esperada=fecha_devolucion,
-                estado='activo'
-            )
-            
-            # Reducir stock
-            libro.stock_disponible -= 1
-            libro.save()
-            
+        try:
+            prestar_libro(libro.id, request.user.id, dias, verificar_usuario=False)
             return redirect('mi_cuenta')
+        except LibroNoDisponible:
+            # Otro usuario se llevó el último ejemplar: mostrar stock actual
+            libro.refresh_from_db()
     
     context = {'libro': libro}
     return render(request, 'libros/solicitar_prestamo.html', context)